@@ -0,0 +1,298 @@
+"""Benchmark và kiểm tra hồi quy cho các hàm extract plan card, chạy hoàn toàn offline.
+
+Corpus nằm ở bench_fixtures/cards.json (card MA, PDP, Medicare Supplement, SNP và
+card skeleton); card được đưa vào extractor qua CardSnapshot nên không cần browser.
+Mỗi card có giá trị đúng (`expected`, ghi tay) để đo độ chính xác theo field, còn
+output hiện tại của từng extractor được chốt ở bench_fixtures/golden_<extractor>.json
+để bắt hồi quy khi sửa rule table.
+
+    python bench_extractors.py                  # đo tốc độ, độ chính xác + so với golden
+    python bench_extractors.py --scale 5000     # đo trên 5000 card tổng hợp từ corpus
+    python bench_extractors.py --check          # exit 1 nếu lệch golden
+    python bench_extractors.py --update-golden  # ghi lại golden sau khi sửa rule có chủ đích
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+from card_snapshot import CardSnapshot
+from crawl_metrics import configure_logging
+from extraction_rules import (
+    BENEFITS_KEYWORDS,
+    HTML_EXTRACTOR_RULES,
+    HTML_PLAN_TYPE_CLASSES,
+    TEXT_EXTRACTOR_RULES,
+    TEXT_PLAN_TYPE_KEYWORDS,
+    classify_plan_type,
+    find_benefit_phrases,
+    new_plan_info,
+    scan_fields,
+)
+from plan_extractors import extract_plan_info_from_html, extract_plan_info_from_text, extract_plans_from_cards
+from plan_record import PlanRecord
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_fixtures")
+
+EXTRACTORS = {
+    "html": extract_plan_info_from_html,
+    "text": extract_plan_info_from_text,
+}
+
+PLAN_FIELDS = list(new_plan_info(""))
+# Các field có giá trị đúng ghi tay trong cards.json
+ACCURACY_FIELDS = ["plan_name", "plan_type", "monthly_premium", "pcp_copay", "specialist_copay", "emergency_copay",
+                   "inpatient_hospital", "out_of_pocket_max", "deductible", "tier1_generic_copay"]
+
+_MONEY = re.compile(r'\$(\d[\d,]*(?:\.\d{2})?)')
+_PLAN_NUMBER = re.compile(r'\bPlan (\d+|[A-Z])\b')
+
+
+def load_corpus(path=None):
+    """Đọc corpus fixture, trả về list (zip_code, category, CardSnapshot, expected)"""
+    with open(path or os.path.join(FIXTURES_DIR, "cards.json"), encoding="utf-8") as f:
+        raw_cards = json.load(f)
+    return [(raw["zip_code"], raw["category"], CardSnapshot.from_dict(raw), raw.get("expected"))
+            for raw in raw_cards]
+
+
+def synthesize_cards(corpus, count, seed=0):
+    """Nhân corpus thành `count` card: đổi số tiền, số plan và id.
+
+    Text, HTML và giá trị `expected` được đổi cùng một cách nên vẫn đo được độ chính xác.
+    """
+    rng = random.Random(seed)
+    cards = []
+    for i in range(count):
+        zip_code, category, card, expected = corpus[i % len(corpus)]
+        amounts = {}
+
+        def new_amount(match):
+            value = match.group(1)
+            if value not in amounts:
+                amount = rng.randint(0, 9000) if "," in value else rng.randint(0, 400)
+                cents = f".{rng.randint(0, 99):02d}" if "." in value else ""
+                amounts[value] = f"${amount:,}{cents}"
+            return amounts[value]
+
+        def rewrite(s):
+            s = _MONEY.sub(new_amount, s)
+            return _PLAN_NUMBER.sub(f"Plan {i}", s)
+
+        attrs = {name: (f"{value}-{i}" if "id" in name else value) for name, value in card.attrs.items()}
+        snapshot = CardSnapshot(rewrite(card.text), rewrite(card.html), attrs, card.tag)
+        if expected is not None:
+            expected = {field: rewrite(value) for field, value in expected.items()}
+        cards.append((f"{int(zip_code) + i % 1000:05d}", category, snapshot, expected))
+    return cards
+
+
+def run_extractor(extractor, cards):
+    """Chạy extractor qua extract_plans_from_cards, mỗi card một kết quả (None nếu bị bỏ)"""
+    results = []
+    for zip_code, _, card, _ in cards:
+        plans = extract_plans_from_cards([card], zip_code, extractor=extractor)
+        results.append(plans[0] if plans else None)
+    return results
+
+
+def measure_throughput(extractor, cards, repeat=3):
+    """Số card/giây, lấy lần chạy nhanh nhất trong `repeat` lần"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run_extractor(extractor, cards)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return len(cards) / best if best else float("inf"), best
+
+
+def measure_field_timings(name, cards):
+    """Thời gian trung bình (µs/card) của từng field / bước trong extractor.
+
+    Mỗi field được quét riêng nên phải tự dựng keyword gate; tổng các field vì vậy
+    lớn hơn một chút so với một lượt scan_fields đầy đủ.
+    """
+    if name == "html":
+        rules, plan_types = HTML_EXTRACTOR_RULES, HTML_PLAN_TYPE_CLASSES
+    else:
+        rules, plan_types = TEXT_EXTRACTOR_RULES, TEXT_PLAN_TYPE_KEYWORDS
+    totals = {field: 0.0 for field, _ in rules}
+    totals["plan_type"] = totals["services_benefits"] = 0.0
+    perf_counter = time.perf_counter
+    for _, _, card, _ in cards:
+        text, html = card.inner_text(), card.inner_html()
+        text_lower = text.lower()
+        for field, field_rules in rules:
+            started = perf_counter()
+            scan_fields([(field, field_rules)], text, html, text_lower=text_lower)
+            totals[field] += perf_counter() - started
+
+        started = perf_counter()
+        classify_plan_type(html if name == "html" else text_lower, plan_types)
+        totals["plan_type"] += perf_counter() - started
+
+        started = perf_counter()
+        if name == "html":
+            [word for word in BENEFITS_KEYWORDS if word in text_lower]
+        else:
+            find_benefit_phrases(text)
+        totals["services_benefits"] += perf_counter() - started
+    return {field: seconds * 1e6 / len(cards) for field, seconds in totals.items()}
+
+
+def measure_allocations(extractor, cards):
+    """Bộ nhớ đỉnh và số block còn giữ lại (kết quả) sau một lượt extract"""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        results = run_extractor(extractor, cards)
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    retained = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    del results
+    return {"peak_bytes_per_card": peak / len(cards), "retained_blocks_per_card": retained / len(cards)}
+
+
+def measure_record_memory(plans):
+    """Byte/plan khi giữ plan dạng dict so với PlanRecord, và số plan không round-trip đúng về dict"""
+    plans = [plan for plan in plans if plan]
+    if not plans:
+        return {"dict_bytes_per_plan": 0, "record_bytes_per_plan": 0, "roundtrip_failures": 0}
+    sizes = {}
+    for kind, build in (("dict", lambda plan: {k: "".join(v) for k, v in plan.items()}),
+                        ("record", PlanRecord.from_dict)):
+        tracemalloc.start()
+        try:
+            kept = [build(plan) for plan in plans]
+            sizes[kind] = tracemalloc.get_traced_memory()[0] / len(plans)
+        finally:
+            tracemalloc.stop()
+        del kept
+    failures = sum(PlanRecord.from_dict(plan).to_dict() != plan for plan in plans)
+    return {"dict_bytes_per_plan": sizes["dict"], "record_bytes_per_plan": sizes["record"],
+            "roundtrip_failures": failures}
+
+
+def golden_path(name, fixtures_dir=FIXTURES_DIR):
+    return os.path.join(fixtures_dir, f"golden_{name}.json")
+
+
+def compare_plans(results, references, fields=PLAN_FIELDS):
+    """Tỉ lệ đúng theo field và danh sách chỗ lệch (index, field, mong đợi, thực tế).
+
+    Reference None nghĩa là card phải bị bỏ qua; chỉ so các field có trong reference.
+    """
+    correct = {field: 0 for field in fields}
+    checked = {field: 0 for field in fields}
+    mismatches = []
+    for index, (result, expected) in enumerate(zip(results, references)):
+        if result is None or expected is None:
+            if result is not expected:
+                mismatches.append((index, "<card>", expected, result))
+            for field in fields:
+                checked[field] += 1
+                correct[field] += result is expected
+            continue
+        for field in fields:
+            if field not in expected:
+                continue
+            checked[field] += 1
+            if result.get(field) == expected[field]:
+                correct[field] += 1
+            else:
+                mismatches.append((index, field, expected[field], result.get(field)))
+    if len(results) != len(references):
+        mismatches.append((min(len(results), len(references)), "<corpus>", len(references), len(results)))
+    accuracy = {field: correct[field] / checked[field] for field in fields if checked[field]}
+    return accuracy, mismatches
+
+
+def _sorted_benefits(plan):
+    """Golden lưu services_benefits đã sort để không phụ thuộc thứ tự keyword"""
+    if plan and plan.get("services_benefits"):
+        plan = dict(plan, services_benefits=" | ".join(sorted(plan["services_benefits"].split(" | "))))
+    return plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark extractor plan card trên corpus fixture (offline)")
+    parser.add_argument("--extractor", choices=[*EXTRACTORS, "all"], default="all")
+    parser.add_argument("--scale", type=int, default=0, metavar="N",
+                        help="Đo trên N card tổng hợp thay vì corpus gốc")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần chạy, lấy lần nhanh nhất (mặc định 3)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="Thư mục chứa cards.json và golden_*.json")
+    parser.add_argument("--check", action="store_true", help="Exit 1 nếu có field lệch golden")
+    parser.add_argument("--update-golden", action="store_true", help="Ghi output hiện tại làm golden")
+    args = parser.parse_args()
+    # Log từng card của extractor sẽ làm sai số đo
+    configure_logging("off")
+
+    corpus = load_corpus(os.path.join(args.fixtures, "cards.json"))
+    bench_cards = synthesize_cards(corpus, args.scale, args.seed) if args.scale else corpus
+    names = list(EXTRACTORS) if args.extractor == "all" else [args.extractor]
+    print(f"📦 Corpus: {len(corpus)} card fixture, đo trên {len(bench_cards)} card")
+
+    failed = False
+    for name in names:
+        extractor = EXTRACTORS[name]
+        results = [_sorted_benefits(plan) for plan in run_extractor(extractor, corpus)]
+
+        if args.update_golden:
+            with open(golden_path(name, args.fixtures), "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+                f.write("\n")
+            print(f"💾 Đã ghi golden cho extractor '{name}' ({len(results)} card)")
+            continue
+
+        cards_per_second, best = measure_throughput(extractor, bench_cards, args.repeat)
+        field_timings = measure_field_timings(name, bench_cards)
+        allocations = measure_allocations(extractor, bench_cards)
+
+        bench_results = run_extractor(extractor, bench_cards)
+        accuracy, _ = compare_plans(bench_results, [expected for *_, expected in bench_cards], ACCURACY_FIELDS)
+
+        print(f"\n⚡ Extractor '{name}': {cards_per_second:,.0f} card/s ({best * 1000:.1f} ms cho {len(bench_cards)} card)")
+        print(f"   Bộ nhớ đỉnh: {allocations['peak_bytes_per_card']:,.0f} B/card, "
+              f"block giữ lại: {allocations['retained_blocks_per_card']:.1f}/card")
+        print(f"   {'Field':<22} {'µs/card':>8} {'Đúng':>7}")
+        for field, micros in sorted(field_timings.items(), key=lambda item: -item[1]):
+            correct = f"{accuracy[field]:.0%}" if field in accuracy else "-"
+            print(f"   {field:<22} {micros:8.1f} {correct:>7}")
+        print(f"   Độ chính xác trung bình: {sum(accuracy.values()) / len(accuracy):.1%}")
+        record_memory = measure_record_memory(bench_results)
+        print(f"   Giữ kết quả: dict {record_memory['dict_bytes_per_plan']:,.0f} B/plan, "
+              f"PlanRecord {record_memory['record_bytes_per_plan']:,.0f} B/plan")
+        if record_memory["roundtrip_failures"]:
+            failed = True
+            print(f"   ❌ {record_memory['roundtrip_failures']} plan không chuyển PlanRecord -> CSV đúng như cũ")
+
+        path = golden_path(name, args.fixtures)
+        if not os.path.exists(path):
+            print(f"   ⚠ Chưa có golden ({path}), chạy --update-golden để tạo")
+            continue
+        with open(path, encoding="utf-8") as f:
+            golden = json.load(f)
+        _, mismatches = compare_plans(results, golden)
+        if not mismatches:
+            print("   ✅ Khớp golden")
+            continue
+        failed = True
+        print(f"   ❌ {len(mismatches)} chỗ lệch golden:")
+        for index, field, expected, actual in mismatches[:20]:
+            category = corpus[index][1] if index < len(corpus) else "?"
+            print(f"     ✗ card {index} [{category}] {field}: {expected!r} -> {actual!r}")
+
+    if args.check and failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Quản lý browser cho crawl: khởi động headless, pool context dựng sẵn, lưu storage state.
+
+- Chromium chạy headless mặc định (khởi động nhanh, ít RAM hơn bản có cửa sổ).
+- Cookie / localStorage (consent, popup đã đóng...) được lưu ra `storage_state` và nạp
+  lại cho mọi context, nên popup đã đóng ở lần chạy trước không bật lại.
+- Mỗi worker giữ một slot (context + page) được dựng sẵn song song trước khi crawl.
+- Slot được thay bằng context mới sau `recycle_after` ZIP, hoặc khi RSS của cả cây
+  process (python + driver + Chromium) vượt `max_rss_mb`, để bộ nhớ không tăng dần
+  trong các run dài. Storage state được lưu trước khi đóng context cũ.
+"""
+import asyncio
+import os
+from collections import Counter
+
+from crawl_metrics import log
+
+# Tắt các phần Chromium không cần cho crawl để khởi động và chạy nhẹ hơn
+DEFAULT_LAUNCH_ARGS = [
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-dev-shm-usage",
+    "--no-first-run",
+]
+
+
+def process_tree_rss_mb(pid=None):
+    """Tổng RSS (MB) của process `pid` và mọi process con; None nếu không đo được"""
+    pid = pid or os.getpid()
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        try:
+            root = psutil.Process(pid)
+            return sum(p.memory_info().rss for p in [root] + root.children(recursive=True)) / 1_048_576
+        except psutil.Error:
+            return None
+
+    # Không có psutil: đọc /proc (Linux)
+    if not os.path.isdir("/proc"):
+        return None
+    children = {}
+    rss_kb = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/status", encoding="utf-8") as f:
+                fields = dict(line.split(":", 1) for line in f if ":" in line)
+        except OSError:
+            continue
+        child = int(entry)
+        children.setdefault(int(fields.get("PPid", "0").strip()), []).append(child)
+        rss_kb[child] = int(fields.get("VmRSS", "0 kB").split()[0])
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        total += rss_kb.get(current, 0)
+        stack.extend(children.get(current, ()))
+    return total / 1024
+
+
+async def launch_browser(playwright, headless=True, launch_args=None):
+    return await playwright.chromium.launch(
+        headless=headless, args=DEFAULT_LAUNCH_ARGS if launch_args is None else launch_args)
+
+
+class ContextSlot:
+    """Context + page của một worker, cùng số ZIP đã chạy trên nó"""
+
+    __slots__ = ("index", "generation", "context", "page", "zips")
+
+    def __init__(self, index):
+        self.index = index
+        self.generation = 0
+        self.context = None
+        self.page = None
+        self.zips = 0
+
+
+class BrowserSession:
+    """Pool context dựng sẵn trên một browser, có lưu/nạp storage state và recycle.
+
+    `context_options`: tham số chung cho browser.new_context. `setup_context(context)`:
+    coroutine gọi cho mỗi context mới (route policy, HAR replay...). `har_dir`: ghi HAR
+    của từng context vào thư mục này.
+    """
+
+    def __init__(self, browser, pool_size=1, context_options=None, setup_context=None, storage_state_path=None,
+                 har_dir=None, recycle_after=None, max_rss_mb=None):
+        self.browser = browser
+        self.pool_size = pool_size
+        self.context_options = dict(context_options or {})
+        self.setup_context = setup_context
+        self.storage_state_path = storage_state_path
+        self.har_dir = har_dir
+        self.recycle_after = recycle_after
+        self.max_rss_mb = max_rss_mb
+        self.slots = []
+        self.recycles = Counter()
+        self._state_saved = False
+
+    async def start(self):
+        """Dựng sẵn mọi slot song song"""
+        self.slots = [ContextSlot(i) for i in range(self.pool_size)]
+        await asyncio.gather(*(self._open(slot) for slot in self.slots))
+        return self.slots
+
+    async def _open(self, slot):
+        options = dict(self.context_options)
+        if self.har_dir is not None:
+            os.makedirs(self.har_dir, exist_ok=True)
+            suffix = f"-{slot.generation}" if slot.generation else ""
+            options["record_har_path"] = os.path.join(self.har_dir, f"worker-{slot.index}{suffix}.har")
+        if self.storage_state_path and os.path.exists(self.storage_state_path):
+            try:
+                slot.context = await self.browser.new_context(storage_state=self.storage_state_path, **options)
+            except Exception as e:
+                log.warning(f"⚠ Không nạp được storage state {self.storage_state_path}: {e}")
+                slot.context = await self.browser.new_context(**options)
+        else:
+            slot.context = await self.browser.new_context(**options)
+        if self.setup_context is not None:
+            await self.setup_context(slot.context)
+        slot.page = await slot.context.new_page()
+        slot.zips = 0
+
+    def _recycle_reason(self, slot):
+        if self.recycle_after and slot.zips >= self.recycle_after:
+            return "zip_count"
+        if self.max_rss_mb and slot.zips:
+            rss = process_tree_rss_mb()
+            if rss is not None and rss > self.max_rss_mb:
+                return "rss"
+        return None
+
+    async def prepare(self, slot):
+        """Gọi trước mỗi ZIP: thay context nếu cần; True nếu slot vừa được thay (page mới)"""
+        reason = self._recycle_reason(slot)
+        if reason is None:
+            return False
+        log.info(f"♻ Thay context của worker {slot.index} sau {slot.zips} ZIP ({reason})")
+        await self.save_storage_state(slot.context)
+        await slot.context.close()
+        slot.generation += 1
+        await self._open(slot)
+        self.recycles[reason] += 1
+        return True
+
+    async def zip_done(self, slot):
+        """Gọi sau mỗi ZIP; ZIP đầu tiên xong thì lưu storage state (consent, popup đã đóng)"""
+        slot.zips += 1
+        if not self._state_saved:
+            await self.save_storage_state(slot.context)
+
+    async def save_storage_state(self, context):
+        if not self.storage_state_path or context is None:
+            return
+        tmp_path = f"{self.storage_state_path}.{id(context)}.part"
+        try:
+            await context.storage_state(path=tmp_path)
+            os.replace(tmp_path, self.storage_state_path)
+            self._state_saved = True
+        except Exception as e:
+            log.warning(f"⚠ Không lưu được storage state: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def close(self):
+        """Lưu storage state mới nhất, đóng mọi context và browser"""
+        if self.slots:
+            await self.save_storage_state(self.slots[0].context)
+        for slot in self.slots:
+            if slot.context is not None:
+                await slot.context.close()
+        await self.browser.close()
+
+    def format_summary(self):
+        recycled = ", ".join(f"{reason}: {n}" for reason, n in self.recycles.items()) or "0"
+        return f"{len(self.slots)} context dựng sẵn, thay context {recycled}"
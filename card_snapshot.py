@@ -0,0 +1,52 @@
+"""Chụp plan card ra dict chuỗi (text, innerHTML, attribute) trong một lần evaluate.
+
+CardSnapshot có cùng interface với Locator mà các hàm extract dùng (inner_text,
+inner_html, get_attribute), nên extract chạy được trên bản chụp mà không cần
+browser: trong worker, trong process pool của extract_pipeline và khi replay.
+"""
+
+# Chạy trong browser: gom text, innerHTML và toàn bộ attribute của mọi card match
+# trong MỘT lần gọi, thay vì inner_text()/inner_html()/get_attribute() cho từng card
+SNAPSHOT_JS = """
+(els) => els.map((el) => {
+    const attrs = {};
+    for (const a of el.attributes) attrs[a.name] = a.value;
+    return {tag: el.tagName.toLowerCase(), text: el.innerText, html: el.innerHTML, attrs: attrs};
+})
+"""
+
+
+class CardSnapshot:
+    """Bản chụp tĩnh của một plan card, có cùng interface với Locator mà các hàm extract cần"""
+
+    __slots__ = ("text", "html", "attrs", "tag")
+
+    def __init__(self, text, html, attrs, tag="div"):
+        self.text = text
+        self.html = html
+        self.attrs = attrs
+        self.tag = tag
+
+    def inner_text(self):
+        return self.text
+
+    def inner_html(self):
+        return self.html
+
+    def get_attribute(self, name):
+        return self.attrs.get(name)
+
+    def to_dict(self):
+        return {"tag": self.tag, "text": self.text, "html": self.html, "attrs": self.attrs}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["text"], data["html"], data.get("attrs") or {}, data.get("tag", "div"))
+
+
+async def snapshot_cards(page, selector):
+    """Chụp tất cả card match `selector` bằng một lần evaluate, trả về list CardSnapshot"""
+    # locator.evaluate_all hỗ trợ cả selector riêng của Playwright (:has-text ...)
+    raw_cards = await page.locator(selector).evaluate_all(SNAPSHOT_JS)
+    return [CardSnapshot.from_dict(raw) for raw in raw_cards]
+
@@ -0,0 +1,200 @@
+"""Phát hiện thay đổi theo card: card không đổi thì bỏ qua extract, mỗi lần chạy ghi delta.
+
+Với mỗi cặp (ZIP, plan) lần chạy trước, ChangeTracker giữ hash nội dung card (text và
+HTML đã gộp khoảng trắng, attrs, kèm khoá phiên bản của extractor như extract_cache)
+cùng plan đã extract. Lần chạy sau, card có hash trùng được lấy lại plan cũ, không chạy
+extractor; sửa extractor / rule table hay đổi markup thì card được extract lại. Khi một
+ZIP xong, plan của ZIP được so với lần trước theo plan_id và ghi ra delta feed (JSONL):
+
+    {"zip_code": ..., "change": "added" | "removed" | "changed", "plan_id": ...,
+     "plan_name": ..., "fields": {field: [cũ, mới]}}   # "fields" chỉ có ở changed
+
+Trạng thái mới của ZIP chỉ được ghi tạm (bảng pending) và chỉ thay trạng thái cũ ở
+`commit()`, sau khi delta feed đã finalize. Run crash giữa chừng thì file delta .part
+bị bỏ và pending cũng bị bỏ khi mở lại, nên lần chạy tiếp so lại với trạng thái cũ và
+delta không bị mất. ZIP lỗi ở lần chạy này không được so (không sinh "removed" giả).
+"""
+import hashlib
+import json
+import sqlite3
+import time
+
+from extract_cache import extractor_version
+from plan_sinks import CSV_HEADERS
+
+DEFAULT_CHANGES_DB = "card_changes.sqlite3"
+
+# zip_code luôn khác nhau giữa các ZIP nên không tính là thay đổi của plan
+DIFF_FIELDS = [field for field in CSV_HEADERS if field != "zip_code"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS zip_plan_state (
+    zip_code TEXT NOT NULL,
+    plan_id TEXT NOT NULL,
+    card_hash TEXT,
+    plan TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (zip_code, plan_id)
+);
+CREATE INDEX IF NOT EXISTS idx_zip_plan_state_card ON zip_plan_state(zip_code, card_hash);
+CREATE TABLE IF NOT EXISTS pending_zips (
+    zip_code TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS pending_zip_plan_state (
+    zip_code TEXT NOT NULL,
+    plan_id TEXT NOT NULL,
+    card_hash TEXT,
+    plan TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (zip_code, plan_id)
+);
+"""
+
+
+def card_hash(text, html="", attrs=None, version=""):
+    """Hash nội dung card: text và HTML đã gộp khoảng trắng, attrs, kèm khoá phiên bản extractor"""
+    digest = hashlib.sha1(version.encode("utf-8"))
+    for value in (text, html, *(f"{k}={v}" for k, v in sorted((attrs or {}).items()))):
+        digest.update(b"\x1f")
+        digest.update(" ".join((value or "").split()).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def diff_plans(old, new, fields=DIFF_FIELDS):
+    """dict field -> [cũ, mới] của các field khác nhau"""
+    return {field: [old.get(field, ""), new.get(field, "")] for field in fields
+            if old.get(field, "") != new.get(field, "")}
+
+
+class KnownCards:
+    """Card của một ZIP ở lần chạy trước; extract_plans_from_cards hỏi trước khi extract"""
+
+    def __init__(self, zip_code, previous, version):
+        self.zip_code = zip_code
+        self.version = version
+        self.by_hash = {row_hash: plan for row_hash, plan in previous if row_hash}
+        self.hashes = {}  # plan_id -> card_hash của lần chạy này
+
+    def card_hash(self, card, text=None):
+        return card_hash(card.inner_text() if text is None else text, card.inner_html(),
+                         getattr(card, "attrs", None), self.version)
+
+    def lookup(self, card, text=None):
+        """Plan cũ (bản sao) nếu card không đổi, None nếu phải extract"""
+        digest = self.card_hash(card, text)
+        plan = self.by_hash.get(digest)
+        if plan is None:
+            return None
+        plan = dict(plan, zip_code=self.zip_code)
+        self.hashes.setdefault(plan["plan_id"], digest)
+        return plan
+
+    def remember(self, card, plan, text=None):
+        self.hashes.setdefault(plan["plan_id"], self.card_hash(card, text))
+
+
+class ChangeTracker:
+    """Trạng thái (ZIP, plan) trên SQLite và delta của lần chạy hiện tại.
+
+    `delta_sink` (JsonlSink...) nhận các dòng delta ngay khi mỗi ZIP xong; `commit()`
+    finalize delta_sink rồi mới đưa trạng thái mới vào dùng cho lần chạy sau.
+    """
+
+    def __init__(self, path=DEFAULT_CHANGES_DB, delta_sink=None):
+        self.path = path
+        self.delta_sink = delta_sink
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+        # Pending còn lại là của run đã crash (delta của nó không được finalize): bỏ
+        self.conn.executescript("BEGIN; DELETE FROM pending_zips; DELETE FROM pending_zip_plan_state; COMMIT;")
+        self.versions = {}  # extractor -> khoá phiên bản
+        self.sessions = {}
+        self.counts = {"added": 0, "removed": 0, "changed": 0, "unchanged": 0}
+
+    def close(self):
+        self.conn.close()
+
+    def _previous(self, zip_code):
+        rows = self.conn.execute("SELECT plan_id, card_hash, plan FROM zip_plan_state WHERE zip_code = ?", (zip_code,))
+        return {plan_id: (row_hash, json.loads(plan)) for plan_id, row_hash, plan in rows}
+
+    def version(self, extractor):
+        if extractor not in self.versions:
+            self.versions[extractor] = extractor_version(extractor)
+        return self.versions[extractor]
+
+    def known_cards(self, zip_code, extractor):
+        """Bắt đầu một lần thử của ZIP: card đã biết từ lần chạy trước (cùng phiên bản `extractor`)"""
+        session = KnownCards(zip_code, self._previous(zip_code).values(), self.version(extractor))
+        self.sessions[zip_code] = session
+        return session
+
+    def finish_zip(self, zip_code, plans):
+        """So plan của ZIP với lần chạy trước, ghi delta và lưu tạm trạng thái mới; trả về list delta"""
+        session = self.sessions.pop(zip_code, None)
+        hashes = session.hashes if session is not None else {}
+        previous = self._previous(zip_code)
+        current = {}
+        for plan in plans:
+            current.setdefault(plan["plan_id"], plan)
+
+        deltas = []
+        for plan_id, plan in current.items():
+            if plan_id not in previous:
+                deltas.append({"zip_code": zip_code, "change": "added", "plan_id": plan_id,
+                               "plan_name": plan.get("plan_name", ""), "plan": plan})
+                continue
+            fields = diff_plans(previous[plan_id][1], plan)
+            if fields:
+                deltas.append({"zip_code": zip_code, "change": "changed", "plan_id": plan_id,
+                               "plan_name": plan.get("plan_name", ""), "fields": fields})
+            else:
+                self.counts["unchanged"] += 1
+        for plan_id, (_, plan) in previous.items():
+            if plan_id not in current:
+                deltas.append({"zip_code": zip_code, "change": "removed", "plan_id": plan_id,
+                               "plan_name": plan.get("plan_name", "")})
+        for delta in deltas:
+            self.counts[delta["change"]] += 1
+
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("INSERT OR IGNORE INTO pending_zips (zip_code) VALUES (?)", (zip_code,))
+            self.conn.execute("DELETE FROM pending_zip_plan_state WHERE zip_code = ?", (zip_code,))
+            self.conn.executemany(
+                "INSERT INTO pending_zip_plan_state (zip_code, plan_id, card_hash, plan, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(zip_code, plan_id,
+                  # Không có card mới (API, cache...) mà plan không đổi: giữ hash card cũ
+                  hashes.get(plan_id) or (previous[plan_id][0] if plan_id in previous and
+                                          not diff_plans(previous[plan_id][1], plan) else None),
+                  json.dumps(plan, ensure_ascii=False), now)
+                 for plan_id, plan in current.items()])
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        if self.delta_sink is not None:
+            self.delta_sink.write_plans(deltas)
+        return deltas
+
+    def commit(self):
+        """Finalize delta_sink rồi thay trạng thái của các ZIP đã xong bằng trạng thái mới"""
+        if self.delta_sink is not None:
+            self.delta_sink.close()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("DELETE FROM zip_plan_state WHERE zip_code IN (SELECT zip_code FROM pending_zips)")
+            self.conn.execute("INSERT INTO zip_plan_state SELECT * FROM pending_zip_plan_state")
+            self.conn.execute("DELETE FROM pending_zip_plan_state")
+            self.conn.execute("DELETE FROM pending_zips")
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def format_summary(self):
+        counts = self.counts
+        return (f"+{counts['added']} plan mới, -{counts['removed']} plan bị bỏ, ~{counts['changed']} plan đổi, "
+                f"{counts['unchanged']} plan giữ nguyên")
@@ -0,0 +1,230 @@
+"""Đo thời gian từng bước của crawl, đếm sự kiện và xuất metrics; kèm logger có level.
+
+Mỗi ZIP có một ZipMetrics: `with zip_metrics.stage("goto"): ...` ghi một lần đo
+(time.perf_counter, không bị ảnh hưởng khi đồng hồ hệ thống nhảy), `count()` cộng
+counter (card tìm thấy, card bỏ qua, lỗi extract, retry, byte tải về). Khi ZIP xong,
+CrawlMetrics giữ lại bản ghi của ZIP và gom các lần đo thành histogram p50/p95/p99,
+xuất ra JSON hoặc Prometheus text format (file cuối run hoặc endpoint HTTP local).
+"""
+import contextlib
+import json
+import logging
+import math
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+log = logging.getLogger("crawl_service")
+
+LOG_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+    "off": logging.CRITICAL + 1,
+}
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Luôn ghi ra sys.stdout hiện tại, nên vẫn theo được contextlib.redirect_stdout"""
+
+    def __init__(self):
+        super().__init__(sys.stdout)
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def configure_logging(level="info"):
+    """Bật log ra stdout ở `level` (debug/info/warning/error/off); gọi lại chỉ đổi level"""
+    if not any(isinstance(handler, _StdoutHandler) for handler in log.handlers):
+        handler = _StdoutHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        log.addHandler(handler)
+        log.propagate = False
+    log.setLevel(LOG_LEVELS[level])
+
+
+def response_bytes(response):
+    """Kích thước response theo content-length (0 nếu server không gửi)"""
+    try:
+        return int(response.headers.get("content-length") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def percentile(sorted_values, q):
+    """Percentile kiểu nearest-rank trên list đã sort"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+class ZipMetrics:
+    """Thời gian theo bước và counter của một ZIP"""
+
+    __slots__ = ("zip_code", "samples", "counters", "started")
+
+    def __init__(self, zip_code):
+        self.zip_code = zip_code
+        self.samples = defaultdict(list)
+        self.counters = Counter()
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[name].append(time.perf_counter() - started)
+
+    def observe(self, name, seconds):
+        self.samples[name].append(seconds)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def merge(self, other):
+        """Cộng lần đo và counter của `other` (vd. ZipMetrics trả về từ process extract)"""
+        for name, values in other.samples.items():
+            self.samples[name].extend(values)
+        self.counters.update(other.counters)
+
+    def to_dict(self, status):
+        return {
+            "zip_code": self.zip_code,
+            "status": status,
+            "total_seconds": round(time.perf_counter() - self.started, 4),
+            "stages": {name: round(sum(values), 4) for name, values in self.samples.items()},
+            "counters": dict(self.counters),
+        }
+
+
+class CrawlMetrics:
+    """Gom metrics của cả run: bản ghi từng ZIP, histogram theo bước, tổng counter.
+
+    Đọc/ghi có lock vì endpoint HTTP chạy ở thread riêng.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.samples = defaultdict(list)
+        self.counters = Counter()
+        self.zip_status = Counter()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start_zip(self, zip_code):
+        return ZipMetrics(zip_code)
+
+    def finish_zip(self, zip_metrics, status):
+        record = zip_metrics.to_dict(status)
+        with self._lock:
+            self.records.append(record)
+            for name, values in zip_metrics.samples.items():
+                self.samples[name].extend(values)
+            self.samples["zip_total"].append(record["total_seconds"])
+            self.counters.update(zip_metrics.counters)
+            self.zip_status[status] += 1
+        return record
+
+    def histograms(self):
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self.samples.items()}
+        return {
+            name: dict({"count": len(values), "sum": round(sum(values), 4)},
+                       **{f"p{round(q * 100)}": round(percentile(values, q), 4) for q in QUANTILES})
+            for name, values in samples.items()
+        }
+
+    def snapshot(self):
+        histograms = self.histograms()
+        with self._lock:
+            return {
+                "zip_status": dict(self.zip_status),
+                "counters": dict(self.counters),
+                "stages": histograms,
+                "zips": list(self.records),
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        lines = [
+            "# HELP crawl_stage_seconds Thời gian từng bước của crawl",
+            "# TYPE crawl_stage_seconds summary",
+        ]
+        for stage, hist in sorted(self.histograms().items()):
+            for q in QUANTILES:
+                lines.append(f'crawl_stage_seconds{{stage="{stage}",quantile="{q}"}} {hist[f"p{round(q * 100)}"]}')
+            lines.append(f'crawl_stage_seconds_sum{{stage="{stage}"}} {hist["sum"]}')
+            lines.append(f'crawl_stage_seconds_count{{stage="{stage}"}} {hist["count"]}')
+        with self._lock:
+            counters = sorted(self.counters.items())
+            statuses = sorted(self.zip_status.items())
+        lines += ["# HELP crawl_events_total Số sự kiện theo loại", "# TYPE crawl_events_total counter"]
+        lines += [f'crawl_events_total{{event="{name}"}} {value}' for name, value in counters]
+        lines += ["# HELP crawl_zips_total Số ZIP đã xử lý theo kết quả", "# TYPE crawl_zips_total counter"]
+        lines += [f'crawl_zips_total{{status="{status}"}} {value}' for status, value in statuses]
+        return "\n".join(lines) + "\n"
+
+    def write(self, base_path):
+        """Ghi `<base>.json` và `<base>.prom`, trả về list đường dẫn"""
+        paths = []
+        for path, content in ((f"{base_path}.json", self.to_json()), (f"{base_path}.prom", self.to_prometheus())):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+            paths.append(path)
+        return paths
+
+    def serve(self, port, host="127.0.0.1"):
+        """Mở endpoint /metrics (Prometheus) và /metrics.json ở thread nền"""
+        # http.server import chậm (email, ssl...): chỉ cần khi có --metrics-port
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = metrics.to_prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = metrics.to_json(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+    def stop_serving(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def format_summary(self):
+        """Một dòng cho mỗi bước: số lần, p50/p95/p99"""
+        return "\n".join(
+            f"  {stage:<22} n={hist['count']:<5} p50 {hist['p50']:.2f}s  p95 {hist['p95']:.2f}s  p99 {hist['p99']:.2f}s"
+            for stage, hist in sorted(self.histograms().items(), key=lambda item: -item[1]["sum"]))
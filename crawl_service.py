@@ -0,0 +1,132 @@
+"""CLI `crawl_service`: một entry point cho crawl bằng browser và các việc offline.
+
+    crawl_service crawl 91101 90001 -c 4          # crawl bằng browser (cần playwright)
+    cut -d, -f1 zips.csv | crawl_service crawl --zips -
+    crawl_service extract archive/ --zips zips.txt  # extract lại từ snapshot (--record), không browser
+    crawl_service export --formats csv,parquet -o plans
+    crawl_service stats
+    crawl_service queue ... / crawl_service warehouse ...   # work_queue / plan_warehouse
+
+Module của mỗi subcommand chỉ được import khi subcommand đó chạy: extract / export /
+stats không kéo theo playwright hay pyarrow nên khởi động nhanh, gọi từ cron được.
+"""
+import argparse
+import importlib
+import sys
+
+
+def _delegate(module, function="main"):
+    """Subcommand chạy `module.function(argv)`; module chỉ import lúc chạy"""
+    def run(argv):
+        return getattr(importlib.import_module(module), function)(argv)
+    return run
+
+
+def _formats(value):
+    return [f.strip() for f in value.split(",") if f.strip()]
+
+
+def export(argv):
+    """Ghi plan của các ZIP đã xong trong progress DB ra file (bỏ trùng như output của crawl)"""
+    import os
+
+    parser = argparse.ArgumentParser(prog="crawl_service export", description=export.__doc__)
+    parser.add_argument("--db", default="crawl_progress.sqlite3", help="File SQLite tiến độ của crawl")
+    parser.add_argument("--zips", metavar="FILE", default=None,
+                        help="Chỉ xuất các ZIP trong FILE ('-' = stdin); mặc định mọi ZIP đã xong")
+    parser.add_argument("-o", "--output", default="uhc_medicare_plans_export", help="Tên file kết quả (không đuôi)")
+    parser.add_argument("--formats", default="csv,jsonl", help="csv, jsonl, parquet (cách nhau bởi dấu phẩy)")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.db):
+        raise SystemExit(f"❌ Không có {args.db}")
+
+    from plan_identity import MEMBERSHIP_HEADERS, PlanCollector
+    from plan_sinks import CsvSink, open_sinks
+    from progress_store import ProgressStore
+
+    store = ProgressStore(args.db)
+    done = store.done_zips()
+    if args.zips:
+        from zip_planner import read_zip_codes
+        done_set = set(done)
+        zips = read_zip_codes(args.zips)
+        missing = [z for z in zips if z not in done_set]
+        if missing:
+            print(f"⚠ {len(missing)} ZIP chưa xong trong {args.db}: {', '.join(missing[:10])}")
+        done = [z for z in zips if z in done_set]
+
+    sink = open_sinks(args.output, _formats(args.formats))
+    membership_sink = CsvSink(f"{args.output}_zip_plans.csv", fieldnames=MEMBERSHIP_HEADERS)
+    collector = PlanCollector(sink, membership_sink)
+    try:
+        for zip_code in done:
+            collector.add_zip(zip_code, store.plans_for_zip(zip_code))
+    except BaseException:
+        sink.abort()
+        membership_sink.abort()
+        raise
+    finally:
+        store.close()
+    sink.close()
+    membership_sink.close()
+    print(f"✅ Xuất {collector.total} plans (từ {len(done)} ZIP) vào {', '.join(sink.paths)}")
+
+
+def stats(argv):
+    """Trạng thái ZIP trong progress DB và báo cáo của kho Parquet (nếu có)"""
+    import os
+
+    parser = argparse.ArgumentParser(prog="crawl_service stats", description=stats.__doc__)
+    parser.add_argument("--db", default="crawl_progress.sqlite3", help="File SQLite tiến độ của crawl")
+    parser.add_argument("--warehouse", default="plan_warehouse", help="Thư mục kho Parquet ('' để bỏ qua)")
+    parser.add_argument("--last-runs", type=int, default=1, help="Số lần chạy gần nhất đưa vào báo cáo kho")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.db):
+        from progress_store import ProgressStore
+        store = ProgressStore(args.db)
+        counts = store.status_counts()
+        n_plans = store.conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+        print(f"📒 {args.db}: {counts}, {n_plans} dòng plan")
+        for zip_code, attempts, error in store.failed_zips():
+            print(f"  ✗ ZIP {zip_code} (thử {attempts} lần): {error}")
+        store.close()
+    else:
+        print(f"📒 Không có {args.db}")
+
+    if args.warehouse and os.path.isdir(args.warehouse):
+        from plan_warehouse import PlanWarehouse, format_report
+        try:
+            print(format_report(PlanWarehouse(args.warehouse), last_runs=args.last_runs))
+        except ImportError as e:
+            print(f"⚠ Không đọc được kho {args.warehouse}: {e}")
+
+
+# subcommand -> (hàm nhận argv, mô tả)
+COMMANDS = {
+    "crawl": (_delegate("test2", "cli"), "Crawl plan theo ZIP bằng browser (cần playwright)"),
+    "extract": (_delegate("replay"), "Extract lại plan offline từ archive snapshot của crawl --record"),
+    "export": (export, "Xuất plan đã crawl trong progress DB ra CSV / JSONL / Parquet"),
+    "stats": (stats, "Trạng thái ZIP và thống kê plan"),
+    "queue": (_delegate("work_queue"), "Hàng đợi ZIP có lease cho crawl nhiều process / nhiều máy"),
+    "warehouse": (_delegate("plan_warehouse"), "Kho lịch sử plan Parquet (ingest, report, sql)"),
+}
+
+
+def main(argv=None):
+    epilog = "Lệnh:\n" + "\n".join(f"  {name:<10} {help_text}" for name, (_, help_text) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        prog="crawl_service", description="Crawl UHC Medicare plans và xử lý kết quả offline",
+        epilog=epilog + "\n\n`crawl_service <lệnh> -h` để xem tuỳ chọn của từng lệnh.",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=COMMANDS, metavar="lệnh", help="một trong các lệnh bên dưới")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    run, _ = COMMANDS[args.command]
+    # Parser của lệnh con hiện tên đầy đủ trong usage / lỗi
+    sys.argv[0] = f"crawl_service {args.command}"
+    return run(args.args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
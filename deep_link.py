@@ -0,0 +1,101 @@
+"""Mở thẳng trang plan-summary của một ZIP, bỏ qua homepage và form nhập ZIP.
+
+URL của trang kết quả được học từ lần submit form thành công đầu tiên: giá trị
+ZIP trong URL được thay bằng chỗ trống để dựng URL cho các ZIP sau. Tham số gắn
+với một ZIP cụ thể (county, fips...) bị bỏ khỏi mẫu. Nếu deep link không ra kết
+quả thì flow quay lại form; hỏng liên tiếp nhiều lần thì tắt hẳn deep link.
+"""
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from crawl_metrics import log
+
+_ZIP_PLACEHOLDER = "__ZIP__"
+
+# Tham số query phụ thuộc vào ZIP cụ thể, không dùng lại được cho ZIP khác
+# (so theo từng từ của tên tham số: countyCode, county_fips khớp, statement, platform thì không)
+ZIP_SPECIFIC_PARAMS = {"county", "fips", "state", "city", "lat", "lng", "lon", "latitude", "longitude"}
+
+_KEY_WORD_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+# Chờ trang kết quả của deep link: phải vẫn là plan-summary và có card
+RESULTS_READY_JS = """
+() => window.location.href.includes('plan-summary') &&
+      !!(document.querySelector('[id*="plan-card-"]') || document.querySelector('.plan-card'))
+"""
+
+
+def key_words(key):
+    """Tách tên tham số thành các từ viết thường: tách theo `_`, `-`, `.` và camelCase"""
+    return [word.lower() for word in _KEY_WORD_RE.findall(key)]
+
+
+def learn_url_template(url, zip_code):
+    """Dựng mẫu URL từ URL kết quả của `zip_code`; None nếu URL không chứa ZIP"""
+    parts = urlsplit(url)
+    if "plan-summary" not in url or zip_code not in url:
+        return None
+    query = []
+    for key, value in parse_qsl(parts.query, keep_blank_values=True):
+        if ZIP_SPECIFIC_PARAMS.intersection(key_words(key)):
+            continue
+        query.append((key, value.replace(zip_code, _ZIP_PLACEHOLDER)))
+    # Đoạn path toàn số khác (mã county/fips...) gắn với ZIP này: không dựng mẫu được an toàn
+    if any(segment.isdigit() and segment != zip_code for segment in parts.path.split("/")):
+        return None
+    path = parts.path.replace(zip_code, _ZIP_PLACEHOLDER)
+    fragment = parts.fragment.replace(zip_code, _ZIP_PLACEHOLDER)
+    template = urlunsplit((parts.scheme, parts.netloc, path, urlencode(query, safe=_ZIP_PLACEHOLDER), fragment))
+    if _ZIP_PLACEHOLDER not in template:
+        return None
+    return template
+
+
+class DeepLinkNavigator:
+    """Giữ mẫu URL plan-summary (dùng chung cho mọi worker) và theo dõi deep link hỏng"""
+
+    def __init__(self, max_consecutive_failures=3, timeout_ms=20000):
+        self.template = None
+        self.max_consecutive_failures = max_consecutive_failures
+        self.timeout_ms = timeout_ms
+        self.consecutive_failures = 0
+        self.disabled = False
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def active(self):
+        return self.template is not None and not self.disabled
+
+    def learn(self, url, zip_code):
+        """Học mẫu URL từ một lần submit form thành công (chỉ học khi chưa có mẫu)"""
+        if self.template is not None or self.disabled:
+            return
+        self.template = learn_url_template(url, zip_code)
+        if self.template:
+            log.info(f"   → Học được deep link: {self.template}")
+
+    def url_for(self, zip_code):
+        return self.template.replace(_ZIP_PLACEHOLDER, zip_code)
+
+    def record(self, ok):
+        if ok:
+            self.hits += 1
+            self.consecutive_failures = 0
+            return
+        self.misses += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.max_consecutive_failures:
+            self.disabled = True
+            log.warning(f"⚠ Deep link hỏng {self.consecutive_failures} lần liên tiếp, quay lại dùng form cho mọi ZIP")
+
+    async def open(self, page, zip_code):
+        """Mở thẳng trang kết quả của ZIP; True nếu trang có plan card"""
+        try:
+            await page.goto(self.url_for(zip_code), timeout=60000, wait_until="domcontentloaded")
+            await page.wait_for_function(RESULTS_READY_JS, timeout=self.timeout_ms)
+            ok = zip_code in page.url
+        except Exception:
+            ok = False
+        self.record(ok)
+        return ok
@@ -0,0 +1,183 @@
+"""Cache kết quả extract theo nội dung card, dùng chung giữa các ZIP.
+
+Cùng một plan card (cùng contract, cùng benefits) xuất hiện trên trang kết quả của
+hàng trăm ZIP trong một county / state; chạy lại cả bộ regex trên cùng một text là
+lãng phí. Key của cache là hash (blake2b) của text + HTML đã gộp khoảng trắng và các
+attribute của card, trong đó ZIP đang crawl được thay bằng ký tự giữ chỗ, kèm khoá
+phiên bản của extractor. Cache hit trả về bản sao plan đã extract, chỉ đổi zip_code.
+
+- LRU giới hạn số entry trong bộ nhớ, đếm hit / miss / eviction.
+- Khoá phiên bản = hash tên extractor + source của module extractor, extraction_rules và
+  plan_identity: sửa rule thì entry cũ tự mất hiệu lực.
+- Có `path` thì entry được nạp từ SQLite khi mở và ghi lại khi `close()`.
+- Plan mà field khác zip_code có chứa chính ZIP (vd. id sinh từ ZIP) không được cache.
+"""
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+
+DEFAULT_EXTRACT_CACHE = "extract_cache.sqlite3"
+DEFAULT_MAX_ENTRIES = 20000
+# Tăng khi đổi cách dựng key / dạng entry
+CACHE_FORMAT_VERSION = 1
+
+_ZIP_PLACEHOLDER = "\x00"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS extract_cache (
+    key TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    plan TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+"""
+
+
+def extractor_version(extractor):
+    """Khoá phiên bản của một extractor (đổi khi code extract hoặc rule table đổi)"""
+    import extraction_rules
+    import plan_identity
+
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(f"{CACHE_FORMAT_VERSION}:{extractor.__module__}.{extractor.__qualname__}".encode("utf-8"))
+    for module in (sys.modules[extractor.__module__], extraction_rules, plan_identity):
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _normalize(value, zip_code):
+    value = " ".join((value or "").split())
+    return value.replace(zip_code, _ZIP_PLACEHOLDER) if zip_code else value
+
+
+class ExtractCache:
+    """LRU plan đã extract theo nội dung card"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, path=None):
+        self.max_entries = max(1, max_entries)
+        self.path = path
+        self.entries = OrderedDict()  # key -> (version, plan không có zip_code)
+        self.versions = {}  # extractor -> khoá phiên bản
+        self.added = []  # key mới từ lúc tạo (dùng khi gộp từ process extract)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.uncacheable = 0
+        self.loaded = 0
+        if path:
+            self._load()
+
+    def _load(self):
+        # Entry của phiên bản cũ không bao giờ hit nữa: bỏ luôn khi nạp
+        from plan_extractors import extract_plan_info_from_html, extract_plan_info_from_text
+        current = {self.version(f) for f in (extract_plan_info_from_html, extract_plan_info_from_text)}
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.executescript(_SCHEMA)
+            rows = conn.execute("SELECT key, version, plan FROM extract_cache ORDER BY last_used DESC LIMIT ?",
+                                (self.max_entries,)).fetchall()
+        finally:
+            conn.close()
+        for key, version, plan in reversed(rows):
+            if version in current:
+                self.entries[key] = (version, json.loads(plan))
+        self.loaded = len(self.entries)
+
+    def save(self):
+        """Ghi toàn bộ LRU (thứ tự dùng gần nhất) ra `path`"""
+        if not self.path:
+            return
+        now = time.time()
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.executescript(_SCHEMA)
+            with conn:
+                conn.execute("DELETE FROM extract_cache")
+                conn.executemany(
+                    "INSERT INTO extract_cache (key, version, plan, last_used) VALUES (?, ?, ?, ?)",
+                    [(key, version, json.dumps(plan, ensure_ascii=False), now - (len(self.entries) - i) * 1e-6)
+                     for i, (key, (version, plan)) in enumerate(self.entries.items())])
+        finally:
+            conn.close()
+
+    def close(self):
+        self.save()
+
+    def version(self, extractor):
+        if extractor not in self.versions:
+            self.versions[extractor] = extractor_version(extractor)
+        return self.versions[extractor]
+
+    def key(self, extractor, zip_code, text, html, attrs):
+        """Key của card; None nếu card không có attrs (Locator thật, không cache được)"""
+        if attrs is None:
+            return None
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(self.version(extractor).encode("utf-8"))
+        for value in (text, html, *(f"{k}={v}" for k, v in sorted(attrs.items()))):
+            digest.update(b"\x1f")
+            digest.update(_normalize(value, zip_code).encode("utf-8"))
+        return digest.hexdigest()
+
+    def card_key(self, card, zip_code, extractor, text=None):
+        return self.key(extractor, zip_code, card.inner_text() if text is None else text,
+                        card.inner_html(), getattr(card, "attrs", None))
+
+    def get(self, key, zip_code):
+        """Bản sao plan đã cache với zip_code = `zip_code`, None nếu miss"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return dict(entry[1], zip_code=zip_code)
+
+    def put(self, key, plan, zip_code, extractor):
+        if any(zip_code in value for field, value in plan.items() if field != "zip_code" and isinstance(value, str)):
+            self.uncacheable += 1
+            return
+        self._store(key, (self.version(extractor), {f: v for f, v in plan.items() if f != "zip_code"}))
+        self.added.append(key)
+
+    def _store(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def subset(self, cards, zip_code, extractor):
+        """Cache nhỏ chỉ gồm entry của các card này, gửi sang process extract cùng job"""
+        view = ExtractCache(max_entries=max(1, len(cards)))
+        for card in cards:
+            key = self.card_key(card, zip_code, extractor)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                view.entries[key] = self.entries[key]
+        view.versions = dict(self.versions)
+        return view
+
+    def merge(self, view):
+        """Gộp entry mới và counter của cache nhỏ đã chạy ở process extract"""
+        for key in view.added:
+            if key in view.entries:
+                self._store(key, view.entries[key])
+        self.hits += view.hits
+        self.misses += view.misses
+        self.uncacheable += view.uncacheable
+
+    def format_summary(self):
+        lookups = self.hits + self.misses
+        rate = f" ({self.hits / lookups:.0%})" if lookups else ""
+        line = (f"{self.hits} hit / {self.misses} miss{rate}, {self.evictions} entry bị đẩy ra, "
+                f"giữ {len(self.entries)}/{self.max_entries}")
+        if self.loaded:
+            line += f" (nạp {self.loaded} từ {self.path})"
+        if self.uncacheable:
+            line += f", {self.uncacheable} plan chứa ZIP không cache"
+        return line
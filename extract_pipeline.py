@@ -0,0 +1,146 @@
+"""Pipeline 3 tầng: browser tải card -> process pool extract -> ghi kết quả.
+
+Regex của extractor tốn CPU, còn browser phần lớn thời gian chỉ chờ trang tải. Chạy
+nối tiếp trên một thread thì lúc extract browser đứng yên và ngược lại. Ở đây:
+
+1. Worker browser (crawl_all) chụp card thành dict chuỗi (text, HTML, attrs) rồi
+   `submit()` vào một asyncio.Queue có giới hạn. Queue đầy thì worker chờ
+   (backpressure), không dồn card trong bộ nhớ khi extract chậm hơn tải trang.
+2. Mỗi consumer lấy job ra và chạy extractor trong ProcessPoolExecutor (chỉ chuỗi
+   và plan dict đi qua process, không có object browser nào).
+3. Kết quả được trả về callback `done(plans, error)` chạy trong event loop (ghi sink,
+   store, scheduler).
+
+Thời gian bận của từng tầng được cộng lại để báo utilization cuối run: tầng nào gần
+100% là tầng đang giới hạn tốc độ.
+"""
+import asyncio
+import multiprocessing
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from card_snapshot import CardSnapshot
+from crawl_metrics import ZipMetrics, configure_logging, log
+from plan_extractors import extract_plan_info_from_html, extract_plans_from_cards
+
+# Mặc định tắt (extract ngay trong worker browser); bật bằng --extract-workers N
+DEFAULT_EXTRACT_WORKERS = 0
+
+# Card DOM của một ZIP chưa extract (crawl_zip trả về khi extract được dời sang pipeline)
+CardBatch = namedtuple("CardBatch", "zip_code cards")
+
+STAGES = ("fetch", "extract", "sink")
+
+
+def extract_snapshot_batch(zip_code, cards, known=None, cache=None):
+    """Chạy trong process con: list dict card -> (plans, ZipMetrics, hash card mới, cache, giây extract)"""
+    started = time.perf_counter()
+    metrics = ZipMetrics(zip_code)
+    with metrics.stage("extract"):
+        plans = extract_plans_from_cards([CardSnapshot.from_dict(card) for card in cards], zip_code,
+                                         metrics=metrics, known=known, cache=cache)
+    return plans, metrics, known.hashes if known is not None else {}, cache, time.perf_counter() - started
+
+
+class ExtractPipeline:
+    """Queue có giới hạn giữa worker browser và process pool extract.
+
+    Dùng lại được qua nhiều lần crawl_all (mỗi lần một event loop): `start()` ở đầu,
+    `stop()` ở cuối; pool process chỉ tạo một lần, đóng bằng `shutdown()`.
+    """
+
+    def __init__(self, workers, queue_size=None, log_level="info", cache=None):
+        self.workers = max(1, workers)
+        # ExtractCache dùng chung: mỗi job mang theo phần cache của card trong job, entry mới gộp lại khi xong
+        self.cache = cache
+        self.queue_size = queue_size or 2 * self.workers
+        self.log_level = log_level
+        self.executor = None
+        self.queue = None
+        self.consumers = []
+        self.busy = Counter()  # tầng -> giây bận
+        self.capacity = Counter()  # tầng -> giây x số slot
+        self.queue_wait = 0.0
+        self.max_depth = 0
+        self.jobs = 0
+        self._started = None
+        self._fetchers = 0
+
+    def start(self, fetchers):
+        """Bắt đầu một lần chạy với `fetchers` worker browser (gọi trong event loop)"""
+        if self.executor is None:
+            # spawn, không fork: lúc này process đã có thread và subprocess driver của Playwright
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=configure_logging, initargs=(self.log_level,))
+        self.queue = asyncio.Queue(self.queue_size)
+        self.consumers = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+        self._fetchers = fetchers
+        self._started = time.monotonic()
+
+    async def stop(self):
+        for task in self.consumers:
+            task.cancel()
+        await asyncio.gather(*self.consumers, return_exceptions=True)
+        self.consumers = []
+        wall = time.monotonic() - self._started
+        self.capacity["fetch"] += wall * self._fetchers
+        self.capacity["extract"] += wall * self.workers
+        self.capacity["sink"] += wall
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def observe(self, stage, seconds):
+        self.busy[stage] += seconds
+
+    async def submit(self, zip_code, cards, done, metrics=None, known=None):
+        """Đưa card của một ZIP vào queue (chờ nếu queue đầy); `done(plans, error)` là coroutine"""
+        view = self.cache.subset(cards, zip_code, extract_plan_info_from_html) if self.cache is not None else None
+        job = (zip_code, [card.to_dict() for card in cards], done, metrics, known, view)
+        started = time.monotonic()
+        await self.queue.put(job)
+        self.queue_wait += time.monotonic() - started
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            zip_code, cards, done, metrics, known, view = await self.queue.get()
+            try:
+                plans, child_metrics, hashes, view, seconds = await loop.run_in_executor(
+                    self.executor, extract_snapshot_batch, zip_code, cards, known, view)
+                error = None
+            except Exception as e:
+                log.warning(f"   → Lỗi extract ZIP {zip_code} trong process pool: {e}")
+                plans, error = [], e
+            else:
+                self.observe("extract", seconds)
+                if metrics is not None:
+                    metrics.merge(child_metrics)
+                if known is not None:
+                    for plan_id, digest in hashes.items():
+                        known.hashes.setdefault(plan_id, digest)
+                if view is not None:
+                    self.cache.merge(view)
+            self.jobs += 1
+            started = time.monotonic()
+            try:
+                await done(plans, error)
+            except Exception as e:
+                log.warning(f"   → Lỗi ghi kết quả ZIP {zip_code}: {e}")
+            finally:
+                self.observe("sink", time.monotonic() - started)
+                self.queue.task_done()
+
+    def utilization(self):
+        return {stage: self.busy[stage] / self.capacity[stage] if self.capacity[stage] else 0.0
+                for stage in STAGES}
+
+    def format_summary(self):
+        usage = self.utilization()
+        return (f"{self.jobs} ZIP qua pipeline; bận: tải trang {usage['fetch']:.0%} ({self._fetchers} worker), "
+                f"extract {usage['extract']:.0%} ({self.workers} process), ghi {usage['sink']:.0%}; "
+                f"chờ queue đầy {self.queue_wait:.1f}s (sâu nhất {self.max_depth}/{self.queue_size})")
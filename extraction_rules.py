@@ -0,0 +1,280 @@
+"""Rule table cho việc trích xuất field từ plan card.
+
+Tất cả regex được compile một lần khi import module. Mỗi rule khai báo các từ khoá
+bắt buộc phải có trong text (`needs`). Scanner vẫn chạy tuần tự từng field, từng rule
+theo thứ tự fallback (mỗi regex là một lần quét riêng), nhưng bỏ qua rule chưa đủ từ
+khoá, nên phần lớn regex không bao giờ phải quét card. Vì từ khoá là điều kiện cần của
+regex, kết quả giữ nguyên như khi chạy mọi regex.
+"""
+import re
+from collections import namedtuple
+
+# source: "text" hoặc "html"; group: group lấy giá trị
+# fmt: "money" (thêm $ nếu thiếu), "strip" (strip khoảng trắng), "raw" (giữ nguyên)
+# needs: các từ khoá (chữ thường) phải có; phần tử là tuple nghĩa là "một trong các từ"
+# accept: hàm kiểm tra giá trị, False thì thử rule tiếp theo
+Rule = namedtuple("Rule", "regex group source fmt needs accept")
+
+_I = re.IGNORECASE
+_AMOUNT = r'(\d+(?:\.\d{2})?)'
+
+
+def rule(pattern, flags=0, group=1, source="text", fmt="money", needs=(), accept=None):
+    return Rule(re.compile(pattern, flags), group, source, fmt, needs, accept)
+
+
+def _valid_plan_name(name):
+    return len(name) > 5 and not any(char.isdigit() for char in name[:3])
+
+
+def new_plan_info(zip_code):
+    """Schema chung của một plan (13 field) mà save_to_csv ghi ra"""
+    return {
+        "zip_code": zip_code,
+        "plan_id": "",
+        "plan_name": "",
+        "plan_type": "",
+        "monthly_premium": "",
+        "pcp_copay": "",
+        "out_of_pocket_max": "",
+        "deductible": "",
+        "specialist_copay": "",
+        "emergency_copay": "",
+        "inpatient_hospital": "",
+        "tier1_generic_copay": "",
+        "services_benefits": ""
+    }
+
+
+# Rule table của extract_plan_info_from_html
+HTML_EXTRACTOR_RULES = [
+    ("plan_name", [
+        rule(r'^([A-Z][^\n$]+)', fmt="strip"),
+    ]),
+    ("monthly_premium", [
+        rule(r'class="monthly-premium[^"]*".*?<span>\$([\d,.]+)</span>', source="html", needs=("monthly-premium",)),
+        rule(r'\$([\d,.]+)[^<]{0,20}(?:monthly|premium)', _I, needs=("$", ("monthly", "premium"))),
+    ]),
+    ("out_of_pocket_max", [
+        rule(r'(Out[- ]?of[- ]?pocket[^$:\n]*)(?:\$|</span><span>)\$?([\d,]+)', group=2, source="html", needs=("pocket",)),
+        rule(r'class="oop-premium-value[^"]*">\$?([\w]+)', source="html", fmt="raw", needs=("oop-premium-value",)),
+    ]),
+    ("pcp_copay", [
+        rule(r'(?:PCP|Primary care)[^$:\n]*\$?' + _AMOUNT, _I, needs=(("pcp", "primary care"),)),
+    ]),
+    ("specialist_copay", [
+        rule(r'Specialist[^$\n]*\$?' + _AMOUNT, _I, needs=("specialist",)),
+    ]),
+    ("emergency_copay", [
+        rule(r'(?:Emergency|ER)[^$\n]*\$?' + _AMOUNT, _I, needs=("er",)),
+    ]),
+    ("inpatient_hospital", [
+        rule(r'(Inpatient|Hospital)[^$\n]*\$?' + _AMOUNT, _I, group=2, needs=(("inpatient", "hospital"),)),
+    ]),
+    ("deductible", [
+        rule(r'(Deductible)[^$\n]*\$?([\d,]+)', _I, group=2, needs=("deductible",)),
+    ]),
+    ("tier1_generic_copay", [
+        rule(r'Tier\s*1[^$\n]*\$?' + _AMOUNT, needs=("tier",)),
+        rule(r'Preferred Generic[^$\n]*\$?' + _AMOUNT, needs=("preferred generic",)),
+    ]),
+]
+
+# Rule table của extract_plan_info_from_text (giữ đúng thứ tự fallback cũ)
+TEXT_EXTRACTOR_RULES = [
+    ("plan_name", [
+        rule(r'^([A-Z][^$\n]+?)(?:\s*\$|\n)', re.MULTILINE, fmt="strip", accept=_valid_plan_name),  # Tên plan ở đầu, kết thúc bằng $ hoặc xuống dòng
+        rule(r'([A-Z][^$\n]*(?:Plan|HMO|PPO|PDP)[^$\n]*)', re.MULTILINE, fmt="strip", accept=_valid_plan_name),  # Tên có chứa Plan, HMO, PPO, PDP
+        rule(r'([A-Z][A-Za-z\s&-]+(?:Medicare|Advantage|Supplement)[A-Za-z\s&-]*)', re.MULTILINE, fmt="strip", accept=_valid_plan_name),  # Tên có chứa Medicare keywords
+    ]),
+    ("monthly_premium", [
+        rule(r'\$' + _AMOUNT + r'\s*(?:per\s*month|monthly|\/month|\smo)', _I, needs=("$", ("per", "mo"))),
+        rule(r'Monthly\s*Premium[:\s]*\$' + _AMOUNT, _I, needs=("monthly", "premium", "$")),
+        rule(r'Premium[:\s]*\$' + _AMOUNT, _I, needs=("premium", "$")),
+        rule(r'\$' + _AMOUNT + r'\s*(?:premium|monthly premium)', _I, needs=("premium", "$")),
+        rule(r'\$' + _AMOUNT + r'\s*per\s*month', _I, needs=("per", "month", "$")),
+        rule(r'(\$\d+(?:\.\d{2})?)\s*monthly', _I, needs=("monthly", "$")),
+    ]),
+    ("out_of_pocket_max", [
+        rule(r'Out[- ]of[- ]pocket[^$\n]*\$([0-9,]+)', _I, needs=("pocket", "$")),
+        rule(r'Maximum[^$\n]*out[^$\n]*pocket[^$\n]*\$([0-9,]+)', _I, needs=("maximum", "pocket", "$")),
+        rule(r'Annual[^$\n]*out[^$\n]*pocket[^$\n]*\$([0-9,]+)', _I, needs=("annual", "pocket", "$")),
+        rule(r'OOP[^$\n]*\$([0-9,]+)', _I, needs=("oop", "$")),
+        rule(r'\$([0-9,]+)[^$\n]*out[- ]of[- ]pocket', _I, needs=("pocket", "$")),
+        rule(r'(\$[0-9,]+)[^$\n]*(?:maximum|max)[^$\n]*(?:out[- ]of[- ]pocket|oop)', _I, needs=("max", ("pocket", "oop"), "$")),
+    ]),
+    ("pcp_copay", [
+        rule(r'Primary\s*care[^$\n]*\$' + _AMOUNT, _I, needs=("primary", "care", "$")),
+        rule(r'PCP[^$\n]*\$' + _AMOUNT, _I, needs=("pcp", "$")),
+        rule(r'Doctor[^$\n]*visit[^$\n]*\$' + _AMOUNT, _I, needs=("doctor", "visit", "$")),
+        rule(r'Office[^$\n]*visit[^$\n]*\$' + _AMOUNT, _I, needs=("office", "visit", "$")),
+        rule(r'\$' + _AMOUNT + r'[^$\n]*(?:primary care|pcp|doctor visit)', _I, needs=(("primary care", "pcp", "doctor visit"), "$")),
+        rule(r'(\$\d+(?:\.\d{2})?)[^$\n]*copay[^$\n]*(?:primary|pcp|doctor)', _I, needs=("copay", ("primary", "pcp", "doctor"), "$")),
+    ]),
+    ("specialist_copay", [
+        rule(r'Specialist[^$\n]*\$' + _AMOUNT, _I, needs=("specialist", "$")),
+        rule(r'\$' + _AMOUNT + r'[^$\n]*specialist', _I, needs=("specialist", "$")),
+        rule(r'(\$\d+(?:\.\d{2})?)[^$\n]*specialist[^$\n]*(?:copay|visit)', _I, needs=("specialist", ("copay", "visit"), "$")),
+    ]),
+    ("emergency_copay", [
+        rule(r'Emergency[^$\n]*\$' + _AMOUNT, _I, needs=("emergency", "$")),
+        rule(r'ER[^$\n]*\$' + _AMOUNT, _I, needs=("er", "$")),
+        rule(r'\$' + _AMOUNT + r'[^$\n]*emergency', _I, needs=("emergency", "$")),
+        rule(r'(\$\d+(?:\.\d{2})?)[^$\n]*emergency[^$\n]*(?:copay|visit)', _I, needs=("emergency", ("copay", "visit"), "$")),
+    ]),
+    ("inpatient_hospital", [
+        rule(r'Inpatient[^$\n]*hospital[^$\n]*\$' + _AMOUNT, _I, needs=("inpatient", "hospital", "$")),
+        rule(r'Hospital[^$\n]*stay[^$\n]*\$' + _AMOUNT, _I, needs=("hospital", "stay", "$")),
+        rule(r'\$' + _AMOUNT + r'[^$\n]*(?:inpatient|hospital stay)', _I, needs=(("inpatient", "hospital stay"), "$")),
+        rule(r'(\$\d+(?:\.\d{2})?)[^$\n]*(?:per day|daily)[^$\n]*hospital', _I, needs=(("per day", "daily"), "hospital", "$")),
+    ]),
+    ("deductible", [
+        rule(r'Deductible[^$\n]*\$([0-9,]+)', _I, needs=("deductible", "$")),
+        rule(r'Annual[^$\n]*deductible[^$\n]*\$([0-9,]+)', _I, needs=("annual", "deductible", "$")),
+        rule(r'\$([0-9,]+)[^$\n]*deductible', _I, needs=("deductible", "$")),
+        rule(r'(\$[0-9,]+)[^$\n]*annual[^$\n]*deductible', _I, needs=("annual", "deductible", "$")),
+    ]),
+    ("tier1_generic_copay", [
+        rule(r'Tier\s*1[^$\n]*\$' + _AMOUNT, _I, needs=("tier", "$")),
+        rule(r'Generic[^$\n]*\$' + _AMOUNT, _I, needs=("generic", "$")),
+        rule(r'Preferred[^$\n]*generic[^$\n]*\$' + _AMOUNT, _I, needs=("preferred", "generic", "$")),
+        rule(r'\$' + _AMOUNT + r'[^$\n]*(?:tier 1|generic|preferred generic)', _I, needs=(("tier 1", "generic"), "$")),
+        rule(r'(\$\d+(?:\.\d{2})?)[^$\n]*copay[^$\n]*(?:tier 1|generic)', _I, needs=("copay", ("tier 1", "generic"), "$")),
+    ]),
+]
+
+# Phân loại plan: (từ khoá, loại plan), từ khoá đầu tiên có mặt quyết định loại
+HTML_PLAN_TYPE_CLASSES = [
+    ("bg-pastel-aqua", "MA"),
+    ("bg-pastel-mint", "Medicare Supplement"),
+    ("bg-pastel-lavender", "PDP"),
+]
+
+TEXT_PLAN_TYPE_KEYWORDS = [
+    (('prescription drug', 'pdp', 'drug plan'), "PDP"),
+    (('medicare advantage', 'ma plan', 'hmo', 'ppo'), "MA"),
+    (('supplement', 'medigap'), "Medicare Supplement"),
+    (('special needs', 'snp'), "SNP"),
+]
+
+BENEFITS_KEYWORDS = ['dental', 'vision', 'hearing', 'wellness', 'fitness', 'transportation', 'prescription', 'allowance']
+
+BENEFIT_PHRASE_KEYWORDS = BENEFITS_KEYWORDS + ['credit', 'included', 'covered']
+
+# (pattern, needs): các câu benefit không bao giờ chứa "." hay xuống dòng
+BENEFIT_PHRASE_PATTERNS = [(re.compile(pattern, _I), needs) for pattern, needs in [
+    (r'(Dental[^.\n]*(?:coverage|benefit|included)[^.\n]*)', ("dental", ("coverage", "benefit", "included"))),
+    (r'(Vision[^.\n]*(?:coverage|benefit|included)[^.\n]*)', ("vision", ("coverage", "benefit", "included"))),
+    (r'(Hearing[^.\n]*(?:coverage|benefit|included)[^.\n]*)', ("hearing", ("coverage", "benefit", "included"))),
+    (r'(Wellness[^.\n]*(?:program|benefit|included)[^.\n]*)', ("wellness", ("program", "benefit", "included"))),
+    (r'(Fitness[^.\n]*(?:program|benefit|included)[^.\n]*)', ("fitness", ("program", "benefit", "included"))),
+    (r'(Transportation[^.\n]*(?:benefit|included)[^.\n]*)', ("transportation", ("benefit", "included"))),
+    (r'(Prescription[^.\n]*(?:coverage|benefit|included)[^.\n]*)', ("prescription", ("coverage", "benefit", "included"))),
+    (r'(Medicare[^.\n]*(?:Part A|Part B|Part D)[^.\n]*)', ("medicare", ("part a", "part b", "part d"))),
+    (r'(\$\d+[^.\n]*(?:allowance|credit|benefit)[^.\n]*)', ("$", ("allowance", "credit", "benefit"))),
+    (r'([A-Z][^.\n]*(?:included|covered|benefit)[^.\n]*)', (("included", "covered", "benefit"),)),
+]]
+_BENEFIT_SEGMENT_SPLIT = re.compile(r'[.\n]')
+
+PLAN_ID_FROM_NAME = re.compile(r'^([A-Z][^$\n]+?)(?:\s*\$|\n)', re.MULTILINE)
+PLAN_ID_UNSAFE_CHARS = re.compile(r'[^\w\s-]')
+HTML_DATA_PLANID = re.compile(r'data-planid="([^"]+)"')
+
+
+# Ký tự mà re.IGNORECASE coi là tương đương chữ ASCII nhưng str.lower() không đổi
+_IGNORECASE_FOLD = str.maketrans({"\u0131": "i", "\u017f": "s"})
+
+
+class _KeywordGate:
+    """Kiểm tra từ khoá có trong text (đã lower), nhớ kết quả để mỗi từ khoá chỉ tìm một lần.
+
+    Chỉ từ khoá mà rule thực sự cần mới được tìm; `in` trên str chạy ở tốc độ C nên
+    nhanh hơn nhiều so với chạy cả regex lên toàn bộ card.
+    """
+
+    __slots__ = ("haystack", "seen")
+
+    def __init__(self, text_lower):
+        if not text_lower.isascii():
+            text_lower = text_lower.translate(_IGNORECASE_FOLD)
+        self.haystack = text_lower
+        self.seen = {}
+
+    def has(self, keyword):
+        found = self.seen.get(keyword)
+        if found is None:
+            found = self.seen[keyword] = keyword in self.haystack
+        return found
+
+    def allows(self, needs):
+        for need in needs:
+            if isinstance(need, tuple):
+                if not any(self.has(k) for k in need):
+                    return False
+            elif not self.has(need):
+                return False
+        return True
+
+
+def scan_fields(rules, text, html="", text_lower=None):
+    """Chạy rule table trên text/html của card, trả về dict field -> giá trị.
+
+    Duyệt tuần tự từng field và các rule của nó theo thứ tự; rule chưa đủ từ khoá
+    (`needs`, kiểm tra một lần mỗi từ rồi nhớ lại) bị bỏ qua, rule đầu tiên match thắng.
+    Field nào không có rule match thì không có trong kết quả.
+    """
+    sources = {"text": text, "html": html}
+    gates = {"text": _KeywordGate(text_lower if text_lower is not None else text.lower()), "html": None}
+    values = {}
+    for field, field_rules in rules:
+        for r in field_rules:
+            if r.needs:
+                gate = gates[r.source]
+                if gate is None:
+                    gate = gates[r.source] = _KeywordGate(sources[r.source].lower())
+                if not gate.allows(r.needs):
+                    continue
+            match = r.regex.search(sources[r.source])
+            if not match:
+                continue
+            value = match.group(r.group)
+            if r.fmt == "strip":
+                value = value.strip()
+            elif r.fmt == "money" and not value.startswith('$'):
+                value = f"${value}"
+            if r.accept is not None and not r.accept(value):
+                continue
+            values[field] = value
+            break
+    return values
+
+
+def classify_plan_type(haystack, table):
+    """Trả về loại plan của từ khoá đầu tiên có trong haystack, không có thì "Unknown" """
+    for keywords, plan_type in table:
+        if isinstance(keywords, str):
+            keywords = (keywords,)
+        if any(keyword in haystack for keyword in keywords):
+            return plan_type
+    return "Unknown"
+
+
+def find_benefit_phrases(text, limit=5):
+    """Các câu mô tả benefit trong text, bỏ trùng, giữ thứ tự xuất hiện theo pattern.
+
+    Match không vượt qua "." hay xuống dòng nên mỗi pattern chỉ chạy trên những
+    đoạn có đủ từ khoá, tránh backtrack trên cả card.
+    """
+    segments = [(segment, _KeywordGate(segment.lower())) for segment in _BENEFIT_SEGMENT_SPLIT.split(text)]
+    benefits_list = []
+    for pattern, needs in BENEFIT_PHRASE_PATTERNS:
+        for segment, gate in segments:
+            if not gate.allows(needs):
+                continue
+            for match in pattern.findall(segment):
+                benefit_text = match.strip()
+                if (len(benefit_text) > 10 and
+                        benefit_text not in benefits_list and
+                        any(keyword in benefit_text.lower() for keyword in BENEFIT_PHRASE_KEYWORDS)):
+                    benefits_list.append(benefit_text)
+    return benefits_list[:limit]
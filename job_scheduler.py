@@ -0,0 +1,291 @@
+"""Điều phối job ZIP: rate limit theo host, retry có phân loại, concurrency tự điều chỉnh.
+
+- TokenBucket / HostRateLimiter: giới hạn số ZIP bắt đầu mỗi giây trên một host. Khi
+  site trả 429/503, rate của host bị giảm một nửa rồi tăng dần lại khi chạy ổn.
+- Lỗi của mỗi lần chạy được phân loại (timeout, network, throttled, không thấy form,
+  không có plan...). Lỗi tạm thời được chạy lại sau exponential backoff có full jitter;
+  hết số lần thử hoặc lỗi không retry được thì ZIP vào dead letter kèm lý do.
+- AdaptiveConcurrency: AIMD theo latency và tỉ lệ lỗi quan sát được; chạy ổn thì tăng
+  thêm một slot mỗi "cửa sổ", nghẽn (lỗi nhiều hoặc latency tăng gấp đôi) thì giảm nửa.
+"""
+import asyncio
+import random
+import time
+from collections import Counter, namedtuple
+
+from crawl_metrics import log
+
+DEFAULT_RATE_PER_HOST = 0.5
+DEFAULT_MAX_ATTEMPTS = 3
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_CAP_SECONDS = 120.0
+
+# reason -> (retry được không, hệ số nhân backoff)
+FAILURE_CLASSES = {
+    "timeout": (True, 1),
+    "network": (True, 1),
+    "throttled": (True, 4),
+    "browser_closed": (True, 1),
+    "form_not_found": (True, 2),
+    "no_plans": (True, 1),
+    "invalid_zip": (False, 1),
+    "unknown": (True, 1),
+}
+
+# Số lần thử tối đa riêng của một reason (thấp hơn max_attempts). Trang không ra plan hiếm
+# khi là lỗi tạm thời: chỉ thử lại một lần, và work_queue còn retry ở tầng ngoài
+MAX_ATTEMPTS_BY_REASON = {
+    "no_plans": 2,
+}
+
+# Các reason cho thấy site đang quá tải: giảm concurrency
+CONGESTION_REASONS = {"timeout", "throttled", "network"}
+
+Outcome = namedtuple("Outcome", "reason retry delay attempts")
+
+
+class CrawlError(Exception):
+    """Lỗi đã biết nguyên nhân của một ZIP; `reason` là key trong FAILURE_CLASSES"""
+
+    def __init__(self, reason, message=""):
+        super().__init__(message or reason)
+        self.reason = reason
+
+
+def classify_error(error, throttled=False):
+    """Reason của một lỗi; `throttled`: trong lúc chạy đã thấy response 429/503"""
+    if throttled:
+        return "throttled"
+    if isinstance(error, CrawlError):
+        return error.reason
+    name = type(error).__name__
+    message = str(error)
+    if isinstance(error, asyncio.TimeoutError) or "Timeout" in name:
+        return "timeout"
+    if "net::ERR" in message or "NS_ERROR" in message:
+        return "network"
+    if "has been closed" in message or "Target closed" in message or "crashed" in message:
+        return "browser_closed"
+    return "unknown"
+
+
+def backoff_delay(attempt, multiplier=1, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_CAP_SECONDS, rng=random):
+    """Exponential backoff có full jitter: ngẫu nhiên trong [0, min(cap, base * 2^(attempt-1)) * multiplier]"""
+    return rng.uniform(0, min(cap, base * 2 ** (attempt - 1) * multiplier))
+
+
+class TokenBucket:
+    """Token bucket: `rate` token mỗi giây, tích tối đa `burst` token"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class HostRateLimiter:
+    """Một token bucket cho mỗi host; bị throttle thì giảm rate, chạy ổn thì hồi dần về rate gốc"""
+
+    def __init__(self, rate=DEFAULT_RATE_PER_HOST, burst=1, min_rate=0.02):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.buckets = {}
+
+    def bucket(self, host):
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.burst)
+        return self.buckets[host]
+
+    async def acquire(self, host):
+        if self.rate:
+            await self.bucket(host).acquire()
+
+    def throttled(self, host):
+        if self.rate:
+            bucket = self.bucket(host)
+            bucket.rate = max(self.min_rate, bucket.rate / 2)
+            log.warning(f"🐢 {host} đang throttle, giảm rate còn {bucket.rate:.2f} ZIP/s")
+
+    def succeeded(self, host):
+        if self.rate:
+            bucket = self.bucket(host)
+            bucket.rate = min(self.rate, bucket.rate + self.rate * 0.05)
+
+
+class AdaptiveConcurrency:
+    """Giới hạn số job chạy cùng lúc, điều chỉnh kiểu AIMD.
+
+    Mỗi lần xong thành công: limit += 1/limit (tức +1 sau một cửa sổ `limit` job).
+    Nghẽn (EWMA tỉ lệ lỗi > `error_threshold` hoặc EWMA latency > `slow_factor` lần
+    latency tốt nhất): limit *= `decrease_factor`, tối đa một lần mỗi cửa sổ.
+    """
+
+    def __init__(self, maximum, minimum=1, initial=None, decrease_factor=0.5, error_threshold=0.2,
+                 slow_factor=2.0, alpha=0.2):
+        self.maximum = maximum
+        self.minimum = minimum
+        # Bắt đầu ở maximum (-c giữ nghĩa cũ), AIMD chỉ giảm khi thấy nghẽn
+        self.limit = float(initial or maximum)
+        self.decrease_factor = decrease_factor
+        self.error_threshold = error_threshold
+        self.slow_factor = slow_factor
+        self.alpha = alpha
+        self.active = 0
+        self.completed = 0
+        self.latency_ewma = None
+        self.best_latency = None
+        self.error_ewma = 0.0
+        self.decreases = 0
+        self._last_decrease = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.active < int(self.limit))
+            self.active += 1
+
+    async def release(self, ok, latency=None, congestion=False):
+        async with self._cond:
+            self.active -= 1
+            self.completed += 1
+            self.error_ewma = self.alpha * (not ok) + (1 - self.alpha) * self.error_ewma
+            slow = False
+            if ok and latency is not None:
+                self.latency_ewma = latency if self.latency_ewma is None else (
+                    self.alpha * latency + (1 - self.alpha) * self.latency_ewma)
+                if self.completed >= 3:
+                    self.best_latency = min(self.best_latency or self.latency_ewma, self.latency_ewma)
+                    slow = self.latency_ewma > self.slow_factor * self.best_latency
+            congested = slow or (congestion and self.error_ewma > self.error_threshold)
+            if congested:
+                if self.completed - self._last_decrease >= int(self.limit):
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self._last_decrease = self.completed
+                    self.decreases += 1
+                    log.info(f"📉 Giảm concurrency còn {int(self.limit)}")
+            elif ok:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class JobScheduler:
+    """Hàng đợi ZIP có retry/backoff, rate limit theo host, AIMD và dead letter.
+
+    Worker: `zip_code = await next_zip()` (None thì dừng) -> `await acquire(host)` ->
+    chạy -> `await succeeded(...)` hoặc `await failed(...)`. Nếu phần extract chạy ở
+    chỗ khác (extract_pipeline), worker gọi `await fetched(...)` khi trang tải xong để
+    trả slot, kết quả sau đó báo bằng `succeeded` / `failed` với `fetched=True`.
+    """
+
+    def __init__(self, zip_codes, max_concurrency=1, rate_per_host=DEFAULT_RATE_PER_HOST,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, backoff_base=BACKOFF_BASE_SECONDS, rng=random):
+        self.queue = asyncio.Queue()
+        for zip_code in zip_codes:
+            self.queue.put_nowait(zip_code)
+        self.outstanding = len(zip_codes)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.rng = rng
+        self.attempts = Counter()
+        self.reasons = Counter()
+        self.dead_letters = []
+        self.retries = 0
+        self.limiter = HostRateLimiter(rate_per_host, burst=max(1, max_concurrency))
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self._n_workers = 0
+        self._retry_handles = set()
+
+    def start(self, n_workers):
+        self._n_workers = n_workers
+        self._maybe_finish()
+
+    def _maybe_finish(self):
+        # Hết job (kể cả job đang chờ retry): đánh thức mọi worker để dừng
+        if self.outstanding == 0 and self._n_workers:
+            for _ in range(self._n_workers):
+                self.queue.put_nowait(None)
+            self._n_workers = 0
+
+    async def next_zip(self):
+        return await self.queue.get()
+
+    async def acquire(self, host):
+        await self.concurrency.acquire()
+        await self.limiter.acquire(host)
+
+    async def fetched(self, host, latency):
+        """Trang của ZIP đã tải xong (chưa extract): trả slot concurrency, AIMD tính theo latency tải"""
+        self.limiter.succeeded(host)
+        await self.concurrency.release(True, latency)
+
+    async def succeeded(self, zip_code, host, latency, fetched=False):
+        self.attempts[zip_code] += 1
+        if not fetched:
+            await self.fetched(host, latency)
+        self.outstanding -= 1
+        self._maybe_finish()
+
+    async def failed(self, zip_code, host, error, throttled=False, fetched=False):
+        """Ghi nhận một lần chạy lỗi; trả về Outcome (reason, có retry không, delay, số lần đã thử).
+
+        Với `fetched`, slot đã được trả ở `fetched()` nên lỗi không tính vào AIMD / rate limit.
+        """
+        self.attempts[zip_code] += 1
+        attempts = self.attempts[zip_code]
+        reason = classify_error(error, throttled)
+        self.reasons[reason] += 1
+        retryable, multiplier = FAILURE_CLASSES.get(reason, FAILURE_CLASSES["unknown"])
+        if not fetched:
+            if reason == "throttled":
+                self.limiter.throttled(host)
+            await self.concurrency.release(False, congestion=reason in CONGESTION_REASONS)
+
+        max_attempts = min(self.max_attempts, MAX_ATTEMPTS_BY_REASON.get(reason, self.max_attempts))
+        if retryable and attempts < max_attempts:
+            delay = backoff_delay(attempts, multiplier, base=self.backoff_base, rng=self.rng)
+            self.retries += 1
+            handle = asyncio.get_running_loop().call_later(delay, self._requeue, zip_code)
+            self._retry_handles.add(handle)
+            return Outcome(reason, True, delay, attempts)
+
+        self.dead_letters.append({
+            "zip_code": zip_code,
+            "reason": reason,
+            "error": str(error)[:500],
+            "attempts": attempts,
+            "failed_at": time.time(),
+        })
+        self.outstanding -= 1
+        self._maybe_finish()
+        return Outcome(reason, False, 0.0, attempts)
+
+    def _requeue(self, zip_code):
+        self._retry_handles = {h for h in self._retry_handles if not h.cancelled() and h.when() > time.monotonic()}
+        self.queue.put_nowait(zip_code)
+
+    def cancel(self):
+        for handle in self._retry_handles:
+            handle.cancel()
+        self._retry_handles.clear()
+
+    def format_summary(self):
+        reasons = ", ".join(f"{reason}: {n}" for reason, n in self.reasons.most_common()) or "không có lỗi"
+        return (f"{self.retries} lần thử lại, {len(self.dead_letters)} ZIP vào dead letter ({reasons}); "
+                f"concurrency cuối {int(self.concurrency.limit)}/{self.concurrency.maximum}, "
+                f"giảm {self.concurrency.decreases} lần")
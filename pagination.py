@@ -0,0 +1,104 @@
+"""Lấy hết plan card của một ZIP qua scroll / "Load more", mỗi card chỉ chụp và extract một lần.
+
+Mỗi card đã chụp được đánh dấu ngay trong DOM (attribute `data-crawl-seen`), nên lần
+chụp sau chỉ serialize card mới. Phía Python giữ thêm key của card (id `plan-card-*`,
+data-plan-id, hoặc hash text) phòng khi trang render lại node và mất attribute đánh dấu.
+Tổng công việc vì vậy tuyến tính theo số card, không phải chụp lại cả trang mỗi vòng.
+"""
+import hashlib
+
+from card_snapshot import CardSnapshot
+from crawl_metrics import ZipMetrics
+from plan_extractors import MIN_CARD_TEXT_LENGTH
+
+SEEN_ATTR = "data-crawl-seen"
+
+# Số vòng scroll / load more tối đa cho một ZIP (chặn vòng lặp vô hạn nếu trang lỗi)
+MAX_PAGINATION_ROUNDS = 30
+
+# Chỉ chụp card chưa đánh dấu và đã có nội dung; card skeleton không đánh dấu (để vòng sau
+# lấy khi đã có nội dung) mà chỉ đếm
+SNAPSHOT_NEW_JS = """
+(els, [seenAttr, minLength]) => {
+    const out = [];
+    let skipped = 0;
+    for (const el of els) {
+        if (el.hasAttribute(seenAttr)) continue;
+        const text = el.innerText || '';
+        if (text.trim().length < minLength) {
+            skipped++;
+            continue;
+        }
+        const attrs = {};
+        for (const a of el.attributes) attrs[a.name] = a.value;
+        out.push({tag: el.tagName.toLowerCase(), text: text, html: el.innerHTML, attrs: attrs});
+        el.setAttribute(seenAttr, '1');
+    }
+    return {cards: out, skipped: skipped};
+}
+"""
+
+
+def card_key(card):
+    """Key ổn định của card trong một trang kết quả"""
+    card_id = card.get_attribute("id")
+    if card_id and "plan-card-" in card_id:
+        return card_id
+    plan_id = card.get_attribute("data-plan-id") or card.get_attribute("data-planid")
+    if plan_id:
+        return f"plan:{plan_id}"
+    return "text:" + hashlib.sha1(" ".join(card.inner_text().split()).encode("utf-8")).hexdigest()
+
+
+class CardHarvester:
+    """Các card đã lấy của một ZIP; `new_cards()` chỉ trả về card chưa thấy.
+
+    `skipped` là số card skeleton (chưa đủ nội dung) ở lần chụp gần nhất, tức số card
+    vẫn còn rỗng khi harvest xong.
+    """
+
+    def __init__(self, page, selector, count_selectors=None):
+        self.page = page
+        self.selector = selector
+        # Selector CSS (chuỗi hoặc list) đếm card khi chờ load more xong
+        self.count_selectors = count_selectors or selector
+        self.seen = set()
+        self.cards = []
+        self.skipped = 0
+
+    async def new_cards(self):
+        result = await self.page.locator(self.selector).evaluate_all(
+            SNAPSHOT_NEW_JS, [SEEN_ATTR, MIN_CARD_TEXT_LENGTH])
+        self.skipped = result["skipped"]
+        fresh = []
+        for raw in result["cards"]:
+            card = CardSnapshot.from_dict(raw)
+            key = card_key(card)
+            if key in self.seen:
+                continue
+            self.seen.add(key)
+            fresh.append(card)
+        self.cards.extend(fresh)
+        return fresh
+
+    async def more_cards(self, readiness, resolver, metrics=None, max_rounds=MAX_PAGINATION_ROUNDS):
+        """Scroll xuống cuối / bấm load more, mỗi vòng yield các card mới; dừng khi không còn card mới"""
+        metrics = metrics or ZipMetrics("")
+        for _ in range(max_rounds):
+            with metrics.stage("load_more"):
+                # Infinite scroll: cuộn xuống cuối rồi chờ network yên
+                await self.page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                await readiness.network_quiet("scroll_quiet")
+                fresh = await self.new_cards()
+                if not fresh:
+                    # Phân trang bằng nút: bấm, chờ network yên rồi chờ số card đứng yên
+                    selector = await resolver.resolve(self.page, "load_more")
+                    if selector:
+                        await self.page.locator(selector).first.click()
+                        await readiness.network_quiet("load_more_quiet")
+                        await readiness.stable_count("load_more_cards", self.count_selectors)
+                        fresh = await self.new_cards()
+            if not fresh:
+                return
+            metrics.count("pagination_rounds")
+            yield fresh
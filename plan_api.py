@@ -0,0 +1,234 @@
+"""Bắt JSON plan từ network của trang plan-summary thay vì đọc card đã render.
+
+Trang plan-summary render phía client từ response của backend. Sau khi bấm
+"View plans", PlanResponseCollector nghe các response XHR/fetch dạng JSON, tìm
+trong payload những object trông giống một plan và map thẳng vào schema
+plan_info. Nếu không bắt được plan nào, flow dùng lại extract từ DOM.
+"""
+import asyncio
+import re
+import time
+
+from extraction_rules import TEXT_PLAN_TYPE_KEYWORDS, classify_plan_type, new_plan_info
+
+# URL của response có khả năng chứa danh sách plan
+PLAN_API_URL_PATTERN = re.compile(r"plan|quote|benefit", re.IGNORECASE)
+
+# field plan_info -> các tên key có thể gặp trong payload (so sánh sau khi bỏ "_", "-" và lower)
+FIELD_ALIASES = {
+    "plan_id": ["planId", "planID", "plan_id", "contractPlanSegmentId", "cpsId", "planKey", "id"],
+    "plan_name": ["planName", "plan_name", "displayName", "marketingName", "name"],
+    "plan_type": ["planType", "plan_type", "productType", "planCategory", "type"],
+    "monthly_premium": ["monthlyPremium", "monthly_premium", "planPremium", "premium"],
+    "pcp_copay": ["pcpCopay", "primaryCareCopay", "primaryCarePhysician", "pcp"],
+    "out_of_pocket_max": ["outOfPocketMax", "maxOutOfPocket", "oopMax", "moop", "inNetworkMoop"],
+    "deductible": ["deductible", "annualDeductible", "medicalDeductible"],
+    "specialist_copay": ["specialistCopay", "specialist"],
+    "emergency_copay": ["emergencyCopay", "emergencyRoomCopay", "erCopay", "emergencyRoom"],
+    "inpatient_hospital": ["inpatientHospital", "inpatientHospitalCopay", "inpatientCopay", "inpatient"],
+    "tier1_generic_copay": ["tier1GenericCopay", "tier1Copay", "preferredGenericCopay", "tier1"],
+    "services_benefits": ["extraBenefits", "additionalBenefits", "benefits", "services"],
+}
+
+MONEY_FIELDS = {"monthly_premium", "pcp_copay", "out_of_pocket_max", "deductible", "specialist_copay",
+                "emergency_copay", "inpatient_hospital", "tier1_generic_copay"}
+
+# Mã loại plan thường gặp trong payload -> plan_type của CSV
+PLAN_TYPE_CODES = {
+    "ma": "MA", "mapd": "MA", "hmo": "MA", "ppo": "MA", "medicareadvantage": "MA",
+    "pdp": "PDP", "partd": "PDP",
+    "ms": "Medicare Supplement", "medsupp": "Medicare Supplement", "medigap": "Medicare Supplement",
+    "snp": "SNP", "dsnp": "SNP", "csnp": "SNP", "isnp": "SNP",
+}
+
+_NESTED_VALUE_KEYS = ("amount", "value", "displayValue", "display", "text", "label")
+
+
+def _norm_key(key):
+    return key.replace("_", "").replace("-", "").lower()
+
+
+_ALIAS_LOOKUP = {field: [_norm_key(alias) for alias in aliases] for field, aliases in FIELD_ALIASES.items()}
+
+
+def _lookup(obj, field):
+    normalized = {_norm_key(k): v for k, v in obj.items() if isinstance(k, str)}
+    for alias in _ALIAS_LOOKUP[field]:
+        value = normalized.get(alias)
+        if value not in (None, "", [], {}):
+            return value
+    return None
+
+
+def _scalar(value):
+    """Lấy giá trị đơn từ dạng {"amount": 0, ...} hoặc giữ nguyên"""
+    if isinstance(value, dict):
+        for key in _NESTED_VALUE_KEYS:
+            if value.get(key) not in (None, ""):
+                return value[key]
+        return None
+    return value
+
+
+def format_money(value):
+    """Định dạng số tiền giống text trên card: $3,400 / $0 / $35.50"""
+    value = _scalar(value)
+    if value is None or isinstance(value, bool):
+        return ""
+    if isinstance(value, (int, float)):
+        if float(value).is_integer():
+            return f"${int(value):,}"
+        return f"${value:,.2f}"
+    text = str(value).strip()
+    if re.fullmatch(r"[\d,]+(?:\.\d+)?", text):
+        return f"${text}"
+    return text
+
+
+def normalize_plan_type(value):
+    value = _scalar(value)
+    if not value:
+        return "Unknown"
+    code = re.sub(r"[^a-z]", "", str(value).lower())
+    if code in PLAN_TYPE_CODES:
+        return PLAN_TYPE_CODES[code]
+    return classify_plan_type(str(value).lower(), TEXT_PLAN_TYPE_KEYWORDS)
+
+
+def _format_benefits(value):
+    if isinstance(value, list):
+        names = []
+        for item in value:
+            item = _scalar(item) if not isinstance(item, dict) else (
+                _lookup(item, "plan_name") or _scalar(item))
+            if item and str(item) not in names:
+                names.append(str(item))
+        return " | ".join(names)
+    value = _scalar(value)
+    return "" if value is None else str(value)
+
+
+def _looks_like_plan(obj):
+    """Object có id/tên plan và ít nhất một field tiền thì coi là một plan"""
+    if _lookup(obj, "plan_id") is None and _lookup(obj, "plan_name") is None:
+        return False
+    return any(_lookup(obj, field) is not None for field in MONEY_FIELDS)
+
+
+def find_plan_objects(payload):
+    """Duyệt toàn bộ JSON, trả về các object giống plan (không đi sâu vào bên trong plan đã tìm thấy)"""
+    found = []
+    stack = [payload]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if _looks_like_plan(node):
+                found.append(node)
+                continue
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+    return found
+
+
+def map_plan_object(obj, zip_code):
+    """Map một object plan của API vào schema plan_info"""
+    plan_info = new_plan_info(zip_code)
+    for field in FIELD_ALIASES:
+        value = _lookup(obj, field)
+        if value is None:
+            continue
+        if field in MONEY_FIELDS:
+            plan_info[field] = format_money(value)
+        elif field == "plan_type":
+            plan_info[field] = normalize_plan_type(value)
+        elif field == "services_benefits":
+            plan_info[field] = _format_benefits(value)
+        else:
+            value = _scalar(value)
+            plan_info[field] = "" if value is None else str(value).strip()
+    if not plan_info["plan_type"]:
+        plan_info["plan_type"] = "Unknown"
+    return plan_info
+
+
+class PlanResponseCollector:
+    """Nghe response JSON của page trong lúc load trang kết quả và gom payload có plan"""
+
+    def __init__(self, page, url_pattern=PLAN_API_URL_PATTERN):
+        self.page = page
+        self.url_pattern = url_pattern
+        self.payloads = []
+        self._tasks = []
+        self._listening = False
+
+    def start(self):
+        if not self._listening:
+            self.page.on("response", self._on_response)
+            self._listening = True
+        return self
+
+    def stop(self):
+        if self._listening:
+            self.page.remove_listener("response", self._on_response)
+            self._listening = False
+
+    def reset(self):
+        """Bỏ các payload đã bắt (vd của một lần điều hướng thất bại)"""
+        self.payloads = []
+        self._tasks = []
+
+    def _on_response(self, response):
+        if response.request.resource_type not in ("xhr", "fetch"):
+            return
+        if not self.url_pattern.search(response.url):
+            return
+        if "json" not in (response.headers.get("content-type") or ""):
+            return
+        self._tasks.append(asyncio.ensure_future(self._read(response)))
+
+    async def _read(self, response):
+        try:
+            payload = await response.json()
+        except Exception:
+            return
+        if find_plan_objects(payload):
+            self.payloads.append((response.url, payload))
+
+    async def wait_for_plans(self, timeout_ms=10000, network=None, quiet_ms=500, poll_ms=100):
+        """Chờ tới khi có ít nhất một payload chứa plan, trả về True/False.
+
+        Nếu truyền `network` (readiness.NetworkActivity) thì dừng sớm khi network đã
+        yên mà vẫn chưa có plan: trang này không lấy plan qua JSON, khỏi chờ hết timeout.
+        """
+        deadline = time.monotonic() + timeout_ms / 1000
+        while not self.payloads and time.monotonic() < deadline:
+            pending = any(not t.done() for t in self._tasks)
+            if (network is not None and not pending and network.inflight == 0
+                    and (time.monotonic() - network.last_activity) * 1000 >= quiet_ms):
+                break
+            await asyncio.sleep(poll_ms / 1000)
+        # Đọc nốt các response đang dở để không sót trang plan thứ hai
+        pending = [t for t in self._tasks if not t.done()]
+        if pending:
+            await asyncio.wait(pending, timeout=max(0.5, deadline - time.monotonic()))
+        return bool(self.payloads)
+
+    def plans(self, zip_code):
+        """Các plan đã bắt được, đã map vào plan_info, bỏ trùng theo plan_id (giữ thứ tự)"""
+        return plans_from_payloads([payload for _, payload in self.payloads], zip_code)
+
+
+def plans_from_payloads(payloads, zip_code):
+    """Map mọi object plan trong các payload JSON vào plan_info, bỏ trùng theo plan_id (giữ thứ tự)"""
+    plans = []
+    seen = set()
+    for payload in payloads:
+        for obj in find_plan_objects(payload):
+            plan_info = map_plan_object(obj, zip_code)
+            key = plan_info["plan_id"] or plan_info["plan_name"]
+            if key in seen:
+                continue
+            seen.add(key)
+            plans.append(plan_info)
+    return plans
@@ -0,0 +1,175 @@
+"""Các hàm extract plan từ một plan card (Locator hoặc CardSnapshot), không phụ thuộc browser.
+
+Tách khỏi test2 để phần extract chạy được ở mọi nơi (replay, benchmark, process
+pool) mà không cần cài Playwright.
+"""
+from crawl_metrics import ZipMetrics, log
+from extraction_rules import (
+    BENEFITS_KEYWORDS,
+    HTML_DATA_PLANID,
+    HTML_EXTRACTOR_RULES,
+    HTML_PLAN_TYPE_CLASSES,
+    PLAN_ID_FROM_NAME,
+    PLAN_ID_UNSAFE_CHARS,
+    TEXT_EXTRACTOR_RULES,
+    TEXT_PLAN_TYPE_KEYWORDS,
+    classify_plan_type,
+    find_benefit_phrases,
+    new_plan_info,
+    scan_fields,
+)
+from plan_identity import fallback_plan_id
+
+# Card có text ngắn hơn mức này thường là khung rỗng / skeleton, bỏ qua
+MIN_CARD_TEXT_LENGTH = 50
+
+
+def extract_plan_info_from_html(plan_element, zip_code):
+    try:
+        html = plan_element.inner_html()
+        text = plan_element.inner_text()
+        text_lower = text.lower()
+        
+        plan_info = new_plan_info(zip_code)
+
+        # Plan ID
+        plan_id = plan_element.get_attribute("data-planid") or plan_element.get_attribute("data-plan-id")
+        if not plan_id:
+            plan_id_match = HTML_DATA_PLANID.search(html)
+            if plan_id_match:
+                plan_id = plan_id_match.group(1)
+
+        # Plan Type (theo class màu của card)
+        plan_info["plan_type"] = classify_plan_type(html, HTML_PLAN_TYPE_CLASSES)
+
+        # Tên, premium, OOP, copay, deductible, tier 1: rule table compile sẵn
+        plan_info.update(scan_fields(HTML_EXTRACTOR_RULES, text, html, text_lower=text_lower))
+
+        # Không có id trên card: sinh id từ tên + loại plan (ổn định giữa các lần crawl và các ZIP)
+        plan_info["plan_id"] = plan_id or fallback_plan_id(plan_info["plan_name"], plan_info["plan_type"])
+
+        # Services / Benefits (thô sơ từ text, chưa phân tích icon)
+        found_benefits = [word for word in BENEFITS_KEYWORDS if word in text_lower]
+        plan_info["services_benefits"] = " | ".join(found_benefits)
+
+        log.debug("✅ Extracted: %s (%s) - Premium: %s",
+                  plan_info['plan_name'], plan_info['plan_type'], plan_info['monthly_premium'])
+        return plan_info
+
+    except Exception as e:
+        log.warning("❌ Error extracting plan info: %s", e)
+        return None
+
+
+def extract_plan_info_from_text(plan_element, zip_code):
+    """Trích xuất thông tin từ toàn bộ text content của plan card"""
+    try:
+        plan_info = new_plan_info(zip_code)
+        
+        # Lấy toàn bộ text content từ plan card
+        full_text = plan_element.inner_text()
+        log.debug("   → Full text preview: %s...", full_text[:200])
+        text_lower = full_text.lower()
+        
+        # 1. Lấy Plan ID từ attributes
+        plan_id = plan_element.get_attribute("id")
+        if plan_id and "plan-card-" in plan_id:
+            plan_info["plan_id"] = plan_id.replace("plan-card-", "")
+        else:
+            # Thử lấy từ data attributes
+            data_plan_id = plan_element.get_attribute("data-plan-id")
+            if data_plan_id:
+                plan_info["plan_id"] = data_plan_id
+            else:
+                # Tạo ID từ tên plan nếu không có
+                plan_name_match = PLAN_ID_FROM_NAME.search(full_text)
+                if plan_name_match:
+                    plan_info["plan_id"] = PLAN_ID_UNSAFE_CHARS.sub('', plan_name_match.group(1))[:50]
+        
+        # 2. Xác định loại plan từ text
+        plan_info["plan_type"] = classify_plan_type(text_lower, TEXT_PLAN_TYPE_KEYWORDS)
+        
+        # 3-11. Tên, premium, OOP, copay, deductible, tier 1: quét theo rule table, bỏ rule thiếu từ khoá
+        plan_info.update(scan_fields(TEXT_EXTRACTOR_RULES, full_text, text_lower=text_lower))
+        
+        # 12. Lấy Services & Benefits, gộp thành chuỗi (chỉ lấy 5 benefits đầu)
+        benefits_list = find_benefit_phrases(full_text)
+        if benefits_list:
+            plan_info["services_benefits"] = " | ".join(benefits_list)
+        
+        # Debug: In ra thông tin đã trích xuất
+        log.debug("     → Plan ID: %s", plan_info['plan_id'])
+        log.debug("     → Name: %s", plan_info['plan_name'])
+        log.debug("     → Type: %s", plan_info['plan_type'])
+        log.debug("     → Premium: %s", plan_info['monthly_premium'])
+        log.debug("     → PCP: %s", plan_info['pcp_copay'])
+        log.debug("     → OOP Max: %s", plan_info['out_of_pocket_max'])
+        
+        return plan_info
+        
+    except Exception as e:
+        log.warning("   → Lỗi extract plan info: %s", e)
+        return None
+
+
+def extract_plans_from_cards(plan_cards, zip_code, extractor=extract_plan_info_from_html, metrics=None, known=None,
+                             cache=None):
+    """Extract lần lượt các card của một ZIP, trả về list plan_info theo thứ tự card.
+
+    `metrics` (ZipMetrics) nhận thời gian extract từng card và số card tìm thấy /
+    bỏ qua / extract lỗi. `known` (change_tracker.KnownCards): card có nội dung không
+    đổi so với lần chạy trước (cùng phiên bản extractor) lấy lại plan cũ, không chạy extractor. `cache`
+    (extract_cache.ExtractCache): card cùng nội dung đã extract ở ZIP khác lấy từ cache.
+    """
+    metrics = metrics or ZipMetrics(zip_code)
+    metrics.count("cards_found", len(plan_cards))
+    zip_plans = []
+    for i, card in enumerate(plan_cards):
+        try:
+            log.debug("\n   → Xử lý plan card %d/%d", i + 1, len(plan_cards))
+            
+            # Lấy toàn bộ text để debug
+            card_text = card.inner_text()
+            if len(card_text) < MIN_CARD_TEXT_LENGTH:  # Skip cards with too little content
+                log.debug("     ⚠ Skipping card with insufficient content: %s", card_text)
+                metrics.count("cards_skipped")
+                continue
+            
+            if known is not None:
+                plan_info = known.lookup(card, text=card_text)
+                if plan_info is not None:
+                    metrics.count("cards_unchanged")
+                    zip_plans.append(plan_info)
+                    continue
+            
+            cache_key = cache.card_key(card, zip_code, extractor, text=card_text) if cache is not None else None
+            if cache_key is not None:
+                plan_info = cache.get(cache_key, zip_code)
+                if plan_info is not None:
+                    metrics.count("cards_cached")
+                    if known is not None:
+                        known.remember(card, plan_info, text=card_text)
+                    zip_plans.append(plan_info)
+                    continue
+            
+            with metrics.stage("extract_card"):
+                plan_info = extractor(card, zip_code)
+            
+            if plan_info and (plan_info["plan_id"] or plan_info["plan_name"]):
+                # Tạo ID ổn định nếu chưa có
+                if not plan_info["plan_id"]:
+                    plan_info["plan_id"] = fallback_plan_id(plan_info["plan_name"], plan_info["plan_type"])
+                if known is not None:
+                    known.remember(card, plan_info, text=card_text)
+                if cache_key is not None:
+                    cache.put(cache_key, plan_info, zip_code, extractor)
+                zip_plans.append(plan_info)
+            else:
+                log.debug("     ✗ Không lấy được thông tin plan")
+                metrics.count("extract_failures")
+                
+        except Exception as e:
+            log.warning("     ✗ Lỗi xử lý plan card %d: %s", i + 1, e)
+            metrics.count("extract_failures")
+            continue
+    return zip_plans
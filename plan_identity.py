@@ -0,0 +1,112 @@
+"""Định danh ổn định cho plan và index bỏ trùng O(1) giữa các ZIP.
+
+Fingerprint của plan là hash của (tên đã chuẩn hoá, plan/contract id, loại plan),
+không phụ thuộc ZIP hay thời điểm crawl. Một plan có mặt ở 500 ZIP được lưu một
+lần; quan hệ ZIP -> plan được ghi riêng.
+"""
+import hashlib
+import re
+
+from crawl_metrics import log
+
+# Mã contract/plan của CMS: H1234-001-000, S5820-003, R7444-002...
+CONTRACT_ID_PATTERN = re.compile(r'\b([HRSE]\d{4})[-_ ]?(\d{3})(?:[-_ ]?(\d{3}))?\b', re.IGNORECASE)
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+MEMBERSHIP_HEADERS = ["zip_code", "plan_key", "plan_id"]
+
+
+def normalize_name(name):
+    """lower, bỏ dấu câu, gộp khoảng trắng: "AARP  Medicare (HMO)" -> "aarp medicare hmo" """
+    return _NON_WORD.sub(" ", (name or "").lower()).strip()
+
+
+def contract_id(plan):
+    """Mã contract-plan(-segment) chuẩn hoá nếu tìm thấy trong plan_id hoặc tên, không thì "" """
+    for value in (plan.get("plan_id"), plan.get("plan_name")):
+        match = CONTRACT_ID_PATTERN.search(value or "")
+        if match:
+            return "-".join(part for part in match.groups(default="000")).upper()
+    return ""
+
+
+def _digest(*parts):
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def fallback_plan_id(plan_name, plan_type):
+    """plan_id thay thế khi card không có id: chỉ phụ thuộc nội dung nên crawl lại vẫn ra cùng id"""
+    return "auto-" + _digest(normalize_name(plan_name), plan_type or "")[:12]
+
+
+def plan_fingerprint(plan):
+    """Khoá nội dung của plan: tên chuẩn hoá + contract id (hoặc plan_id) + loại plan"""
+    identity = contract_id(plan) or (plan.get("plan_id") or "").strip().lower()
+    return _digest(normalize_name(plan.get("plan_name")), identity, plan.get("plan_type") or "")[:20]
+
+
+class DedupIndex:
+    """Index plan theo fingerprint (dict, tra O(1)) và quan hệ ZIP -> plan"""
+
+    def __init__(self):
+        self.plans = {}        # plan_key -> plan_id của lần đầu thấy
+        self.memberships = set()  # (zip_code, plan_key)
+
+    def __len__(self):
+        return len(self.plans)
+
+    def __contains__(self, plan_key):
+        return plan_key in self.plans
+
+    def add(self, zip_code, plan):
+        """Ghi nhận plan ở ZIP; trả về (plan_key, là plan mới, là cặp ZIP-plan mới)"""
+        plan_key = plan_fingerprint(plan)
+        is_new_plan = plan_key not in self.plans
+        if is_new_plan:
+            self.plans[plan_key] = plan.get("plan_id")
+        membership = (zip_code, plan_key)
+        is_new_membership = membership not in self.memberships
+        if is_new_membership:
+            self.memberships.add(membership)
+        return plan_key, is_new_plan, is_new_membership
+
+
+class PlanCollector:
+    """Nhận plan của từng ZIP ngay khi ZIP xong: bỏ plan trùng, ghi ra sink, giữ thống kê nhỏ.
+
+    Plan trùng được nhận ra bằng fingerprint nội dung (DedupIndex, tra O(1)), mỗi plan
+    chỉ ghi một lần vào `sink`; quan hệ ZIP -> plan ghi riêng vào `membership_sink`.
+    Không giữ danh sách plan trong bộ nhớ, chỉ giữ index, số plan theo ZIP và vài
+    plan mẫu để in cuối lần chạy.
+    """
+
+    def __init__(self, sink, membership_sink=None, sample_size=2):
+        self.sink = sink
+        self.membership_sink = membership_sink
+        self.sample_size = sample_size
+        self.index = DedupIndex()
+        self.zip_stats = {}
+        self.samples = []
+        self.total = 0
+
+    def add_zip(self, zip_code, zip_plans):
+        new_plans = []
+        memberships = []
+        for plan_info in zip_plans:
+            plan_key, is_new_plan, is_new_membership = self.index.add(zip_code, plan_info)
+            if is_new_membership:
+                memberships.append({"zip_code": zip_code, "plan_key": plan_key, "plan_id": plan_info["plan_id"]})
+            # Kiểm tra duplicate
+            if is_new_plan:
+                new_plans.append(plan_info)
+                log.debug("     ✓ Đã thêm: %s...", plan_info['plan_name'][:50])
+            else:
+                log.debug("     ⚠ Duplicate plan: %s", plan_info['plan_id'])
+        
+        self.sink.write_plans(new_plans)
+        if self.membership_sink is not None:
+            self.membership_sink.write_plans(memberships)
+        self.total += len(new_plans)
+        self.zip_stats[zip_code] = self.zip_stats.get(zip_code, 0) + len(memberships)
+        self.samples.extend(new_plans[:self.sample_size - len(self.samples)])
+        log.info(f"✅ Hoàn thành ZIP {zip_code}: {len(memberships)} plans ({len(new_plans)} plan mới)")
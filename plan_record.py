@@ -0,0 +1,161 @@
+"""PlanRecord: plan dạng gọn có kiểu, tiền lưu bằng cent, benefits lưu bằng bitmask.
+
+plan_info (dict 13 chuỗi) tốn nhiều bộ nhớ khi giữ hàng triệu dòng, và chỗ nào cần
+cộng / so sánh tiền cũng phải parse lại "$1,250". PlanRecord dùng `__slots__`, parse
+tiền một lần thành số nguyên cent, với trạng thái rõ ràng:
+
+    MISSING (None)  ô trống
+    NOT_COVERED     "Not covered", "N/A"...
+    UNPARSED        có chữ nhưng không phải một số tiền ("20%", "$0-$50"); giữ nguyên chữ
+
+`benefits` là bitmask theo BENEFITS_KEYWORDS (bit i = keyword thứ i có trong chuỗi).
+Chuyển về cột CSV không mất gì: chuỗi gốc nào không dựng lại được đúng từ cent /
+bitmask (vd "$0.00", câu benefit dài) thì được giữ riêng, phần lớn record không cần.
+"""
+import re
+import sys
+from collections.abc import Mapping
+
+from extraction_rules import BENEFITS_KEYWORDS
+from plan_sinks import CSV_HEADERS
+
+MISSING = None
+NOT_COVERED = -1
+UNPARSED = -2
+
+MONEY_FIELDS = ("monthly_premium", "pcp_copay", "out_of_pocket_max", "deductible", "specialist_copay",
+                "emergency_copay", "inpatient_hospital", "tier1_generic_copay")
+TEXT_FIELDS = ("zip_code", "plan_id", "plan_name", "plan_type")
+
+BENEFIT_BITS = {keyword: 1 << i for i, keyword in enumerate(BENEFITS_KEYWORDS)}
+BENEFITS_SEPARATOR = " | "
+
+_MONEY_TEXT = re.compile(r'\$?(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d{2}))?')
+_NOT_COVERED_TEXT = re.compile(r'(?:not covered|not available|not applicable|n/?a|no coverage)', re.IGNORECASE)
+
+
+def parse_money(text):
+    """Chuỗi tiền -> cent (int), MISSING, NOT_COVERED hoặc UNPARSED"""
+    text = (text or "").strip()
+    if not text:
+        return MISSING
+    match = _MONEY_TEXT.fullmatch(text)
+    if match:
+        return int(match.group(1).replace(",", "")) * 100 + int(match.group(2) or 0)
+    if _NOT_COVERED_TEXT.fullmatch(text):
+        return NOT_COVERED
+    return UNPARSED
+
+
+def format_cents(cents):
+    """Cent -> chuỗi kiểu card: $3,400 / $0 / $35.50 (giống plan_api.format_money)"""
+    dollars, rest = divmod(cents, 100)
+    return f"${dollars:,}.{rest:02d}" if rest else f"${dollars:,}"
+
+
+def benefits_mask(text):
+    """Bitmask các BENEFITS_KEYWORDS có trong chuỗi benefits"""
+    text = (text or "").lower()
+    mask = 0
+    for keyword, bit in BENEFIT_BITS.items():
+        if keyword in text:
+            mask |= bit
+    return mask
+
+
+def benefit_keywords(mask):
+    return [keyword for keyword, bit in BENEFIT_BITS.items() if mask & bit]
+
+
+def _intern(value):
+    # Chỉ cho field ngắn, ít giá trị (zip_code, plan_type) lặp lại ở rất nhiều dòng. sys.intern
+    # không giữ chuỗi sống mãi: không còn record nào dùng thì chuỗi được giải phóng
+    return sys.intern(value) if value else ""
+
+
+class PlanRecord(Mapping):
+    """Một plan, đọc được như dict (plan["monthly_premium"] trả về chuỗi CSV gốc).
+
+    Tiền ở dạng cent qua `cents(field)`, benefits qua `benefits` (bitmask).
+    """
+
+    __slots__ = TEXT_FIELDS + MONEY_FIELDS + ("benefits", "_benefits_text", "_money_text")
+
+    def __init__(self, zip_code="", plan_id="", plan_name="", plan_type="", benefits=0, **money):
+        self.zip_code = _intern(zip_code)
+        self.plan_id = plan_id or ""
+        self.plan_name = plan_name or ""
+        self.plan_type = _intern(plan_type)
+        for field in MONEY_FIELDS:
+            setattr(self, field, money.pop(field, MISSING))
+        if money:
+            raise TypeError(f"PlanRecord không có field {sorted(money)}")
+        self.benefits = benefits
+        self._benefits_text = None
+        self._money_text = None
+
+    @classmethod
+    def from_dict(cls, plan):
+        """Từ plan_info (dict chuỗi như extractor / CSV trả về)"""
+        record = cls(*(plan.get(field) or "" for field in TEXT_FIELDS))
+        money_text = None
+        for field in MONEY_FIELDS:
+            text = plan.get(field) or ""
+            cents = parse_money(text)
+            setattr(record, field, cents)
+            # Chuỗi không dựng lại đúng được từ cent ("$0.00", "5900", "Not covered"): giữ nguyên
+            if cents is not MISSING and (cents < 0 or format_cents(cents) != text):
+                money_text = money_text or {}
+                money_text[field] = text
+        record._money_text = money_text
+        text = plan.get("services_benefits") or ""
+        record.benefits = benefits_mask(text)
+        if text != BENEFITS_SEPARATOR.join(benefit_keywords(record.benefits)):
+            record._benefits_text = text
+        return record
+
+    def cents(self, field):
+        """Số tiền của field theo cent; None nếu ô trống, không có bảo hiểm hoặc không phải số"""
+        value = getattr(self, field)
+        return value if value is not None and value >= 0 else None
+
+    def money_text(self, field):
+        if self._money_text and field in self._money_text:
+            return self._money_text[field]
+        value = getattr(self, field)
+        return "" if value is MISSING else format_cents(value)
+
+    @property
+    def services_benefits(self):
+        if self._benefits_text is not None:
+            return self._benefits_text
+        return BENEFITS_SEPARATOR.join(benefit_keywords(self.benefits))
+
+    def has_benefit(self, keyword):
+        return bool(self.benefits & BENEFIT_BITS[keyword])
+
+    def __getitem__(self, field):
+        if field in MONEY_FIELDS:
+            return self.money_text(field)
+        if field == "services_benefits":
+            return self.services_benefits
+        if field in TEXT_FIELDS:
+            return getattr(self, field)
+        raise KeyError(field)
+
+    def __iter__(self):
+        return iter(CSV_HEADERS)
+
+    def __len__(self):
+        return len(CSV_HEADERS)
+
+    def to_dict(self):
+        """Dict đúng các cột CSV, giống hệt plan_info ban đầu"""
+        return {field: self[field] for field in CSV_HEADERS}
+
+    def __repr__(self):
+        return f"PlanRecord({self.zip_code!r}, {self.plan_id!r}, {self.plan_name!r})"
+
+
+def records_from_plans(plans):
+    return [PlanRecord.from_dict(plan) for plan in plans]
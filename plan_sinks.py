@@ -0,0 +1,185 @@
+"""Ghi plan ra file theo kiểu streaming: mỗi ZIP xong là ghi nối tiếp, không giữ cả lần chạy trong RAM.
+
+Mỗi sink ghi vào `<file>.part`, flush định kỳ (và fsync theo chu kỳ thời gian) nên
+có thể `tail -f` file .part trong lúc chạy. Khi close, file được fsync rồi đổi tên
+(atomic) thành tên cuối cùng; nếu crash thì chỉ còn file .part, không có file kết
+quả dở dang mang tên thật.
+"""
+import csv
+import json
+import os
+import time
+
+CSV_HEADERS = [
+    "zip_code",
+    "plan_type",
+    "plan_id",
+    "plan_name",
+    "monthly_premium",
+    "pcp_copay",
+    "out_of_pocket_max",
+    "deductible",
+    "specialist_copay",
+    "emergency_copay",
+    "inpatient_hospital",
+    "tier1_generic_copay",
+    "services_benefits"
+]
+
+
+class PlanSink:
+    """Base class: quản lý file .part, flush theo số dòng, fsync theo thời gian, finalize bằng rename"""
+
+    suffix = ""
+    binary = False
+
+    def __init__(self, path, flush_rows=200, fsync_seconds=5.0):
+        self.path = path
+        self.part_path = path + ".part"
+        self.flush_rows = flush_rows
+        self.fsync_seconds = fsync_seconds
+        self.rows = 0
+        self._unflushed = 0
+        self._last_fsync = time.monotonic()
+        self._file = self._open()
+
+    def _open(self):
+        if self.binary:
+            return open(self.part_path, "wb")
+        return open(self.part_path, "w", newline="", encoding="utf-8")
+
+    def _write_rows(self, plans):
+        raise NotImplementedError
+
+    def write_plans(self, plans):
+        plans = list(plans)
+        if not plans:
+            return
+        self._write_rows(plans)
+        self.rows += len(plans)
+        self._unflushed += len(plans)
+        if self._unflushed >= self.flush_rows:
+            self.flush()
+
+    def flush(self, fsync=False):
+        self._file.flush()
+        self._unflushed = 0
+        if fsync or time.monotonic() - self._last_fsync >= self.fsync_seconds:
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+
+    def _finish(self):
+        """Ghi phần còn lại trước khi đóng (vd footer của Parquet)"""
+
+    def close(self):
+        """Flush + fsync rồi đổi tên .part thành file kết quả"""
+        self._finish()
+        self.flush(fsync=True)
+        self._file.close()
+        os.replace(self.part_path, self.path)
+
+    def abort(self):
+        """Đóng mà không finalize: giữ lại file .part để kiểm tra"""
+        self._file.close()
+
+
+class CsvSink(PlanSink):
+    suffix = ".csv"
+
+    def __init__(self, path, fieldnames=CSV_HEADERS, **kwargs):
+        super().__init__(path, **kwargs)
+        self._writer = csv.DictWriter(self._file, fieldnames=fieldnames)
+        self._writer.writeheader()
+
+    def _write_rows(self, plans):
+        self._writer.writerows(plans)
+
+
+class JsonlSink(PlanSink):
+    """Newline-delimited JSON: mỗi plan một dòng"""
+
+    suffix = ".jsonl"
+
+    def _write_rows(self, plans):
+        # PlanRecord (Mapping) không dump thẳng được bằng json
+        self._file.write("".join(json.dumps(plan if isinstance(plan, dict) else dict(plan), ensure_ascii=False) + "\n"
+                                 for plan in plans))
+
+
+class ParquetSink(PlanSink):
+    """Parquet, gom plan thành row group `row_group_size` dòng (cần pyarrow).
+
+    Parquet chỉ ghi được theo row group, nên flush chỉ đẩy các row group đã đủ xuống đĩa.
+    """
+
+    suffix = ".parquet"
+    binary = True
+
+    def __init__(self, path, row_group_size=5000, **kwargs):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("ParquetSink cần pyarrow: pip install pyarrow") from e
+        self._pa = pa
+        self._schema = pa.schema([(name, pa.string()) for name in CSV_HEADERS])
+        self.row_group_size = row_group_size
+        self._buffer = []
+        super().__init__(path, **kwargs)
+        self._writer = pq.ParquetWriter(self._file, self._schema)
+
+    def _write_rows(self, plans):
+        self._buffer.extend(plans)
+        if len(self._buffer) >= self.row_group_size:
+            self._write_row_group()
+
+    def _write_row_group(self):
+        if not self._buffer:
+            return
+        columns = {name: [plan.get(name) for plan in self._buffer] for name in CSV_HEADERS}
+        self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self._schema))
+        self._buffer = []
+
+    def _finish(self):
+        self._write_row_group()
+        self._writer.close()
+
+
+SINK_TYPES = {"csv": CsvSink, "jsonl": JsonlSink, "parquet": ParquetSink}
+
+
+class MultiSink:
+    """Ghi cùng lúc ra nhiều định dạng"""
+
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    @property
+    def paths(self):
+        return [sink.path for sink in self.sinks]
+
+    def write_plans(self, plans):
+        plans = list(plans)
+        for sink in self.sinks:
+            sink.write_plans(plans)
+
+    def flush(self, fsync=False):
+        for sink in self.sinks:
+            sink.flush(fsync=fsync)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def abort(self):
+        for sink in self.sinks:
+            sink.abort()
+
+
+def open_sinks(base_path, formats=("csv", "jsonl"), **kwargs):
+    """Mở một sink cho mỗi định dạng, file là base_path + đuôi của định dạng"""
+    sinks = []
+    for fmt in formats:
+        sink_type = SINK_TYPES[fmt]
+        sinks.append(sink_type(base_path + sink_type.suffix, **kwargs))
+    return MultiSink(sinks)
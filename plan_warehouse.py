@@ -0,0 +1,308 @@
+"""Kho lịch sử plan dạng cột: Parquet chia partition theo ngày crawl, query bằng Arrow / DuckDB.
+
+Mỗi lần chạy ghi một file `<root>/plans/crawl_date=YYYY-MM-DD/run-<run_id>.parquet`
+(ghi .part rồi đổi tên như các sink khác). Mỗi dòng là một cặp ZIP-plan của lần chạy
+đó; tiền lưu bằng cent (int64, null nếu ô trống / không phải số tiền), field "not
+covered" đánh dấu trong bitmask `not_covered`, benefits là bitmask như PlanRecord.
+
+Báo cáo dựng sẵn (số plan theo ZIP, phân bố premium / OOP theo plan_type, median theo
+ZIP qua N lần chạy gần nhất) chạy bằng group_by của pyarrow.compute trên cả dataset,
+không lặp Python theo dòng. Có duckdb thì `sql()` query thẳng view `plans`.
+
+    python plan_warehouse.py ingest uhc_medicare_plans_text_extraction_*.csv
+    python plan_warehouse.py report --last-runs 6
+    python plan_warehouse.py sql "SELECT plan_type, COUNT(*) FROM plans GROUP BY 1"
+
+Cần pyarrow (pip install pyarrow); duckdb là tuỳ chọn.
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+
+from plan_identity import plan_fingerprint
+from plan_record import MONEY_FIELDS, NOT_COVERED, PlanRecord
+from plan_sinks import PlanSink
+
+DEFAULT_WAREHOUSE_DIR = "plan_warehouse"
+QUANTILES = (0.25, 0.5, 0.75)
+# Timestamp trong tên file output của test2.main
+_RUN_FILE_TIMESTAMP = re.compile(r"(\d{8}_\d{6})")
+
+_NOT_COVERED_BITS = {field: 1 << i for i, field in enumerate(MONEY_FIELDS)}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("PlanWarehouse cần pyarrow: pip install pyarrow") from e
+    return pa, pc, ds, pq
+
+
+def warehouse_schema(pa):
+    fields = [
+        ("run_id", pa.string()),
+        ("crawled_at", pa.timestamp("s", tz="UTC")),
+        ("zip_code", pa.string()),
+        ("plan_key", pa.string()),
+        ("plan_id", pa.string()),
+        ("plan_name", pa.string()),
+        ("plan_type", pa.string()),
+    ]
+    fields += [(f"{field}_cents", pa.int64()) for field in MONEY_FIELDS]
+    fields += [("not_covered", pa.int32()), ("benefits", pa.int32())]
+    return pa.schema(fields)
+
+
+def new_run_id(crawled_at=None):
+    stamp = datetime.fromtimestamp(crawled_at or time.time(), timezone.utc).strftime("%Y%m%dT%H%M%S")
+    return f"{stamp}-{uuid.uuid4().hex[:6]}"
+
+
+class WarehouseSink(PlanSink):
+    """Ghi plan của một lần chạy vào partition của ngày crawl, gom row group `row_group_size` dòng"""
+
+    suffix = ".parquet"
+    binary = True
+
+    def __init__(self, root=DEFAULT_WAREHOUSE_DIR, run_id=None, crawled_at=None, row_group_size=20000, **kwargs):
+        pa, _, _, pq = _require_pyarrow()
+        self._pa = pa
+        self.crawled_at = int(crawled_at or time.time())
+        self.run_id = run_id or new_run_id(self.crawled_at)
+        crawl_date = datetime.fromtimestamp(self.crawled_at, timezone.utc).strftime("%Y-%m-%d")
+        partition = os.path.join(root, "plans", f"crawl_date={crawl_date}")
+        os.makedirs(partition, exist_ok=True)
+        self._schema = warehouse_schema(pa)
+        self.row_group_size = row_group_size
+        self._columns = {name: [] for name in self._schema.names}
+        self._buffered = 0
+        super().__init__(os.path.join(partition, f"run-{self.run_id}.parquet"), **kwargs)
+        self._writer = pq.ParquetWriter(self._file, self._schema)
+
+    def _write_rows(self, plans):
+        columns = self._columns
+        crawled_at = datetime.fromtimestamp(self.crawled_at, timezone.utc)
+        for plan in plans:
+            record = plan if isinstance(plan, PlanRecord) else PlanRecord.from_dict(plan)
+            columns["run_id"].append(self.run_id)
+            columns["crawled_at"].append(crawled_at)
+            columns["zip_code"].append(record.zip_code)
+            columns["plan_key"].append(plan_fingerprint(record))
+            columns["plan_id"].append(record.plan_id)
+            columns["plan_name"].append(record.plan_name)
+            columns["plan_type"].append(record.plan_type)
+            not_covered = 0
+            for field in MONEY_FIELDS:
+                columns[f"{field}_cents"].append(record.cents(field))
+                if getattr(record, field) == NOT_COVERED:
+                    not_covered |= _NOT_COVERED_BITS[field]
+            columns["not_covered"].append(not_covered)
+            columns["benefits"].append(record.benefits)
+        self._buffered += len(plans)
+        if self._buffered >= self.row_group_size:
+            self._write_row_group()
+
+    def _write_row_group(self):
+        if not self._buffered:
+            return
+        self._writer.write_table(self._pa.Table.from_pydict(self._columns, schema=self._schema))
+        self._columns = {name: [] for name in self._schema.names}
+        self._buffered = 0
+
+    def _finish(self):
+        self._write_row_group()
+        self._writer.close()
+
+
+def _read_plan_file(path):
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+class PlanWarehouse:
+    """Đọc / ghi kho plan ở thư mục `root`"""
+
+    def __init__(self, root=DEFAULT_WAREHOUSE_DIR):
+        self.root = root
+        self.plans_dir = os.path.join(root, "plans")
+
+    def open_run(self, run_id=None, crawled_at=None):
+        """Sink cho một lần chạy; close() mới hiện ra trong dataset"""
+        return WarehouseSink(self.root, run_id=run_id, crawled_at=crawled_at)
+
+    def ingest(self, plans, run_id=None, crawled_at=None):
+        sink = self.open_run(run_id, crawled_at)
+        try:
+            sink.write_plans(plans)
+        except BaseException:
+            sink.abort()
+            raise
+        sink.close()
+        return sink
+
+    def ingest_file(self, path):
+        """Nạp file CSV / JSON / JSONL của một lần chạy cũ; thời điểm crawl lấy từ timestamp trong tên file"""
+        match = _RUN_FILE_TIMESTAMP.search(os.path.basename(path))
+        crawled_at = (datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").timestamp() if match
+                      else os.path.getmtime(path))
+        return self.ingest(_read_plan_file(path), crawled_at=crawled_at)
+
+    def files(self):
+        return sorted(glob.glob(os.path.join(self.plans_dir, "crawl_date=*", "*.parquet")))
+
+    def runs(self):
+        """run_id -> file Parquet, cũ trước mới sau (run_id bắt đầu bằng thời điểm crawl)"""
+        paths = {os.path.basename(path)[len("run-"):-len(".parquet")]: path for path in self.files()}
+        return dict(sorted(paths.items()))
+
+    def dataset(self, paths=None):
+        _, _, ds, _ = _require_pyarrow()
+        return ds.dataset(paths or self.files(), format="parquet", partitioning="hive",
+                          partition_base_dir=self.plans_dir)
+
+    def table(self, columns=None, last_runs=None):
+        """Bảng Arrow của `last_runs` lần chạy gần nhất (mặc định tất cả); chỉ đọc file của các lần đó"""
+        paths = list(self.runs().values())
+        if not paths:
+            return None
+        if last_runs:
+            paths = paths[-last_runs:]
+        return self.dataset(paths).to_table(columns=columns)
+
+    def zip_counts(self, last_runs=1):
+        """Mỗi ZIP: số lần chạy có mặt, số plan khác nhau, số plan trung bình mỗi lần chạy"""
+        _, pc, _, _ = _require_pyarrow()
+        table = self.table(["run_id", "zip_code", "plan_key"], last_runs=last_runs)
+        if table is None or not table.num_rows:
+            return []
+        per_run = table.group_by(["zip_code", "run_id"]).aggregate([("plan_key", "count")])
+        grouped = per_run.group_by("zip_code").aggregate([("run_id", "count"), ("plan_key_count", "mean")])
+        distinct = table.group_by("zip_code").aggregate([("plan_key", "count_distinct")])
+        distinct = dict(zip(distinct["zip_code"].to_pylist(), distinct["plan_key_count_distinct"].to_pylist()))
+        rows = [{"zip_code": zip_code, "runs": runs, "distinct_plans": distinct[zip_code],
+                 "plans_per_run": round(mean, 1)}
+                for zip_code, runs, mean in zip(grouped["zip_code"].to_pylist(), grouped["run_id_count"].to_pylist(),
+                                                grouped["plan_key_count_mean"].to_pylist())]
+        return sorted(rows, key=lambda row: row["zip_code"])
+
+    def distribution(self, field, by="plan_type", last_runs=1):
+        """Phân bố (USD) của một field tiền theo nhóm: n, min, p25, median, p75, max, mean"""
+        _, pc, _, _ = _require_pyarrow()
+        column = f"{field}_cents"
+        table = self.table([by, column], last_runs=last_runs)
+        if table is None or not table.num_rows:
+            return []
+        grouped = table.group_by(by).aggregate([
+            (column, "count"), (column, "min"), (column, "max"), (column, "mean"),
+            (column, "tdigest", pc.TDigestOptions(q=list(QUANTILES))),
+        ])
+        rows = []
+        for i in range(grouped.num_rows):
+            count = grouped[f"{column}_count"][i].as_py()
+            if not count:
+                continue
+            quantiles = grouped[f"{column}_tdigest"][i].as_py()
+            row = {by: grouped[by][i].as_py(), "n": count,
+                   "min": grouped[f"{column}_min"][i].as_py() / 100,
+                   "max": grouped[f"{column}_max"][i].as_py() / 100,
+                   "mean": round(grouped[f"{column}_mean"][i].as_py() / 100, 2)}
+            for q, value in zip(QUANTILES, quantiles):
+                row[f"p{round(q * 100)}"] = value / 100
+            rows.append(row)
+        return sorted(rows, key=lambda row: -row["n"])
+
+    def median_by_zip(self, field, last_runs=6):
+        """Median (USD) của một field tiền theo ZIP qua `last_runs` lần chạy gần nhất"""
+        return self.distribution(field, by="zip_code", last_runs=last_runs)
+
+    def sql(self, query):
+        """Chạy SQL bằng DuckDB trên view `plans` (cần duckdb), trả về list dict"""
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("Query SQL cần duckdb: pip install duckdb") from e
+        con = duckdb.connect()
+        try:
+            pattern = os.path.join(self.plans_dir, "*", "*.parquet").replace("'", "''")
+            con.execute(f"CREATE VIEW plans AS SELECT * FROM read_parquet('{pattern}', hive_partitioning = true)")
+            cursor = con.execute(query)
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+        finally:
+            con.close()
+
+
+def format_report(warehouse, last_runs=1):
+    """Báo cáo dựng sẵn dạng text: số plan theo ZIP, phân bố premium / OOP theo plan_type"""
+    started = time.perf_counter()
+    lines = []
+    zip_rows = warehouse.zip_counts(last_runs)
+    scope = "lần chạy gần nhất" if last_runs == 1 else f"{last_runs} lần chạy gần nhất"
+    lines.append(f"Theo ZIP code ({scope}):")
+    for row in zip_rows:
+        runs = f" qua {row['runs']} lần chạy" if last_runs != 1 else ""
+        lines.append(f"  ZIP {row['zip_code']}: {row['distinct_plans']} plans{runs}")
+    for field, label in (("monthly_premium", "Premium tháng"), ("out_of_pocket_max", "OOP max")):
+        rows = warehouse.distribution(field, last_runs=last_runs)
+        if not rows:
+            continue
+        lines.append(f"\n{label} theo plan_type (USD):")
+        for row in rows:
+            lines.append(f"  {row['plan_type']:<20} n={row['n']:<6} min {row['min']:>8,.2f}  p25 {row['p25']:>8,.2f}  "
+                         f"median {row['p50']:>8,.2f}  p75 {row['p75']:>8,.2f}  max {row['max']:>8,.2f}")
+    lines.append(f"\n(kho có {len(warehouse.runs())} lần chạy, báo cáo mất {(time.perf_counter() - started) * 1000:.0f} ms)")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kho lịch sử plan (Parquet theo ngày crawl)")
+    parser.add_argument("--root", default=DEFAULT_WAREHOUSE_DIR, help="Thư mục kho")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_ingest = sub.add_parser("ingest", help="Nạp file CSV/JSON/JSONL của các lần chạy cũ")
+    p_ingest.add_argument("paths", nargs="+")
+
+    p_report = sub.add_parser("report", help="Báo cáo số plan theo ZIP và phân bố premium / OOP")
+    p_report.add_argument("--last-runs", type=int, default=1, help="Số lần chạy gần nhất đưa vào báo cáo")
+
+    p_median = sub.add_parser("median", help="Median của một field tiền theo ZIP")
+    p_median.add_argument("field", choices=MONEY_FIELDS)
+    p_median.add_argument("--last-runs", type=int, default=6)
+
+    p_sql = sub.add_parser("sql", help="Chạy SQL trên view `plans` (cần duckdb)")
+    p_sql.add_argument("query")
+
+    args = parser.parse_args(argv)
+    warehouse = PlanWarehouse(args.root)
+    if args.command == "ingest":
+        for path in args.paths:
+            sink = warehouse.ingest_file(path)
+            print(f"📥 {path}: {sink.rows} dòng -> {sink.path}")
+    elif args.command == "report":
+        print(format_report(warehouse, args.last_runs))
+    elif args.command == "median":
+        for row in warehouse.median_by_zip(args.field, args.last_runs):
+            print(f"  ZIP {row['zip_code']}: median {row['p50']:,.2f} (n={row['n']})")
+    elif args.command == "sql":
+        for row in warehouse.sql(args.query):
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
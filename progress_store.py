@@ -0,0 +1,128 @@
+"""Lưu tiến độ crawl và plan đã extract vào SQLite (WAL) để chạy lại được sau khi crash.
+
+Mỗi ZIP có một dòng trạng thái (pending / in_progress / done / failed, số lần thử,
+thời gian). Plan của một ZIP được ghi trong cùng transaction với việc đánh dấu ZIP
+là done, nên không bao giờ có ZIP "done" mà thiếu plan. Lần chạy sau tự bỏ qua các
+ZIP đã done.
+"""
+import json
+import sqlite3
+import time
+
+PENDING = "pending"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS zip_jobs (
+    zip_code TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    started_at REAL,
+    finished_at REAL,
+    duration REAL,
+    plan_count INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS plans (
+    zip_code TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    plan_id TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (zip_code, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_zip_jobs_status ON zip_jobs(status);
+"""
+
+
+class ProgressStore:
+    """Kho tiến độ crawl trên một file SQLite"""
+
+    def __init__(self, path="crawl_progress.sqlite3"):
+        self.path = path
+        # isolation_level=None: tự quản lý transaction bằng BEGIN/COMMIT
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _transaction(self, statements):
+        cur = self.conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                if isinstance(params, list):
+                    cur.executemany(sql, params)
+                else:
+                    cur.execute(sql, params)
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+
+    def add_zips(self, zip_codes):
+        """Thêm ZIP mới ở trạng thái pending (ZIP đã có thì giữ nguyên trạng thái)"""
+        self._transaction([("INSERT OR IGNORE INTO zip_jobs (zip_code) VALUES (?)",
+                            [(z,) for z in zip_codes])])
+
+    def requeue_in_progress(self):
+        """ZIP còn in_progress là do lần chạy trước chết giữa chừng: trả về pending"""
+        cur = self.conn.execute("UPDATE zip_jobs SET status = ? WHERE status = ?", (PENDING, IN_PROGRESS))
+        return cur.rowcount
+
+    def reset(self):
+        """Xoá toàn bộ tiến độ và plan (chạy lại từ đầu)"""
+        self._transaction([("DELETE FROM plans", ()), ("DELETE FROM zip_jobs", ())])
+
+    def pending_zips(self, zip_codes):
+        """Các ZIP chưa done, giữ thứ tự của zip_codes"""
+        done = {row[0] for row in self.conn.execute("SELECT zip_code FROM zip_jobs WHERE status = ?", (DONE,))}
+        return [z for z in zip_codes if z not in done]
+
+    def mark_started(self, zip_code):
+        """Đánh dấu ZIP đang chạy, trả về số lần thử (tính cả lần này)"""
+        self.conn.execute(
+            "UPDATE zip_jobs SET status = ?, attempts = attempts + 1, started_at = ?, error = NULL WHERE zip_code = ?",
+            (IN_PROGRESS, time.time(), zip_code))
+        row = self.conn.execute("SELECT attempts FROM zip_jobs WHERE zip_code = ?", (zip_code,)).fetchone()
+        return row[0] if row else 0
+
+    def mark_done(self, zip_code, plans):
+        """Ghi plan của ZIP và đánh dấu done trong một transaction"""
+        now = time.time()
+        self._transaction([
+            ("DELETE FROM plans WHERE zip_code = ?", (zip_code,)),
+            ("INSERT INTO plans (zip_code, seq, plan_id, data) VALUES (?, ?, ?, ?)",
+             [(zip_code, i, plan.get("plan_id"), json.dumps(plan, ensure_ascii=False)) for i, plan in enumerate(plans)]),
+            ("UPDATE zip_jobs SET status = ?, finished_at = ?, duration = ? - COALESCE(started_at, ?), "
+             "plan_count = ? WHERE zip_code = ?", (DONE, now, now, now, len(plans), zip_code)),
+        ])
+
+    def mark_failed(self, zip_code, error):
+        now = time.time()
+        self.conn.execute(
+            "UPDATE zip_jobs SET status = ?, finished_at = ?, duration = ? - COALESCE(started_at, ?), error = ? "
+            "WHERE zip_code = ?", (FAILED, now, now, now, str(error)[:500], zip_code))
+
+    def plans_for_zip(self, zip_code):
+        rows = self.conn.execute("SELECT data FROM plans WHERE zip_code = ? ORDER BY seq", (zip_code,))
+        return [json.loads(row[0]) for row in rows]
+
+    def load_results(self, zip_codes):
+        """dict zip_code -> list plan_info cho các ZIP đã done (giống kết quả của crawl_all)"""
+        return {z: self.plans_for_zip(z) for z in zip_codes}
+
+    def done_zips(self):
+        return [row[0] for row in self.conn.execute(
+            "SELECT zip_code FROM zip_jobs WHERE status = ? ORDER BY zip_code", (DONE,))]
+
+    def status_counts(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM zip_jobs GROUP BY status"))
+
+    def failed_zips(self):
+        return list(self.conn.execute(
+            "SELECT zip_code, attempts, error FROM zip_jobs WHERE status = ? ORDER BY zip_code", (FAILED,)))
@@ -0,0 +1,135 @@
+"""Chờ theo điều kiện thật của trang thay cho time.sleep cố định.
+
+Mỗi bước chờ có timeout riêng và được ghi lại thời gian chờ thực tế, để biết
+ZIP chậm là do trang chậm hay do chờ thừa. Hết timeout không phải là lỗi: bước
+chờ trả về False và flow tiếp tục giống như sau một lần sleep.
+"""
+import asyncio
+import time
+
+# Timeout (ms) cho từng bước chờ trong flow của một ZIP
+DEFAULT_STEP_TIMEOUTS = {
+    "homepage_ready": 15000,
+    "homepage_quiet": 5000,
+    "popup_closed": 2000,
+    "results_cards": 20000,
+    "results_quiet": 5000,
+    "scroll_quiet": 3000,
+    "load_more_quiet": 5000,
+    "load_more_cards": 5000,
+}
+
+# Số animation frame liên tiếp số card không đổi thì coi là đã render xong
+STABLE_FRAMES = 5
+# Không có request nào trong khoảng này (ms) thì coi là network đã yên
+NETWORK_QUIET_MS = 500
+
+# Chạy mỗi animation frame (polling="raf"): đếm số frame liên tiếp số element của cả list
+# selector không đổi; selector không chạy được bằng querySelectorAll thì bỏ qua
+_STABLE_COUNT_JS = """
+([selectors, frames, minCount]) => {
+    const counts = selectors.map((selector) => {
+        try {
+            return document.querySelectorAll(selector).length;
+        } catch (e) {
+            return 0;
+        }
+    });
+    const key = selectors.join('\\n');
+    const signature = counts.join(',');
+    const state = window.__crawlStableCount || (window.__crawlStableCount = {});
+    const prev = state[key];
+    if (!prev || prev.signature !== signature) {
+        state[key] = {signature: signature, frames: 0};
+        return false;
+    }
+    prev.frames += 1;
+    return Math.max(...counts) >= minCount && prev.frames >= frames;
+}
+"""
+
+
+class NetworkActivity:
+    """Theo dõi số request đang bay và thời điểm có hoạt động network gần nhất của một page"""
+
+    def __init__(self, page):
+        self.inflight = 0
+        self.last_activity = time.monotonic()
+        page.on("request", self._on_start)
+        page.on("requestfinished", self._on_done)
+        page.on("requestfailed", self._on_done)
+
+    def _on_start(self, request):
+        self.inflight += 1
+        self.last_activity = time.monotonic()
+
+    def _on_done(self, request):
+        self.inflight = max(0, self.inflight - 1)
+        self.last_activity = time.monotonic()
+
+    async def wait_quiet(self, quiet_ms, timeout_ms, max_inflight=0, poll_ms=50):
+        """Chờ tới khi không quá `max_inflight` request đang bay trong `quiet_ms` liên tục"""
+        deadline = time.monotonic() + timeout_ms / 1000
+        while True:
+            now = time.monotonic()
+            if self.inflight <= max_inflight and (now - self.last_activity) * 1000 >= quiet_ms:
+                return True
+            if now >= deadline:
+                return False
+            await asyncio.sleep(poll_ms / 1000)
+
+
+class PageReadiness:
+    """Các bước chờ theo điều kiện cho một page, có timeout theo bước và ghi lại thời gian chờ"""
+
+    def __init__(self, page, timeouts=None, network_quiet_ms=NETWORK_QUIET_MS, stable_frames=STABLE_FRAMES):
+        self.page = page
+        self.timeouts = dict(DEFAULT_STEP_TIMEOUTS, **(timeouts or {}))
+        self.network_quiet_ms = network_quiet_ms
+        self.stable_frames = stable_frames
+        self.network = NetworkActivity(page)
+        self.waits = []
+
+    async def _timed(self, step, awaitable):
+        started = time.monotonic()
+        try:
+            result = await awaitable
+            ok = result is not False
+        except Exception:
+            ok = False
+        self.waits.append((step, time.monotonic() - started, ok))
+        return ok
+
+    async def selector_attached(self, step, selector):
+        """Chờ selector có trong DOM (không cần visible)"""
+        return await self._timed(step, self.page.wait_for_selector(
+            selector, state="attached", timeout=self.timeouts[step]))
+
+    async def hidden(self, step, locator):
+        """Chờ element (vd popup vừa đóng) biến mất"""
+        return await self._timed(step, locator.wait_for(state="hidden", timeout=self.timeouts[step]))
+
+    async def stable_count(self, step, selectors, min_count=1):
+        """Chờ số element match từng selector (CSS, một chuỗi hoặc list) giữ nguyên qua vài
+        animation frame, và ít nhất một selector có `min_count` element"""
+        if isinstance(selectors, str):
+            selectors = [selectors]
+        await self.page.evaluate("() => { delete window.__crawlStableCount; }")
+        return await self._timed(step, self.page.wait_for_function(
+            _STABLE_COUNT_JS, arg=[list(selectors), self.stable_frames, min_count],
+            polling="raf", timeout=self.timeouts[step]))
+
+    async def network_quiet(self, step, max_inflight=0):
+        """Chờ network yên trong một khoảng ngắn"""
+        return await self._timed(step, self.network.wait_quiet(
+            self.network_quiet_ms, self.timeouts[step], max_inflight=max_inflight))
+
+    def pop_waits(self):
+        """Lấy và xoá các lần chờ đã ghi (dùng sau mỗi ZIP)"""
+        waits, self.waits = self.waits, []
+        return waits
+
+
+def format_waits(waits):
+    """Tóm tắt một dòng: bước chờ, thời gian thực tế, đánh dấu bước bị timeout"""
+    return ", ".join(f"{step} {seconds:.1f}s{'' if ok else ' (timeout)'}" for step, seconds, ok in waits)
@@ -0,0 +1,134 @@
+"""Ghi lại (record) dữ liệu thô của từng ZIP và extract lại offline (replay).
+
+Có hai kiểu archive:
+- Snapshot: mỗi ZIP một file `<zip>.json.gz` chứa URL, các plan card đã chụp
+  (text, HTML, attrs) và các payload JSON plan bắt được. Replay chạy lại đúng
+  đường extract của crawl_zip trên dữ liệu này: không cần browser, không cần
+  Playwright, không cần mạng, và luôn ra cùng kết quả.
+- HAR: toàn bộ traffic của mỗi worker (`har/worker-<n>.har`), dùng với
+  `crawl_service crawl --replay-har` để chạy lại cả flow browser mà không ra mạng.
+"""
+import argparse
+import glob
+import gzip
+import json
+import os
+import time
+
+ARCHIVE_VERSION = 1
+
+
+class SnapshotArchive:
+    """Thư mục archive snapshot, mỗi ZIP một file JSON nén"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def har_dir(self):
+        return os.path.join(self.directory, "har")
+
+    def path_for(self, zip_code):
+        return os.path.join(self.directory, f"{zip_code}.json.gz")
+
+    def record(self, zip_code, url, cards=None, api_payloads=None):
+        """Ghi snapshot của một ZIP (ghi file tạm rồi rename để không bao giờ có file dở)"""
+        record = {
+            "version": ARCHIVE_VERSION,
+            "zip_code": zip_code,
+            "url": url,
+            "recorded_at": time.time(),
+            "cards": [card.to_dict() for card in (cards or [])],
+            "api_payloads": list(api_payloads or []),
+        }
+        path = self.path_for(zip_code)
+        tmp_path = path + ".part"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def zip_codes(self):
+        names = (os.path.basename(p) for p in glob.glob(os.path.join(self.directory, "*.json.gz")))
+        return sorted(name[:-len(".json.gz")] for name in names)
+
+    def load(self, zip_code):
+        with gzip.open(self.path_for(zip_code), "rt", encoding="utf-8") as f:
+            return json.load(f)
+
+    def har_paths(self):
+        return sorted(glob.glob(os.path.join(self.har_dir, "*.har")))
+
+
+def replay_zip(record, extractor=None):
+    """Extract lại plan của một ZIP từ snapshot, theo đúng thứ tự ưu tiên của crawl_zip"""
+    from card_snapshot import CardSnapshot
+    from plan_api import plans_from_payloads
+    from plan_extractors import extract_plan_info_from_html, extract_plans_from_cards
+    from plan_identity import fallback_plan_id
+
+    zip_code = record["zip_code"]
+    if record.get("api_payloads"):
+        plans = plans_from_payloads(record["api_payloads"], zip_code)
+        if plans:
+            for plan_info in plans:
+                if not plan_info["plan_id"]:
+                    plan_info["plan_id"] = fallback_plan_id(plan_info["plan_name"], plan_info["plan_type"])
+            return plans
+    cards = [CardSnapshot.from_dict(card) for card in record.get("cards", [])]
+    return extract_plans_from_cards(cards, zip_code, extractor=extractor or extract_plan_info_from_html)
+
+
+def replay_archive(directory, zip_codes=None, extractor=None):
+    """Sinh (zip_code, plans) cho từng ZIP trong archive"""
+    archive = SnapshotArchive(directory)
+    for zip_code in zip_codes if zip_codes is not None else archive.zip_codes():
+        yield zip_code, replay_zip(archive.load(zip_code), extractor=extractor)
+
+
+def main(argv=None):
+    from crawl_metrics import configure_logging
+    from plan_extractors import extract_plan_info_from_html, extract_plan_info_from_text
+    from plan_identity import MEMBERSHIP_HEADERS, PlanCollector
+    from plan_sinks import CsvSink, open_sinks
+
+    parser = argparse.ArgumentParser(description="Extract lại plan offline từ archive snapshot")
+    parser.add_argument("archive", help="Thư mục archive (tạo bởi crawl --record)")
+    parser.add_argument("--zips", metavar="FILE", default=None,
+                        help="Chỉ extract các ZIP trong FILE ('-' = stdin); mặc định mọi ZIP trong archive")
+    parser.add_argument("--extractor", choices=["html", "text"], default="html")
+    parser.add_argument("-o", "--output", default=None, help="Tên file kết quả (không đuôi)")
+    parser.add_argument("--formats", default="csv,jsonl")
+    parser.add_argument("-v", "--verbose", action="store_true", help="In log extract của từng card")
+    args = parser.parse_args(argv)
+    # Log extract từng card chỉ in khi --verbose
+    configure_logging("debug" if args.verbose else "warning")
+
+    extractor = extract_plan_info_from_html if args.extractor == "html" else extract_plan_info_from_text
+    output = args.output or os.path.join(args.archive, f"replay_{args.extractor}")
+    sink = open_sinks(output, [f.strip() for f in args.formats.split(",") if f.strip()])
+    membership_sink = CsvSink(f"{output}_zip_plans.csv", fieldnames=MEMBERSHIP_HEADERS)
+
+    collector = PlanCollector(sink, membership_sink)
+    started = time.monotonic()
+    n_zips = 0
+    zip_codes = None
+    if args.zips:
+        from zip_planner import read_zip_codes
+        available = set(SnapshotArchive(args.archive).zip_codes())
+        zip_codes = read_zip_codes(args.zips)
+        missing = [z for z in zip_codes if z not in available]
+        if missing:
+            print(f"⚠ {len(missing)} ZIP không có trong archive: {', '.join(missing[:10])}")
+        zip_codes = [z for z in zip_codes if z in available]
+    for zip_code, plans in replay_archive(args.archive, zip_codes=zip_codes, extractor=extractor):
+        collector.add_zip(zip_code, plans)
+        n_zips += 1
+    sink.close()
+    membership_sink.close()
+    print(f"✅ Replay {n_zips} ZIP -> {collector.total} plans trong {time.monotonic() - started:.2f}s: "
+          f"{', '.join(sink.paths)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Chặn request không cần cho việc lấy plan (ảnh, font, video, tracker) bằng page/context.route.
+
+Policy chặn theo resource type và theo domain (blocklist), hoặc chỉ cho phép một
+số domain (allowlist). RouteStats đếm số request bị chặn và ước lượng số byte tiết
+kiệm được cho cả lần chạy.
+"""
+from collections import Counter
+from urllib.parse import urlsplit
+
+DEFAULT_BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+
+# Analytics / tag manager / quảng cáo thường gặp trên uhc.com
+DEFAULT_BLOCKED_DOMAINS = {
+    "googletagmanager.com",
+    "google-analytics.com",
+    "analytics.google.com",
+    "doubleclick.net",
+    "googleadservices.com",
+    "googlesyndication.com",
+    "facebook.net",
+    "facebook.com",
+    "bat.bing.com",
+    "clarity.ms",
+    "hotjar.com",
+    "adobedtm.com",
+    "demdex.net",
+    "omtrdc.net",
+    "everesttech.net",
+    "quantummetric.com",
+    "nr-data.net",
+    "newrelic.com",
+    "tiktok.com",
+    "linkedin.com",
+    "licdn.com",
+    "pinterest.com",
+    "twitter.com",
+    "t.co",
+    "youtube.com",
+    "ytimg.com",
+    "qualtrics.com",
+    "medallia.com",
+    "onetrust.com",
+    "cookielaw.org",
+}
+
+# Kích thước ước lượng (byte) theo resource type khi chưa thấy response thật nào cùng loại
+DEFAULT_SIZE_ESTIMATES = {
+    "image": 40_000,
+    "font": 30_000,
+    "media": 500_000,
+    "script": 60_000,
+    "stylesheet": 30_000,
+    "xhr": 5_000,
+    "fetch": 5_000,
+}
+_FALLBACK_SIZE_ESTIMATE = 10_000
+
+
+def _domain_matches(host, domains):
+    """host khớp một domain trong tập (chính nó hoặc subdomain)"""
+    if not host:
+        return False
+    labels = host.lower().split(".")
+    for i in range(len(labels)):
+        if ".".join(labels[i:]) in domains:
+            return True
+    return False
+
+
+class RouteStats:
+    """Bộ đếm request chặn/cho qua và byte ước lượng tiết kiệm được"""
+
+    def __init__(self, size_estimates=None):
+        self.size_estimates = dict(DEFAULT_SIZE_ESTIMATES, **(size_estimates or {}))
+        self.blocked = 0
+        self.allowed = 0
+        self.blocked_by_type = Counter()
+        self.blocked_by_domain = Counter()
+        self.bytes_saved = 0
+        self.bytes_loaded = 0
+        self._seen_bytes = Counter()
+        self._seen_count = Counter()
+
+    def _estimate(self, resource_type):
+        if self._seen_count[resource_type]:
+            return self._seen_bytes[resource_type] // self._seen_count[resource_type]
+        return self.size_estimates.get(resource_type, _FALLBACK_SIZE_ESTIMATE)
+
+    def record_blocked(self, resource_type, host):
+        self.blocked += 1
+        self.blocked_by_type[resource_type] += 1
+        self.blocked_by_domain[host] += 1
+        self.bytes_saved += self._estimate(resource_type)
+
+    def record_allowed(self):
+        self.allowed += 1
+
+    def record_response(self, response):
+        """Ghi kích thước response thật (theo content-length) để ước lượng sát hơn"""
+        try:
+            size = int(response.headers.get("content-length") or 0)
+        except ValueError:
+            return
+        if size <= 0:
+            return
+        resource_type = response.request.resource_type
+        self.bytes_loaded += size
+        self._seen_bytes[resource_type] += size
+        self._seen_count[resource_type] += 1
+
+    def summary(self):
+        return {
+            "blocked": self.blocked,
+            "allowed": self.allowed,
+            "bytes_saved_estimate": self.bytes_saved,
+            "bytes_loaded": self.bytes_loaded,
+            "blocked_by_type": dict(self.blocked_by_type),
+            "top_blocked_domains": dict(self.blocked_by_domain.most_common(10)),
+        }
+
+    def format_summary(self):
+        return (f"chặn {self.blocked} request (~{self.bytes_saved / 1_000_000:.1f} MB tiết kiệm), "
+                f"cho qua {self.allowed} request ({self.bytes_loaded / 1_000_000:.1f} MB), "
+                f"theo loại: {dict(self.blocked_by_type)}")
+
+
+class RoutePolicy:
+    """Quyết định chặn hay cho qua từng request.
+
+    - blocked_types: resource type bị chặn (image, font, media, ...)
+    - blocked_domains: domain bị chặn (gồm cả subdomain)
+    - allowed_domains: nếu có, chỉ domain trong danh sách này được đi qua
+    """
+
+    def __init__(self, blocked_types=None, blocked_domains=None, allowed_domains=None, stats=None):
+        self.blocked_types = set(DEFAULT_BLOCKED_RESOURCE_TYPES if blocked_types is None else blocked_types)
+        self.blocked_domains = {d.lower() for d in (DEFAULT_BLOCKED_DOMAINS if blocked_domains is None else blocked_domains)}
+        self.allowed_domains = {d.lower() for d in allowed_domains} if allowed_domains else None
+        self.stats = stats if stats is not None else RouteStats()
+
+    def should_block(self, resource_type, host):
+        if resource_type in self.blocked_types:
+            return True
+        if self.allowed_domains is not None:
+            return not _domain_matches(host, self.allowed_domains)
+        return _domain_matches(host, self.blocked_domains)
+
+    async def _handle(self, route, request):
+        host = urlsplit(request.url).hostname or ""
+        if self.should_block(request.resource_type, host):
+            self.stats.record_blocked(request.resource_type, host)
+            await route.abort()
+            return
+        self.stats.record_allowed()
+        # fallback thay vì continue_: nhường cho route đăng ký trước (vd. route_from_har khi
+        # --replay-har), không có route nào khác thì request đi ra mạng như bình thường
+        await route.fallback()
+
+    async def install(self, target):
+        """Gắn policy vào một BrowserContext (hoặc Page)"""
+        await target.route("**/*", self._handle)
+        target.on("response", self.stats.record_response)
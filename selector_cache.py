@@ -0,0 +1,134 @@
+"""Chọn selector trong chuỗi fallback theo vai trò (popup, ô ZIP, nút submit, plan card).
+
+Mỗi vai trò có một chuỗi selector xếp theo thứ tự ưu tiên. Selector thắng lần trước
+được thử đầu tiên ở ZIP sau, và cả chuỗi được kiểm tra trong MỘT lần evaluate trong
+page (trả về selector đầu tiên match) thay vì mỗi selector một round trip. Selector
+riêng của Playwright (`:has-text(...)`) không chạy được bằng querySelector nên được
+probe bằng locator, chỉ khi nó đứng trước selector CSS match đầu tiên.
+
+Layout đổi (selector thắng không còn match) chỉ tốn thêm đúng lần evaluate đó: chuỗi
+còn lại vẫn được kiểm tra trong cùng một query. Thống kê hit/miss theo selector cho
+thấy selector nào đã chết.
+"""
+from collections import Counter
+
+from crawl_metrics import log
+
+# "visible": như locator.first.is_visible() (element match đầu tiên có kích thước và không hidden)
+# "attached": có ít nhất một element match
+RESOLVE_CHAIN_JS = """
+([selectors, mode]) => {
+    const unsupported = [];
+    for (let i = 0; i < selectors.length; i++) {
+        let el;
+        try {
+            el = document.querySelector(selectors[i]);
+        } catch (e) {
+            unsupported.push(i);
+            continue;
+        }
+        if (!el) continue;
+        if (mode === 'attached') return {index: i, unsupported};
+        const rect = el.getBoundingClientRect();
+        if (rect.width > 0 && rect.height > 0 && getComputedStyle(el).visibility !== 'hidden') {
+            return {index: i, unsupported};
+        }
+    }
+    return {index: -1, unsupported};
+}
+"""
+
+
+class SelectorResolver:
+    """Nhớ selector thắng của từng vai trò (dùng chung cho mọi worker) và thống kê hit/miss.
+
+    `chains`: dict vai trò -> (mode, list selector theo thứ tự ưu tiên).
+    """
+
+    def __init__(self, chains):
+        self.chains = {role: (mode, list(selectors)) for role, (mode, selectors) in chains.items()}
+        self.winners = {}
+        self.unsupported = set()
+        self.hits = Counter()
+        self.misses = Counter()
+        self.queries = 0
+
+    def ordered(self, role):
+        """Chuỗi selector của vai trò, selector thắng lần trước đứng đầu"""
+        _, selectors = self.chains[role]
+        winner = self.winners.get(role)
+        if winner is None:
+            return list(selectors)
+        return [winner] + [s for s in selectors if s != winner]
+
+    async def _probe(self, page, selector, mode):
+        """Kiểm tra một selector bằng locator (selector riêng của Playwright)"""
+        self.queries += 1
+        try:
+            if mode == "attached":
+                return await page.locator(selector).count() > 0
+            return await page.locator(selector).first.is_visible()
+        except Exception:
+            return False
+
+    async def resolve(self, page, role):
+        """Selector đầu tiên (theo thứ tự ưu tiên) đang match trên page, None nếu không có"""
+        mode, _ = self.chains[role]
+        order = self.ordered(role)
+        tried = []
+        found = None
+
+        # Selector thắng là loại Playwright-only: probe riêng trước, trúng thì khỏi evaluate
+        if order[0] in self.unsupported and role in self.winners:
+            tried.append(order[0])
+            if await self._probe(page, order[0], mode):
+                found = order[0]
+            order = order[1:]
+
+        if found is None and order:
+            self.queries += 1
+            try:
+                result = await page.evaluate(RESOLVE_CHAIN_JS, [order, mode])
+                index, unsupported = result["index"], result["unsupported"]
+            except Exception:
+                # Page đang navigate...: probe lần lượt như cũ
+                index, unsupported = -1, list(range(len(order)))
+            self.unsupported.update(order[i] for i in unsupported)
+            # Selector Playwright-only đứng trước selector CSS trúng vẫn được ưu tiên
+            for i in unsupported:
+                if index >= 0 and i > index:
+                    break
+                if await self._probe(page, order[i], mode):
+                    index = i
+                    break
+            tried += order if index < 0 else order[:index + 1]
+            if index >= 0:
+                found = order[index]
+
+        for selector in tried:
+            if selector == found:
+                self.hits[(role, selector)] += 1
+            else:
+                self.misses[(role, selector)] += 1
+        if found is not None:
+            if self.winners.get(role) != found:
+                log.debug("   → Selector %s: %s", role, found)
+            self.winners[role] = found
+        return found
+
+    def dead_selectors(self):
+        """Các selector đã được thử nhưng chưa match lần nào"""
+        return [(role, selector) for (role, selector) in self.misses if not self.hits[(role, selector)]]
+
+    def summary(self):
+        return {
+            "queries": self.queries,
+            "winners": dict(self.winners),
+            "hits": {f"{role}: {selector}": n for (role, selector), n in self.hits.items()},
+            "dead": [f"{role}: {selector}" for role, selector in self.dead_selectors()],
+        }
+
+    def format_summary(self):
+        winners = ", ".join(f"{role} = {selector}" for role, selector in self.winners.items())
+        dead = len(self.dead_selectors())
+        return f"{self.queries} query, thắng: {winners or '-'}; {dead} selector chưa match lần nào"
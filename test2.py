@@ -1,397 +1,45 @@
-from playwright.sync_api import sync_playwright
+import asyncio
+import argparse
+import functools
+import logging
+import re
 import time
 import csv
 import json
 from datetime import datetime
-import re
+from urllib.parse import urlsplit
+
+from browser_session import BrowserSession, launch_browser
+from change_tracker import DEFAULT_CHANGES_DB, ChangeTracker
+from crawl_metrics import LOG_LEVELS, CrawlMetrics, ZipMetrics, configure_logging, log, response_bytes
+from deep_link import DeepLinkNavigator
+from extract_cache import DEFAULT_EXTRACT_CACHE, DEFAULT_MAX_ENTRIES, ExtractCache
+from extract_pipeline import DEFAULT_EXTRACT_WORKERS, CardBatch, ExtractPipeline
+from job_scheduler import DEFAULT_MAX_ATTEMPTS, DEFAULT_RATE_PER_HOST, CrawlError, JobScheduler
+from pagination import CardHarvester
+from plan_api import PlanResponseCollector
+from plan_extractors import extract_plan_info_from_html, extract_plans_from_cards
+from plan_identity import MEMBERSHIP_HEADERS, PlanCollector, fallback_plan_id
+from plan_sinks import CSV_HEADERS, CsvSink, JsonlSink, open_sinks
+from plan_warehouse import DEFAULT_WAREHOUSE_DIR, PlanWarehouse, format_report
+from progress_store import ProgressStore
+from readiness import PageReadiness, format_waits
+from replay import SnapshotArchive
+from request_routing import DEFAULT_BLOCKED_RESOURCE_TYPES, RoutePolicy
+from selector_cache import SelectorResolver
+from zip_planner import DEFAULT_SAMPLES_PER_COUNTY, DEFAULT_TTL_DAYS, PlanSetCache, ZipPlanner, load_crosswalk, read_zip_codes
 
 # Danh sách ZIP codes cần thử
 zip_codes = ["91101", "90001", "10001", "94102", "33101"]
 
 
-def extract_plan_info_from_html(plan_element, zip_code):
-    try:
-        html = plan_element.inner_html()
-        text = plan_element.inner_text()
-        
-        plan_info = {
-            "zip_code": zip_code,
-            "plan_id": "",
-            "plan_name": "",
-            "plan_type": "",
-            "monthly_premium": "",
-            "pcp_copay": "",
-            "out_of_pocket_max": "",
-            "deductible": "",
-            "specialist_copay": "",
-            "emergency_copay": "",
-            "inpatient_hospital": "",
-            "tier1_generic_copay": "",
-            "services_benefits": ""
-        }
-
-        # Plan ID
-        plan_id = plan_element.get_attribute("data-planid") or plan_element.get_attribute("data-plan-id")
-        if not plan_id:
-            plan_id_match = re.search(r'data-planid="([^"]+)"', html)
-            if plan_id_match:
-                plan_id = plan_id_match.group(1)
-        if not plan_id:
-            plan_id = f"{zip_code}_{int(time.time() * 1000) % 100000}"
-        plan_info["plan_id"] = plan_id
-
-        # Plan Type
-        if "bg-pastel-aqua" in html:
-            plan_info["plan_type"] = "MA"
-        elif "bg-pastel-mint" in html:
-            plan_info["plan_type"] = "Medicare Supplement"
-        elif "bg-pastel-lavender" in html:
-            plan_info["plan_type"] = "PDP"
-        else:
-            plan_info["plan_type"] = "Unknown"
-
-        # Plan Name (tên nằm đầu text, thường dùng được regex)
-        name_match = re.search(r'^([A-Z][^\n$]+)', text)
-        if name_match:
-            plan_info["plan_name"] = name_match.group(1).strip()
-
-        # Monthly Premium
-        premium_match = re.search(r'class="monthly-premium[^"]*".*?<span>\$([\d,.]+)</span>', html)
-        if not premium_match:
-            premium_match = re.search(r'\$([\d,.]+)[^<]{0,20}(?:monthly|premium)', text, re.IGNORECASE)
-        if premium_match:
-            plan_info["monthly_premium"] = f"${premium_match.group(1)}"
-
-        # Out-of-pocket Max
-        oop_match = re.search(r'(Out[- ]?of[- ]?pocket[^$:\n]*)(?:\$|</span><span>)\$?([\d,]+)', html)
-        if oop_match:
-            plan_info["out_of_pocket_max"] = f"${oop_match.group(2)}"
-        elif "oop-premium-value" in html:
-            oop_html_match = re.search(r'class="oop-premium-value[^"]*">\$?([\w]+)', html)
-            if oop_html_match:
-                plan_info["out_of_pocket_max"] = oop_html_match.group(1)
-
-        # PCP Copay
-        pcp_match = re.search(r'(?:PCP|Primary care)[^$:\n]*\$?(\d+(?:\.\d{2})?)', text, re.IGNORECASE)
-        if pcp_match:
-            plan_info["pcp_copay"] = f"${pcp_match.group(1)}"
-
-        # Specialist Copay
-        specialist_match = re.search(r'Specialist[^$\n]*\$?(\d+(?:\.\d{2})?)', text, re.IGNORECASE)
-        if specialist_match:
-            plan_info["specialist_copay"] = f"${specialist_match.group(1)}"
-
-        # Emergency Copay
-        emergency_match = re.search(r'(?:Emergency|ER)[^$\n]*\$?(\d+(?:\.\d{2})?)', text, re.IGNORECASE)
-        if emergency_match:
-            plan_info["emergency_copay"] = f"${emergency_match.group(1)}"
-
-        # Inpatient Hospital
-        inpatient_match = re.search(r'(Inpatient|Hospital)[^$\n]*\$?(\d+(?:\.\d{2})?)', text, re.IGNORECASE)
-        if inpatient_match:
-            plan_info["inpatient_hospital"] = f"${inpatient_match.group(2)}"
-
-        # Deductible
-        deductible_match = re.search(r'(Deductible)[^$\n]*\$?([\d,]+)', text, re.IGNORECASE)
-        if deductible_match:
-            plan_info["deductible"] = f"${deductible_match.group(2)}"
-
-        # Tier 1 Generic (for PDP)
-        tier1_match = re.search(r'Tier\s*1[^$\n]*\$?(\d+(?:\.\d{2})?)', text)
-        if not tier1_match:
-            tier1_match = re.search(r'Preferred Generic[^$\n]*\$?(\d+(?:\.\d{2})?)', text)
-        if tier1_match:
-            plan_info["tier1_generic_copay"] = f"${tier1_match.group(1)}"
-
-        # Services / Benefits (thô sơ từ text, chưa phân tích icon)
-        benefits_keywords = ['dental', 'vision', 'hearing', 'wellness', 'fitness', 'transportation', 'prescription', 'allowance']
-        found_benefits = [word for word in benefits_keywords if word in text.lower()]
-        plan_info["services_benefits"] = " | ".join(set(found_benefits))
-
-        print(f"✅ Extracted: {plan_info['plan_name']} ({plan_info['plan_type']}) - Premium: {plan_info['monthly_premium']}")
-        return plan_info
-
-    except Exception as e:
-        print(f"❌ Error extracting plan info: {e}")
-        return None
-
-
-def extract_plan_info_from_text(plan_element, zip_code):
-    """Trích xuất thông tin từ toàn bộ text content của plan card"""
-    try:
-        plan_info = {
-            "zip_code": zip_code,
-            "plan_id": "",
-            "plan_name": "",
-            "plan_type": "",
-            "monthly_premium": "",
-            "pcp_copay": "",
-            "out_of_pocket_max": "",
-            "deductible": "",
-            "specialist_copay": "",
-            "emergency_copay": "",
-            "inpatient_hospital": "",
-            "tier1_generic_copay": "",
-            "services_benefits": ""
-        }
-        
-        # Lấy toàn bộ text content từ plan card
-        full_text = plan_element.inner_text()
-        print(f"   → Full text preview: {full_text[:200]}...")
-        
-        # Lấy HTML để phân tích cấu trúc nếu cần
-        html_content = plan_element.inner_html()
-        
-        # 1. Lấy Plan ID từ attributes
-        plan_id = plan_element.get_attribute("id")
-        if plan_id and "plan-card-" in plan_id:
-            plan_info["plan_id"] = plan_id.replace("plan-card-", "")
-        else:
-            # Thử lấy từ data attributes
-            data_plan_id = plan_element.get_attribute("data-plan-id")
-            if data_plan_id:
-                plan_info["plan_id"] = data_plan_id
-            else:
-                # Tạo ID từ tên plan nếu không có
-                plan_name_match = re.search(r'^([A-Z][^$\n]+?)(?:\s*\$|\n)', full_text, re.MULTILINE)
-                if plan_name_match:
-                    plan_info["plan_id"] = re.sub(r'[^\w\s-]', '', plan_name_match.group(1))[:50]
-        
-        # 2. Xác định loại plan từ text
-        text_lower = full_text.lower()
-        if any(keyword in text_lower for keyword in ['prescription drug', 'pdp', 'drug plan']):
-            plan_info["plan_type"] = "PDP"
-        elif any(keyword in text_lower for keyword in ['medicare advantage', 'ma plan', 'hmo', 'ppo']):
-            plan_info["plan_type"] = "MA"
-        elif any(keyword in text_lower for keyword in ['supplement', 'medigap']):
-            plan_info["plan_type"] = "Medicare Supplement"
-        elif any(keyword in text_lower for keyword in ['special needs', 'snp']):
-            plan_info["plan_type"] = "SNP"
-        else:
-            plan_info["plan_type"] = "Unknown"
-        
-        # 3. Lấy tên plan - thường ở đầu text
-        name_patterns = [
-            r'^([A-Z][^$\n]+?)(?:\s*\$|\n)',  # Tên plan ở đầu, kết thúc bằng $ hoặc xuống dòng
-            r'([A-Z][^$\n]*(?:Plan|HMO|PPO|PDP)[^$\n]*)',  # Tên có chứa Plan, HMO, PPO, PDP
-            r'([A-Z][A-Za-z\s&-]+(?:Medicare|Advantage|Supplement)[A-Za-z\s&-]*)',  # Tên có chứa Medicare keywords
-        ]
-        
-        for pattern in name_patterns:
-            match = re.search(pattern, full_text, re.MULTILINE)
-            if match:
-                plan_name = match.group(1).strip()
-                if len(plan_name) > 5 and not any(char.isdigit() for char in plan_name[:3]):
-                    plan_info["plan_name"] = plan_name
-                    break
-        
-        # 4. Lấy Monthly Premium
-        premium_patterns = [
-            r'\$(\d+(?:\.\d{2})?)\s*(?:per\s*month|monthly|\/month|\smo)',
-            r'Monthly\s*Premium[:\s]*\$(\d+(?:\.\d{2})?)',
-            r'Premium[:\s]*\$(\d+(?:\.\d{2})?)',
-            r'\$(\d+(?:\.\d{2})?)\s*(?:premium|monthly premium)',
-            r'\$(\d+(?:\.\d{2})?)\s*per\s*month',
-            r'(\$\d+(?:\.\d{2})?)\s*monthly'
-        ]
-        
-        for pattern in premium_patterns:
-            match = re.search(pattern, full_text, re.IGNORECASE)
-            if match:
-                if match.group(1).startswith('$'):
-                    plan_info["monthly_premium"] = match.group(1)
-                else:
-                    plan_info["monthly_premium"] = f"${match.group(1)}"
-                break
-        
-        # 5. Lấy Out-of-Pocket Maximum
-        oop_patterns = [
-            r'Out[- ]of[- ]pocket[^$\n]*\$([0-9,]+)',
-            r'Maximum[^$\n]*out[^$\n]*pocket[^$\n]*\$([0-9,]+)',
-            r'Annual[^$\n]*out[^$\n]*pocket[^$\n]*\$([0-9,]+)',
-            r'OOP[^$\n]*\$([0-9,]+)',
-            r'\$([0-9,]+)[^$\n]*out[- ]of[- ]pocket',
-            r'(\$[0-9,]+)[^$\n]*(?:maximum|max)[^$\n]*(?:out[- ]of[- ]pocket|oop)'
-        ]
-        
-        for pattern in oop_patterns:
-            match = re.search(pattern, full_text, re.IGNORECASE)
-            if match:
-                oop_value = match.group(1)
-                if not oop_value.startswith('$'):
-                    oop_value = f"${oop_value}"
-                plan_info["out_of_pocket_max"] = oop_value
-                break
-        
-        # 6. Lấy PCP Copay
-        pcp_patterns = [
-            r'Primary\s*care[^$\n]*\$(\d+(?:\.\d{2})?)',
-            r'PCP[^$\n]*\$(\d+(?:\.\d{2})?)',
-            r'Doctor[^$\n]*visit[^$\n]*\$(\d+(?:\.\d{2})?)',
-            r'Office[^$\n]*visit[^$\n]*\$(\d+(?:\.\d{2})?)',
-            r'\$(\d+(?:\.\d{2})?)[^$\n]*(?:primary care|pcp|doctor visit)',
-            r'(\$\d+(?:\.\d{2})?)[^$\n]*copay[^$\n]*(?:primary|pcp|doctor)'
-        ]
-        
-        for pattern in pcp_patterns:
-            match = re.search(pattern, full_text, re.IGNORECASE)
-            if match:
-                pcp_value = match.group(1)
-                if not pcp_value.startswith('$'):
-                    pcp_value = f"${pcp_value}"
-                plan_info["pcp_copay"] = pcp_value
-                break
-        
-        # 7. Lấy Specialist Copay
-        specialist_patterns = [
-            r'Specialist[^$\n]*\$(\d+(?:\.\d{2})?)',
-            r'\$(\d+(?:\.\d{2})?)[^$\n]*specialist',
-            r'(\$\d+(?:\.\d{2})?)[^$\n]*specialist[^$\n]*(?:copay|visit)'
-        ]
-        
-        for pattern in specialist_patterns:
-            match = re.search(pattern, full_text, re.IGNORECASE)
-            if match:
-                specialist_value = match.group(1)
-                if not specialist_value.startswith('$'):
-                    specialist_value = f"${specialist_value}"
-                plan_info["specialist_copay"] = specialist_value
-                break
-        
-        # 8. Lấy Emergency Copay
-        emergency_patterns = [
-            r'Emergency[^$\n]*\$(\d+(?:\.\d{2})?)',
-            r'ER[^$\n]*\$(\d+(?:\.\d{2})?)',
-            r'\$(\d+(?:\.\d{2})?)[^$\n]*emergency',
-            r'(\$\d+(?:\.\d{2})?)[^$\n]*emergency[^$\n]*(?:copay|visit)'
-        ]
-        
-        for pattern in emergency_patterns:
-            match = re.search(pattern, full_text, re.IGNORECASE)
-            if match:
-                emergency_value = match.group(1)
-                if not emergency_value.startswith('$'):
-                    emergency_value = f"${emergency_value}"
-                plan_info["emergency_copay"] = emergency_value
-                break
-        
-        # 9. Lấy Inpatient Hospital
-        inpatient_patterns = [
-            r'Inpatient[^$\n]*hospital[^$\n]*\$(\d+(?:\.\d{2})?)',
-            r'Hospital[^$\n]*stay[^$\n]*\$(\d+(?:\.\d{2})?)',
-            r'\$(\d+(?:\.\d{2})?)[^$\n]*(?:inpatient|hospital stay)',
-            r'(\$\d+(?:\.\d{2})?)[^$\n]*(?:per day|daily)[^$\n]*hospital'
-        ]
-        
-        for pattern in inpatient_patterns:
-            match = re.search(pattern, full_text, re.IGNORECASE)
-            if match:
-                inpatient_value = match.group(1)
-                if not inpatient_value.startswith('$'):
-                    inpatient_value = f"${inpatient_value}"
-                plan_info["inpatient_hospital"] = inpatient_value
-                break
-        
-        # 10. Lấy Deductible
-        deductible_patterns = [
-            r'Deductible[^$\n]*\$([0-9,]+)',
-            r'Annual[^$\n]*deductible[^$\n]*\$([0-9,]+)',
-            r'\$([0-9,]+)[^$\n]*deductible',
-            r'(\$[0-9,]+)[^$\n]*annual[^$\n]*deductible'
-        ]
-        
-        for pattern in deductible_patterns:
-            match = re.search(pattern, full_text, re.IGNORECASE)
-            if match:
-                deductible_value = match.group(1)
-                if not deductible_value.startswith('$'):
-                    deductible_value = f"${deductible_value}"
-                plan_info["deductible"] = deductible_value
-                break
-        
-        # 11. Lấy Tier 1 Generic Copay (for PDP plans)
-        tier1_patterns = [
-            r'Tier\s*1[^$\n]*\$(\d+(?:\.\d{2})?)',
-            r'Generic[^$\n]*\$(\d+(?:\.\d{2})?)',
-            r'Preferred[^$\n]*generic[^$\n]*\$(\d+(?:\.\d{2})?)',
-            r'\$(\d+(?:\.\d{2})?)[^$\n]*(?:tier 1|generic|preferred generic)',
-            r'(\$\d+(?:\.\d{2})?)[^$\n]*copay[^$\n]*(?:tier 1|generic)'
-        ]
-        
-        for pattern in tier1_patterns:
-            match = re.search(pattern, full_text, re.IGNORECASE)
-            if match:
-                tier1_value = match.group(1)
-                if not tier1_value.startswith('$'):
-                    tier1_value = f"${tier1_value}"
-                plan_info["tier1_generic_copay"] = tier1_value
-                break
-        
-        # 12. Lấy Services & Benefits
-        benefits_list = []
-        
-        # Tìm các benefits thường gặp
-        benefit_patterns = [
-            r'(Dental[^.\n]*(?:coverage|benefit|included)[^.\n]*)',
-            r'(Vision[^.\n]*(?:coverage|benefit|included)[^.\n]*)',
-            r'(Hearing[^.\n]*(?:coverage|benefit|included)[^.\n]*)',
-            r'(Wellness[^.\n]*(?:program|benefit|included)[^.\n]*)',
-            r'(Fitness[^.\n]*(?:program|benefit|included)[^.\n]*)',
-            r'(Transportation[^.\n]*(?:benefit|included)[^.\n]*)',
-            r'(Prescription[^.\n]*(?:coverage|benefit|included)[^.\n]*)',
-            r'(Medicare[^.\n]*(?:Part A|Part B|Part D)[^.\n]*)',
-            r'(\$\d+[^.\n]*(?:allowance|credit|benefit)[^.\n]*)',
-            r'([A-Z][^.\n]*(?:included|covered|benefit)[^.\n]*)'
-        ]
-        
-        for pattern in benefit_patterns:
-            matches = re.findall(pattern, full_text, re.IGNORECASE)
-            for match in matches:
-                benefit_text = match.strip()
-                if (len(benefit_text) > 10 and 
-                    benefit_text not in benefits_list and 
-                    any(keyword in benefit_text.lower() for keyword in ['dental', 'vision', 'hearing', 'wellness', 'fitness', 'transportation', 'prescription', 'allowance', 'credit', 'included', 'covered'])):
-                    benefits_list.append(benefit_text)
-        
-        # Gộp benefits thành chuỗi
-        if benefits_list:
-            plan_info["services_benefits"] = " | ".join(benefits_list[:5])  # Chỉ lấy 5 benefits đầu
-        
-        # Debug: In ra thông tin đã trích xuất
-        print(f"     → Plan ID: {plan_info['plan_id']}")
-        print(f"     → Name: {plan_info['plan_name']}")
-        print(f"     → Type: {plan_info['plan_type']}")
-        print(f"     → Premium: {plan_info['monthly_premium']}")
-        print(f"     → PCP: {plan_info['pcp_copay']}")
-        print(f"     → OOP Max: {plan_info['out_of_pocket_max']}")
-        
-        return plan_info
-        
-    except Exception as e:
-        print(f"   → Lỗi extract plan info: {e}")
-        return None
-
 def save_to_csv(all_plans_data, filename="uhc_medicare_plans_text_extraction.csv"):
     """Lưu dữ liệu vào file CSV"""
     if not all_plans_data:
         print("Không có dữ liệu để lưu")
         return
     
-    headers = [
-        "zip_code",
-        "plan_type", 
-        "plan_id",
-        "plan_name",
-        "monthly_premium",
-        "pcp_copay",
-        "out_of_pocket_max",
-        "deductible",
-        "specialist_copay",
-        "emergency_copay",
-        "inpatient_hospital",
-        "tier1_generic_copay",
-        "services_benefits"
-    ]
+    headers = CSV_HEADERS
     
     with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
         writer = csv.DictWriter(csvfile, fieldnames=headers)
@@ -402,258 +50,650 @@ def save_to_csv(all_plans_data, filename="uhc_medicare_plans_text_extraction.csv
     
     print(f"✅ Đã lưu {len(all_plans_data)} plans vào {filename}")
 
-def main():
-    all_plans_data = []
+UHC_MEDICARE_URL = "https://www.uhc.com/medicare"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+
+# CSS (không dùng selector riêng của Playwright) để chờ trong trang
+ZIP_INPUT_CSS = '#zipcodemeded-0, input[name="zipcodemeded-0"], input[placeholder*="ZIP"], input[type="tel"], input[maxlength="5"]'
+# Thời gian tối đa chờ JSON plan sau khi vào trang kết quả, hết thì dùng DOM
+API_PLANS_TIMEOUT_MS = 8000
+
+# Thay context của worker sau từng này ZIP để bộ nhớ Chromium không tăng dần
+RECYCLE_AFTER_ZIPS = 50
+
+# Chuỗi selector fallback theo vai trò: (mode, selector theo thứ tự ưu tiên), xem selector_cache
+SELECTOR_CHAINS = {
+    "popup_close": ("visible", [
+        '[aria-label="Close"]',
+        '.close',
+        '.modal-close',
+        'button:has-text("Close")',
+        'button:has-text("×")'
+    ]),
+    "zip_input": ("visible", [
+        "#zipcodemeded-0",
+        'input[name="zipcodemeded-0"]',
+        'input[placeholder*="ZIP"]',
+        'input[type="tel"]',
+        'input[maxlength="5"]'
+    ]),
+    "submit": ("visible", [
+        'button.uhc-zip-button-primary',
+        'button.uhc-zip-button',
+        'button:has-text("View plans")',
+        'button:has-text("View")',
+        'input[type="submit"]'
+    ]),
+    "plan_cards": ("attached", [
+        '[id*="plan-card-"]',
+        '.plan-card',
+        '[class*="plan-card"]',
+        '[data-plan-id]',
+        '[aria-label*="plan"]',
+        'div[class*="card"]:has-text("$")',  # Div có class chứa "card" và có text "$"
+        'article',
+        'section[class*="plan"]'
+    ]),
+    "load_more": ("visible", [
+        'button:has-text("Load more")',
+        'button:has-text("Show more")',
+        'button:has-text("View more")',
+        '.load-more',
+        '.show-more'
+    ]),
+}
+
+# Selector đếm card khi chờ trang kết quả đứng yên: đúng chuỗi "plan_cards" mà extractor dùng
+# (trang chỉ có card kiểu fallback không phải chờ hết timeout), bỏ `:has-text(...)` của
+# Playwright để đếm được bằng querySelectorAll
+PLAN_CARD_COUNT_SELECTORS = [re.sub(r':has-text\([^)]*\)', '', selector) for selector in SELECTOR_CHAINS["plan_cards"][1]]
+
+
+async def open_results_via_form(page, zip_code, readiness, collector=None, metrics=None, resolver=None):
+    """Vào homepage, nhập ZIP và bấm View plans; True nếu tới được trang kết quả"""
+    metrics = metrics or ZipMetrics(zip_code)
+    resolver = resolver or SelectorResolver(SELECTOR_CHAINS)
+    # Bước 1: Truy cập trang chính và nhập ZIP
+    log.info("1. Truy cập trang UHC Medicare...")
+    with metrics.stage("goto"):
+        await page.goto(UHC_MEDICARE_URL, timeout=60000)
+    # Chờ ô ZIP có trong DOM rồi network yên một chút (popup thường bật lên lúc này)
+    await readiness.selector_attached("homepage_ready", ZIP_INPUT_CSS)
+    await readiness.network_quiet("homepage_quiet")
     
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=False)
-        page = browser.new_page()
-        
-        # Thiết lập user agent
-        page.set_extra_http_headers({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        })
-
-        for zip_code in zip_codes:
-            try:
-                print(f"\n{'='*60}")
-                print(f"=== Xử lý ZIP code: {zip_code} ===")
-                print('='*60)
-                
-                # Bước 1: Truy cập trang chính và nhập ZIP
-                print("1. Truy cập trang UHC Medicare...")
-                page.goto("https://www.uhc.com/medicare", timeout=60000)
-                page.wait_for_load_state("networkidle", timeout=30000)
-                time.sleep(3)
-                
-                # Đóng popup nếu có
-                try:
-                    popup_selectors = [
-                        '[aria-label="Close"]',
-                        '.close',
-                        '.modal-close',
-                        'button:has-text("Close")',
-                        'button:has-text("×")'
-                    ]
-                    for selector in popup_selectors:
-                        try:
-                            popup_close = page.locator(selector).first
-                            if popup_close.is_visible():
-                                popup_close.click()
-                                time.sleep(1)
-                                break
-                        except:
-                            continue
-                except:
-                    pass
-                
-                # Nhập ZIP code
-                print("2. Nhập ZIP code...")
-                zip_selectors = [
-                    "#zipcodemeded-0",
-                    'input[name="zipcodemeded-0"]',
-                    'input[placeholder*="ZIP"]',
-                    'input[type="tel"]',
-                    'input[maxlength="5"]'
-                ]
-                
-                zip_input = None
-                for selector in zip_selectors:
-                    try:
-                        element = page.locator(selector).first
-                        if element.is_visible():
-                            zip_input = element
-                            break
-                    except:
-                        continue
-                
-                if not zip_input:
-                    print("❌ Không tìm thấy ô nhập ZIP")
-                    continue
-                
-                zip_input.clear()
-                zip_input.fill(zip_code)
-                time.sleep(1)
-                
-                # Click View Plans
-                print("3. Click View Plans...")
-                button_selectors = [
-                    'button.uhc-zip-button-primary',
-                    'button.uhc-zip-button',
-                    'button:has-text("View plans")',
-                    'button:has-text("View")',
-                    'input[type="submit"]'
-                ]
-                
-                submit_button = None
-                for selector in button_selectors:
-                    try:
-                        element = page.locator(selector).first
-                        if element.is_visible():
-                            submit_button = element
-                            break
-                    except:
-                        continue
-                
-                if not submit_button:
-                    print("❌ Không tìm thấy nút View Plans")
-                    continue
-                
-                submit_button.click()
-                
-                # Chờ navigation
-                print("4. Chờ trang kết quả...")
-                try:
-                    page.wait_for_function(
-                        "() => window.location.href.includes('plan-summary') || document.querySelector('[id*=\"plan-card-\"]') || document.querySelector('.plan-card')", 
-                        timeout=30000
-                    )
-                except:
-                    page.wait_for_load_state("networkidle", timeout=20000)
-                
-                time.sleep(5)
-                
-                # Bước 2: Tìm và extract tất cả plan cards
-                print("5. Tìm các plan cards...")
-                
-                # Thử nhiều selector để tìm plan cards
-                plan_card_selectors = [
-                    '[id*="plan-card-"]',
-                    '.plan-card',
-                    '[class*="plan-card"]',
-                    '[data-plan-id]',
-                    '[aria-label*="plan"]',
-                    'div[class*="card"]:has-text("$")',  # Div có class chứa "card" và có text "$"
-                    'article',
-                    'section[class*="plan"]'
-                ]
-                
-                plan_cards = []
-                for selector in plan_card_selectors:
-                    try:
-                        cards = page.locator(selector).all()
-                        if cards:
-                            plan_cards = cards
-                            print(f"   → Tìm thấy {len(cards)} plan cards bằng selector: {selector}")
-                            break
-                    except:
-                        continue
-                
-                if not plan_cards:
-                    print("❌ Không tìm thấy plan cards")
-                    # Debug: In ra HTML để kiểm tra
-                    print("Debug: In ra HTML structure...")
-                    body_html = page.locator('body').inner_html()
-                    print(f"HTML preview: {body_html[:1000]}...")
-                    continue
-                
-                # Extract thông tin từ mỗi plan card
-                for i, card in enumerate(plan_cards):
-                    try:
-                        print(f"\n   → Xử lý plan card {i+1}/{len(plan_cards)}")
-                        
-                        # Lấy toàn bộ text để debug
-                        card_text = card.inner_text()
-                        if len(card_text) < 50:  # Skip cards with too little content
-                            print(f"     ⚠ Skipping card with insufficient content: {card_text}")
-                            continue
-                        
-                        plan_info = extract_plan_info_from_html(card, zip_code)
-                        
-                        if plan_info and (plan_info["plan_id"] or plan_info["plan_name"]):
-                            # Tạo unique ID nếu chưa có
-                            if not plan_info["plan_id"]:
-                                plan_info["plan_id"] = f"{zip_code}_{i+1}"
-                            
-                            # Kiểm tra duplicate
-                            if not any(p["plan_id"] == plan_info["plan_id"] for p in all_plans_data):
-                                all_plans_data.append(plan_info)
-                                print(f"     ✓ Đã thêm: {plan_info['plan_name'][:50]}...")
-                            else:
-                                print(f"     ⚠ Duplicate plan ID: {plan_info['plan_id']}")
-                        else:
-                            print(f"     ✗ Không lấy được thông tin plan")
-                            
-                    except Exception as e:
-                        print(f"     ✗ Lỗi xử lý plan card {i+1}: {e}")
-                        continue
-                
-                # Thử scroll và load thêm plans
-                print("\n6. Thử scroll để load thêm plans...")
+    # Đóng popup nếu có
+    with metrics.stage("popup"):
+        try:
+            selector = await resolver.resolve(page, "popup_close")
+            if selector:
+                popup_close = page.locator(selector).first
+                await popup_close.click()
+                await readiness.hidden("popup_closed", popup_close)
+        except:
+            pass
+    
+    # Nhập ZIP code
+    log.info("2. Nhập ZIP code...")
+    with metrics.stage("zip_input"):
+        selector = await resolver.resolve(page, "zip_input")
+        if not selector:
+            log.warning("❌ Không tìm thấy ô nhập ZIP")
+            return False
+        
+        zip_input = page.locator(selector).first
+        await zip_input.clear()
+        await zip_input.fill(zip_code)
+    
+    # Click View Plans
+    log.info("3. Click View Plans...")
+    with metrics.stage("submit"):
+        selector = await resolver.resolve(page, "submit")
+        if not selector:
+            log.warning("❌ Không tìm thấy nút View Plans")
+            return False
+        submit_button = page.locator(selector).first
+        
+        # Nghe response JSON của trang kết quả trước khi submit để không lỡ request đầu
+        if collector is not None:
+            collector.start()
+        await submit_button.click()
+    
+    # Chờ navigation
+    log.info("4. Chờ trang kết quả...")
+    with metrics.stage("results_navigation"):
+        try:
+            await page.wait_for_function(
+                "() => window.location.href.includes('plan-summary') || document.querySelector('[id*=\"plan-card-\"]') || document.querySelector('.plan-card')", 
+                timeout=30000
+            )
+        except:
+            await page.wait_for_load_state("networkidle", timeout=20000)
+    return True
+
+
+async def crawl_zip(page, zip_code, readiness=None, capture_api=True, navigator=None, recorder=None, metrics=None,
+                    resolver=None, changes=None, defer_extract=False, cache=None):
+    """Chạy toàn bộ flow cho một ZIP trên page đã mở, trả về list plan_info theo thứ tự card.
+
+    Nếu `navigator` (DeepLinkNavigator) đã học được URL kết quả thì mở thẳng URL đó,
+    hỏng mới quay lại form; lần submit form thành công đầu tiên dạy URL cho navigator.
+    Nếu có `recorder` (replay.SnapshotArchive) thì dữ liệu thô của ZIP được lưu lại.
+    Thời gian từng bước và các counter được ghi vào `metrics` (ZipMetrics). `resolver`
+    (SelectorResolver) nhớ selector nào thắng để ZIP sau thử nó trước. Với `changes`
+    (ChangeTracker), card không đổi so với lần chạy trước không phải extract lại; với
+    `cache` (ExtractCache), card đã gặp ở ZIP khác lấy kết quả từ cache. Với `defer_extract`, card DOM không được extract ở đây mà trả về dạng CardBatch
+    để extract_pipeline extract trong process pool (plan từ API vẫn trả về như cũ).
+    """
+    zip_plans = []
+    if readiness is None:
+        readiness = PageReadiness(page)
+    metrics = metrics or ZipMetrics(zip_code)
+    resolver = resolver or SelectorResolver(SELECTOR_CHAINS)
+    if len(zip_code) != 5 or not zip_code.isdigit():
+        # Không retry: form của site không bao giờ nhận ZIP sai định dạng
+        raise CrawlError("invalid_zip", f"ZIP không hợp lệ: {zip_code!r}")
+
+    log.info(f"\n{'='*60}")
+    log.info(f"=== Xử lý ZIP code: {zip_code} ===")
+    log.info('='*60)
+    
+    collector = PlanResponseCollector(page) if capture_api else None
+    try:
+        opened = False
+        if navigator is not None and navigator.active:
+            log.info("1. Mở thẳng trang kết quả (deep link)...")
+            if collector is not None:
+                collector.start()
+            with metrics.stage("deep_link"):
+                opened = await navigator.open(page, zip_code)
+            if not opened:
+                log.info("   → Deep link không ra kết quả, quay lại nhập ZIP qua form")
+                metrics.count("retries")
+                if collector is not None:
+                    collector.stop()
+                    collector.reset()
+        if not opened:
+            if not await open_results_via_form(page, zip_code, readiness, collector, metrics, resolver):
+                raise CrawlError("form_not_found", "không tìm thấy ô nhập ZIP / nút View plans")
+            if navigator is not None:
+                navigator.learn(page.url, zip_code)
+        
+        # Có JSON plan từ API thì dùng luôn, không cần chờ render/scroll/regex
+        api_plans = None
+        if collector is not None:
+            with metrics.stage("api_wait"):
+                if await collector.wait_for_plans(API_PLANS_TIMEOUT_MS, network=readiness.network):
+                    api_plans = collector.plans(zip_code)
+        if api_plans is not None:
+            if api_plans:
+                for plan_info in api_plans:
+                    if not plan_info["plan_id"]:
+                        plan_info["plan_id"] = fallback_plan_id(plan_info["plan_name"], plan_info["plan_type"])
+                log.info(f"   → Lấy {len(api_plans)} plans từ API response")
+                metrics.count("api_plans", len(api_plans))
+                if recorder is not None:
+                    recorder.record(zip_code, page.url, api_payloads=[payload for _, payload in collector.payloads])
+                return api_plans
+            log.info("   → API response không có plan, chuyển sang extract từ DOM")
+    finally:
+        if collector is not None:
+            collector.stop()
+    
+    # Chờ số card đứng yên qua vài frame và network hết request
+    await readiness.stable_count("results_cards", PLAN_CARD_COUNT_SELECTORS)
+    await readiness.network_quiet("results_quiet")
+    
+    # Bước 2: Tìm và extract tất cả plan cards
+    log.info("5. Tìm các plan cards...")
+    
+    # Cả chuỗi selector được kiểm tra trong một query, card match được chụp luôn (text, HTML, attrs)
+    plan_cards = []
+    harvester = None
+    with metrics.stage("probe"):
+        try:
+            selector = await resolver.resolve(page, "plan_cards")
+            if selector:
+                harvester = CardHarvester(page, selector, count_selectors=PLAN_CARD_COUNT_SELECTORS)
+                plan_cards = await harvester.new_cards()
+                log.info(f"   → Tìm thấy {len(plan_cards)} plan cards bằng selector: {selector}")
+        except:
+            plan_cards = []
+    
+    if not plan_cards:
+        if harvester is not None:
+            metrics.count("cards_skipped", harvester.skipped)
+        log.warning("❌ Không tìm thấy plan cards")
+        # Debug: In ra HTML để kiểm tra
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Debug: In ra HTML structure...")
+            body_html = await page.locator('body').inner_html()
+            log.debug(f"HTML preview: {body_html[:1000]}...")
+        return zip_plans
+    
+    # Extract thông tin từ mỗi plan card (offline trên snapshot, không gọi browser nữa)
+    known = None
+    if changes is not None and not defer_extract:
+        known = changes.known_cards(zip_code, extract_plan_info_from_html)
+
+    def extract(cards):
+        if defer_extract:
+            return []
+        with metrics.stage("extract"):
+            return extract_plans_from_cards(cards, zip_code, metrics=metrics, known=known, cache=cache)
+
+    zip_plans = extract(plan_cards)
+    
+    # Scroll / load more tới khi không còn card mới; mỗi vòng chỉ extract card vừa hiện ra
+    log.info("\n6. Scroll / load more để lấy thêm plans...")
+    try:
+        async for new_cards in harvester.more_cards(readiness, resolver, metrics):
+            log.info(f"   → Thêm {len(new_cards)} plan cards sau khi scroll / load more")
+            zip_plans += extract(new_cards)
+    except Exception as e:
+        log.warning(f"   → Lỗi scroll/load more: {e}")
+    # Card skeleton bị bỏ trong browser: đếm những card vẫn rỗng sau khi harvest xong
+    metrics.count("cards_skipped", harvester.skipped)
+    if recorder is not None:
+        recorder.record(zip_code, page.url, cards=harvester.cards)
+    if defer_extract:
+        return CardBatch(zip_code, harvester.cards)
+
+    return zip_plans
+
+
+async def crawl_all(zip_codes, concurrency=1, capture_api=True, route_policy=None, store=None,
+                    on_zip_done=None, deep_link=True, recorder=None, replay_har_paths=None, metrics=None,
+                    headless=True, storage_state_path=None, recycle_after=RECYCLE_AFTER_ZIPS, max_rss_mb=None,
+                    rate_per_host=DEFAULT_RATE_PER_HOST, max_attempts=DEFAULT_MAX_ATTEMPTS, on_dead_letter=None,
+                    changes=None, pipeline=None, cache=None):
+    """Crawl danh sách ZIP với `concurrency` worker, mỗi worker một browser context riêng.
+
+    Các worker dùng chung một process Chromium và lấy ZIP từ hàng đợi chung,
+    worker nào rảnh thì nhận ZIP tiếp theo. Nếu có `route_policy` thì mọi context
+    đều chặn request theo policy đó. Trả về dict zip_code -> list plan_info.
+
+    Nếu có `store` (ProgressStore) thì trạng thái và plan của từng ZIP được ghi vào
+    store ngay khi ZIP xong và không giữ lại trong bộ nhớ; kết quả trả về khi đó rỗng.
+    `on_zip_done(zip_code, plans)` được gọi cho mỗi ZIP lấy được plan. Với
+    `deep_link`, các worker dùng chung một DeepLinkNavigator. Các worker cũng dùng chung
+    một SelectorResolver nên selector thắng ở worker này được worker khác thử trước.
+
+    Với `recorder` (replay.SnapshotArchive), mỗi ZIP được lưu snapshot và mỗi worker
+    ghi HAR vào thư mục của archive. Với `replay_har_paths`, mọi request được trả lời
+    từ các file HAR đó, request không có trong HAR bị chặn (chạy không cần mạng).
+    Metrics của từng ZIP (thời gian theo bước, card, retry, byte tải về) được gom vào
+    `metrics` (CrawlMetrics).
+
+    Browser do BrowserSession quản lý: headless trừ khi `headless=False`, cookie/consent
+    lưu ở `storage_state_path` và nạp lại cho context mới, context được thay sau
+    `recycle_after` ZIP hoặc khi RSS vượt `max_rss_mb`.
+
+    ZIP được điều phối bởi JobScheduler: mỗi host bắt đầu tối đa `rate_per_host` ZIP/s,
+    số worker chạy cùng lúc (tối đa `concurrency`) tự tăng/giảm theo latency và tỉ lệ lỗi,
+    lỗi tạm thời được thử lại sau backoff tới `max_attempts` lần. ZIP hết lượt thử được
+    báo qua `on_dead_letter(entry)` (dict zip_code, reason, error, attempts, failed_at).
+    `changes` (ChangeTracker) và `cache` (ExtractCache) được chuyển cho crawl_zip để bỏ qua
+    extract card không đổi / card đã gặp ở ZIP khác.
+
+    Với `pipeline` (ExtractPipeline), worker chỉ tải trang và chụp card; card được đưa
+    qua queue có giới hạn sang process pool extract, worker nhận ZIP tiếp theo ngay.
+    Kết quả ZIP (store, on_zip_done, retry) được xử lý khi extract xong.
+    """
+    # Playwright chỉ cần khi thật sự mở browser (import chậm, các lệnh offline không dùng)
+    from playwright.async_api import async_playwright
+
+    results = {}
+    metrics = metrics or CrawlMetrics()
+    navigator = DeepLinkNavigator() if deep_link else None
+    resolver = SelectorResolver(SELECTOR_CHAINS)
+    host = urlsplit(UHC_MEDICARE_URL).hostname
+
+    async def setup_context(context):
+        if replay_har_paths:
+            # Route đăng ký sau được ưu tiên: HAR đăng ký đầu tiên là chốt cuối, chặn request không khớp
+            for i, har_path in enumerate(reversed(replay_har_paths)):
+                await context.route_from_har(har_path, not_found="abort" if i == 0 else "fallback")
+        if route_policy is not None:
+            # Policy đăng ký sau cùng nên chạy trước; request không bị chặn được fallback sang HAR
+            await route_policy.install(context)
+
+    n_workers = max(1, min(concurrency, len(zip_codes)))
+    scheduler = JobScheduler(zip_codes, max_concurrency=n_workers, rate_per_host=rate_per_host,
+                             max_attempts=max_attempts)
+    async with async_playwright() as p:
+        # Mỗi worker một context riêng (cookie/storage không dính nhau), dựng sẵn trước khi crawl
+        session = BrowserSession(
+            await launch_browser(p, headless=headless), pool_size=n_workers,
+            context_options={"extra_http_headers": {"User-Agent": USER_AGENT}}, setup_context=setup_context,
+            storage_state_path=storage_state_path, har_dir=recorder.har_dir if recorder is not None else None,
+            recycle_after=recycle_after, max_rss_mb=max_rss_mb)
+        await session.start()
+
+        async def finish(zip_code, zip_metrics, latency, zip_plans, error, worker_id, fetched=False):
+            """Kết quả một lần chạy ZIP: báo scheduler, ghi store / on_zip_done, đóng metrics"""
+            if error is None and not zip_plans:
+                error = CrawlError("no_plans", "no plans extracted")
+            if error is None:
+                await scheduler.succeeded(zip_code, host, latency, fetched=fetched)
+                if store is None:
+                    results[zip_code] = zip_plans
+                else:
+                    store.mark_done(zip_code, zip_plans)
+                if on_zip_done is not None:
+                    on_zip_done(zip_code, zip_plans)
+                status = "done"
+            else:
+                zip_plans = []
+                outcome = await scheduler.failed(zip_code, host, error, fetched=fetched,
+                                                 throttled=zip_metrics.counters["throttled_responses"] > 0)
+                if store is not None:
+                    # Lỗi hoặc không có plan (không thấy ô ZIP, không thấy card...): lần sau chạy lại
+                    store.mark_failed(zip_code, f"{outcome.reason}: {error}")
+                if outcome.retry:
+                    log.warning(f"❌ [worker {worker_id}] ZIP {zip_code} lỗi {outcome.reason} ({error}), "
+                                f"thử lại sau {outcome.delay:.1f}s")
+                    status = "retry"
+                else:
+                    log.warning(f"☠ [worker {worker_id}] ZIP {zip_code} lỗi {outcome.reason} ({error}), "
+                                f"bỏ sau {outcome.attempts} lần thử")
+                    if store is None:
+                        results[zip_code] = []
+                    if on_dead_letter is not None:
+                        on_dead_letter(scheduler.dead_letters[-1])
+                    status = "dead_letter"
+            zip_metrics.count("plans", len(zip_plans))
+            metrics.finish_zip(zip_metrics, status)
+
+        async def worker(slot):
+            worker_id = slot.index
+            page = None
+            zip_metrics = None
+
+            def on_response(response):
+                if zip_metrics is not None:
+                    zip_metrics.count("bytes_transferred", response_bytes(response))
+                    if response.status in (429, 503):
+                        zip_metrics.count("throttled_responses")
+
+            while True:
+                zip_code = await scheduler.next_zip()
+                if zip_code is None:
+                    break
+                await scheduler.acquire(host)
+                # Context mới (lần đầu hoặc vừa bị thay): gắn lại listener và readiness cho page mới
+                if await session.prepare(slot) or page is not slot.page:
+                    page = slot.page
+                    readiness = PageReadiness(page)
+                    page.on("response", on_response)
+                zip_metrics = metrics.start_zip(zip_code)
+                attempt = store.mark_started(zip_code) if store is not None else 0
+                if attempt > 1 or scheduler.attempts[zip_code]:
+                    zip_metrics.count("retries")
+                started = time.monotonic()
                 try:
-                    page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                    time.sleep(3)
-                    
-                    # Tìm và click load more buttons
-                    load_more_selectors = [
-                        'button:has-text("Load more")',
-                        'button:has-text("Show more")',
-                        'button:has-text("View more")',
-                        '.load-more',
-                        '.show-more'
-                    ]
-                    
-                    for selector in load_more_selectors:
-                        try:
-                            button = page.locator(selector).first
-                            if button.is_visible():
-                                button.click()
-                                time.sleep(3)
-                                print("   → Clicked load more button")
-                                break
-                        except:
-                            continue
-                    
+                    result = await crawl_zip(page, zip_code, readiness, capture_api=capture_api,
+                                             navigator=navigator, recorder=recorder, metrics=zip_metrics,
+                                             resolver=resolver, changes=changes,
+                                             defer_extract=pipeline is not None, cache=cache)
+                    error = None
                 except Exception as e:
-                    print(f"   → Lỗi scroll/load more: {e}")
-                
-                print(f"✅ Hoàn thành ZIP {zip_code}: {len([p for p in all_plans_data if p['zip_code'] == zip_code])} plans")
-                
-            except Exception as e:
-                print(f"❌ Lỗi với ZIP {zip_code}: {e}")
-                continue
-
-        browser.close()
+                    result, error = [], e
+                latency = time.monotonic() - started
+                waits = readiness.pop_waits()
+                for step, seconds, ok in waits:
+                    zip_metrics.observe(f"wait_{step}", seconds)
+                    if not ok:
+                        zip_metrics.count("wait_timeouts")
+
+                if isinstance(result, CardBatch):
+                    # Trang xong: trả slot cho ZIP khác, card sang process pool (chờ nếu queue đầy)
+                    pipeline.observe("fetch", latency)
+                    await scheduler.fetched(host, latency)
+                    known = None
+                    if changes is not None:
+                        known = changes.known_cards(zip_code, extract_plan_info_from_html)
+                    done = functools.partial(finish, zip_code, zip_metrics, latency, worker_id=worker_id,
+                                             fetched=True)
+                    await pipeline.submit(zip_code, result.cards, done, metrics=zip_metrics, known=known)
+                else:
+                    if pipeline is not None:
+                        pipeline.observe("fetch", latency)
+                    await finish(zip_code, zip_metrics, latency, result, error, worker_id)
+                zip_metrics = None
+                await session.zip_done(slot)
+                log.info(f"⏱ Thời gian chờ ZIP {zip_code}: {format_waits(waits)}")
+
+        scheduler.start(len(session.slots))
+        if pipeline is not None:
+            pipeline.start(len(session.slots))
+        try:
+            await asyncio.gather(*(worker(slot) for slot in session.slots))
+        finally:
+            scheduler.cancel()
+            if pipeline is not None:
+                await pipeline.stop()
+            await session.close()
+
+    if navigator is not None and (navigator.hits or navigator.misses):
+        print(f"🔗 Deep link: {navigator.hits} lần thành công, {navigator.misses} lần phải quay lại form")
+    print(f"🧭 Browser: {session.format_summary()}")
+    print(f"🔁 Scheduler: {scheduler.format_summary()}")
+    if resolver.queries:
+        print(f"🎯 Selector: {resolver.format_summary()}")
+        for role, selector in resolver.dead_selectors():
+            log.info(f"   ✗ {role}: {selector} chưa match lần nào")
+    if route_policy is not None:
+        print(f"🚫 Request routing: {route_policy.stats.format_summary()}")
+
+    return results
+
+
+def main(concurrency=1, capture_api=True, route_policy=None, db_path="crawl_progress.sqlite3", fresh=False,
+         formats=("csv", "jsonl"), deep_link=True, record_dir=None, replay_har_dir=None, log_level="info",
+         metrics_port=None, headless=True, storage_state_path="crawl_storage_state.json",
+         recycle_after=RECYCLE_AFTER_ZIPS, max_rss_mb=None, rate_per_host=DEFAULT_RATE_PER_HOST,
+         max_attempts=DEFAULT_MAX_ATTEMPTS, zips=None, crosswalk_path=None, plan_cache_path=None,
+         samples_per_county=DEFAULT_SAMPLES_PER_COUNTY, cache_ttl_days=DEFAULT_TTL_DAYS,
+         warehouse_dir=DEFAULT_WAREHOUSE_DIR, changes_db=DEFAULT_CHANGES_DB,
+         extract_workers=DEFAULT_EXTRACT_WORKERS, extract_queue=None, output=None,
+         extract_cache_path=DEFAULT_EXTRACT_CACHE, extract_cache_size=DEFAULT_MAX_ENTRIES):
+    """Crawl `zips` (mặc định zip_codes). Với `plan_cache_path`, ZIP được lập kế hoạch theo
+    county (crosswalk ở `crosswalk_path`): chỉ crawl vài ZIP mẫu mỗi county, phần còn lại
+    lấy từ cache (xem zip_planner). Với `warehouse_dir`, mọi cặp ZIP-plan của lần chạy
+    được nạp vào kho Parquet (xem plan_warehouse) và thống kê cuối run lấy từ kho.
+    Với `changes_db`, plan của mỗi ZIP được so với lần chạy trước và ghi delta ra
+    `<output>_delta.jsonl` (xem change_tracker). Với `extract_workers` > 0, card được
+    extract trong process pool song song với việc tải trang (xem extract_pipeline),
+    queue giữa hai tầng giữ tối đa `extract_queue` ZIP. Kết quả extract được cache theo
+    nội dung card (tối đa `extract_cache_size` entry, lưu ở `extract_cache_path` giữa các
+    lần chạy; xem extract_cache). File kết quả có tên
+    `<output>.csv` ... (mặc định uhc_medicare_plans_text_extraction_<timestamp>)."""
+    configure_logging(log_level)
+    started = time.monotonic()
+    zips = zips or zip_codes
+    store = ProgressStore(db_path)
+    if fresh:
+        store.reset()
+    store.add_zips(zips)
+    requeued = store.requeue_in_progress()
+    if requeued:
+        print(f"↻ {requeued} ZIP đang dở từ lần chạy trước được đưa lại vào hàng đợi")
+    todo = store.pending_zips(zips)
+
+    planner = None
+    if plan_cache_path:
+        crosswalk = load_crosswalk(crosswalk_path) if crosswalk_path else None
+        plan_sets = PlanSetCache(plan_cache_path, ttl_days=cache_ttl_days)
+        if fresh:
+            # --fresh nghĩa là crawl thật mọi ZIP: không dùng lại bộ plan đã cache / suy ra
+            plan_sets.reset()
+        planner = ZipPlanner(plan_sets, crosswalk, samples_per_county=samples_per_county)
+
+    recorder = SnapshotArchive(record_dir) if record_dir else None
+    replay_har_paths = None
+    if replay_har_dir:
+        replay_har_paths = SnapshotArchive(replay_har_dir).har_paths()
+        if not replay_har_paths:
+            raise SystemExit(f"❌ Không có file HAR nào trong {replay_har_dir}/har")
+
+    # Plan được ghi nối tiếp vào file .part ngay khi mỗi ZIP xong, đổi tên khi kết thúc
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    base_path = output or f"uhc_medicare_plans_text_extraction_{timestamp}"
+    sink = open_sinks(base_path, formats)
+    membership_sink = CsvSink(f"{base_path}_zip_plans.csv", fieldnames=MEMBERSHIP_HEADERS)
+    collector = PlanCollector(sink, membership_sink)
+    warehouse, warehouse_sink = None, None
+    if warehouse_dir:
+        warehouse = PlanWarehouse(warehouse_dir)
+        try:
+            warehouse_sink = warehouse.open_run()
+        except ImportError as e:
+            log.warning(f"⚠ Không ghi kho plan: {e}")
+            warehouse = None
+    changes = None
+    if changes_db:
+        changes = ChangeTracker(changes_db, delta_sink=JsonlSink(f"{base_path}_delta.jsonl"))
+    cache = ExtractCache(extract_cache_size, path=extract_cache_path) if extract_cache_size else None
+    pipeline = None
+    if extract_workers:
+        pipeline = ExtractPipeline(extract_workers, queue_size=extract_queue, log_level=log_level, cache=cache)
+    dead_letters = []
+    metrics = CrawlMetrics()
+    if metrics_port:
+        metrics.serve(metrics_port)
+        print(f"📈 Metrics: http://127.0.0.1:{metrics_port}/metrics")
+
+    def collect(zip_code, zip_plans):
+        collector.add_zip(zip_code, zip_plans)
+        if changes is not None:
+            changes.finish_zip(zip_code, zip_plans)
+        if warehouse_sink is not None:
+            warehouse_sink.write_plans(zip_plans)
+
+    # ZIP đã xong ở lần chạy trước: lấy plan từ store ghi ra trước
+    todo_set = set(todo)
+    resumed = [z for z in zips if z not in todo_set]
+    if resumed:
+        print(f"⏭ Bỏ qua {len(resumed)} ZIP đã xong (theo {db_path})")
+        for zip_code in resumed:
+            collect(zip_code, store.plans_for_zip(zip_code))
+
+    def on_zip_done(zip_code, zip_plans):
+        if planner is not None:
+            planner.record(zip_code, zip_plans)
+        collect(zip_code, zip_plans)
+
+    def run_crawl(batch):
+        asyncio.run(crawl_all(batch, concurrency=concurrency, capture_api=capture_api,
+                              route_policy=route_policy, store=store, on_zip_done=on_zip_done,
+                              deep_link=deep_link, recorder=recorder, replay_har_paths=replay_har_paths,
+                              metrics=metrics, headless=headless, storage_state_path=storage_state_path,
+                              recycle_after=recycle_after, max_rss_mb=max_rss_mb, rate_per_host=rate_per_host,
+                              max_attempts=max_attempts, on_dead_letter=dead_letters.append, changes=changes,
+                              pipeline=pipeline, cache=cache))
+
+    try:
+        if planner is None:
+            run_crawl(todo)
+        else:
+            # Mỗi vòng: ZIP có trong cache được ghi ra ngay, crawl ZIP mẫu / ZIP không suy ra được,
+            # ZIP còn lại của county chờ vòng sau (lúc đó county đã có đủ ZIP mẫu)
+            pending = todo
+            while pending:
+                zip_plan = planner.plan(pending)
+                for zip_code, entry in zip_plan.cached.items():
+                    zip_plans = planner.plans_for(entry)
+                    store.mark_done(zip_code, zip_plans)
+                    collect(zip_code, zip_plans)
+                log.info(f"🗺 Kế hoạch: crawl {len(zip_plan.crawl)} ZIP, {len(zip_plan.cached)} ZIP từ cache, "
+                         f"{len(zip_plan.deferred)} ZIP chờ ZIP mẫu")
+                if zip_plan.crawl:
+                    run_crawl(zip_plan.crawl)
+                pending = zip_plan.deferred
+    except BaseException:
+        # Giữ file .part (và tiến độ trong store) để kiểm tra / chạy tiếp
+        sink.abort()
+        membership_sink.abort()
+        if warehouse_sink is not None:
+            warehouse_sink.abort()
+        if changes is not None:
+            changes.delta_sink.abort()
+            changes.close()
+        if pipeline is not None:
+            pipeline.shutdown()
+        if cache is not None:
+            cache.close()
+        store.close()
+        metrics.stop_serving()
+        raise
+    if pipeline is not None:
+        pipeline.shutdown()
+        if pipeline.jobs:
+            print(f"🏭 Pipeline: {pipeline.format_summary()}")
+    if cache is not None:
+        cache.close()
+        if cache.hits or cache.misses:
+            print(f"🧠 Extract cache: {cache.format_summary()}")
+    if planner is not None:
+        print(f"🗺 Planner: {planner.format_summary()}")
+        planner.cache.close()
+    print(f"\n⏱ Crawl {len(todo)} ZIP với {concurrency} worker mất {time.monotonic() - started:.1f}s")
+    if metrics.records:
+        print(f"📈 Thời gian theo bước:\n{metrics.format_summary()}")
+        print(f"📈 Counter: {dict(metrics.counters)}")
+        print(f"📈 Metrics đã ghi: {', '.join(metrics.write(f'{base_path}_metrics'))}")
+    metrics.stop_serving()
+    print(f"📒 Trạng thái ZIP: {store.status_counts()}")
+    for zip_code, attempts, error in store.failed_zips():
+        print(f"  ✗ ZIP {zip_code} (thử {attempts} lần): {error}")
+    if dead_letters:
+        dead_letter_path = f"{base_path}_dead_letter.jsonl"
+        with open(dead_letter_path, "w", encoding="utf-8") as f:
+            for entry in dead_letters:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        print(f"☠ {len(dead_letters)} ZIP hết lượt thử, lý do lưu ở {dead_letter_path}")
+    store.close()
     
     # Lưu kết quả
     print(f"\n{'='*70}")
     print("=== LƯU KẾT QUẢ ===")
     print('='*70)
+    sink.close()
+    membership_sink.close()
+    if warehouse_sink is not None:
+        warehouse_sink.close()
+        print(f"✅ Đã nạp {warehouse_sink.rows} cặp ZIP-plan vào kho {warehouse_sink.path}")
+    if changes is not None:
+        # Delta finalize xong mới ghi trạng thái mới: crash trước đó thì lần sau tính lại delta
+        changes.commit()
+        changes.close()
+        print(f"Δ Thay đổi so với lần chạy trước: {changes.format_summary()} -> {changes.delta_sink.path}")
     
-    if all_plans_data:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        csv_filename = f"uhc_medicare_plans_text_extraction_{timestamp}.csv"
-        save_to_csv(all_plans_data, csv_filename)
-        
-        # Lưu JSON với full text để debug
-        json_filename = f"uhc_medicare_plans_text_extraction_{timestamp}.json"
-        with open(json_filename, 'w', encoding='utf-8') as f:
-            json.dump(all_plans_data, f, indent=2, ensure_ascii=False)
-        print(f"✅ Đã lưu JSON backup: {json_filename}")
+    if collector.total:
+        for path in sink.paths:
+            print(f"✅ Đã lưu {collector.total} plans vào {path}")
+        print(f"✅ Đã lưu {len(collector.index.memberships)} cặp ZIP-plan vào {membership_sink.path}")
         
         # Thống kê
         print(f"\n{'='*70}")
         print("=== THỐNG KÊ ===")
         print('='*70)
-        print(f"Tổng số plans: {len(all_plans_data)}")
-        
-        # Thống kê theo ZIP
-        zip_stats = {}
-        for plan in all_plans_data:
-            zip_code = plan["zip_code"]
-            if zip_code not in zip_stats:
-                zip_stats[zip_code] = 0
-            zip_stats[zip_code] += 1
-        
-        print("\nTheo ZIP code:")
-        for zip_code, count in zip_stats.items():
+        print(f"Tổng số plans: {collector.total}")
+        if warehouse_sink is not None:
+            # Số plan theo ZIP, phân bố premium / OOP theo plan_type: query trên kho
+            print(format_report(warehouse, last_runs=1))
+            return
+        
+        print("\nTheo ZIP code (số plan có ở ZIP, gồm cả plan đã thấy ở ZIP khác):")
+        for zip_code, count in collector.zip_stats.items():
             print(f"  ZIP {zip_code}: {count} plans")
         
         # Hiển thị sample data
         print(f"\n{'='*70}")
         print("=== SAMPLE DATA ===")
         print('='*70)
-        for i, plan in enumerate(all_plans_data[:2]):
+        for i, plan in enumerate(collector.samples):
             print(f"\nPlan {i+1}:")
             for key, value in plan.items():
                 if value:
@@ -662,5 +702,107 @@ def main():
     else:
         print("❌ Không có dữ liệu nào được thu thập")
 
+def add_crawl_arguments(parser):
+    """Tuỳ chọn browser / request dùng chung cho `crawl` và worker của work_queue"""
+    parser.add_argument("--no-api", action="store_true",
+                        help="Không bắt JSON plan từ network, chỉ extract từ DOM")
+    parser.add_argument("--no-block", action="store_true",
+                        help="Không chặn ảnh/font/media/tracker")
+    parser.add_argument("--block-types", default=",".join(sorted(DEFAULT_BLOCKED_RESOURCE_TYPES)),
+                        help="Các resource type bị chặn, cách nhau bởi dấu phẩy")
+    parser.add_argument("--allow-domain", action="append", default=None,
+                        help="Chỉ cho phép các domain này (lặp lại được); mặc định dùng blocklist tracker")
+    parser.add_argument("--no-deep-link", action="store_true",
+                        help="Luôn đi qua homepage và form nhập ZIP, không mở thẳng URL kết quả")
+    parser.add_argument("--headed", action="store_true",
+                        help="Mở Chromium có cửa sổ (mặc định headless)")
+    parser.add_argument("--storage-state", default="crawl_storage_state.json",
+                        help="File lưu cookie/consent giữa các lần chạy ('' để tắt)")
+    parser.add_argument("--recycle-after", type=int, default=RECYCLE_AFTER_ZIPS,
+                        help=f"Thay context của worker sau N ZIP (mặc định {RECYCLE_AFTER_ZIPS}, 0 để tắt)")
+    parser.add_argument("--max-rss-mb", type=int, default=None,
+                        help="Thay context khi RSS của python + Chromium vượt ngưỡng (MB)")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE_PER_HOST,
+                        help=f"Số ZIP bắt đầu tối đa mỗi giây trên một host (mặc định {DEFAULT_RATE_PER_HOST}, 0 để tắt)")
+
+
+def crawl_options(args):
+    """kwargs của crawl_all / main() từ các tuỳ chọn của add_crawl_arguments"""
+    route_policy = None
+    if not args.no_block:
+        route_policy = RoutePolicy(
+            blocked_types=[t.strip() for t in args.block_types.split(",") if t.strip()],
+            allowed_domains=args.allow_domain,
+        )
+    return dict(capture_api=not args.no_api, route_policy=route_policy, deep_link=not args.no_deep_link,
+                headless=not args.headed, storage_state_path=args.storage_state or None,
+                recycle_after=args.recycle_after or None, max_rss_mb=args.max_rss_mb, rate_per_host=args.rate)
+
+
+def cli(argv=None):
+    """Chạy main() từ dòng lệnh (`python test2.py ...` hoặc `crawl_service crawl ...`)"""
+    parser = argparse.ArgumentParser(description="Crawl UHC Medicare plans theo ZIP code")
+    parser.add_argument("zip_codes", nargs="*", metavar="ZIP",
+                        help="ZIP cần crawl (thêm vào --zips); không có ZIP nào thì dùng danh sách mặc định")
+    parser.add_argument("-c", "--concurrency", type=int, default=1,
+                        help="Số browser context chạy song song (mặc định 1 = tuần tự)")
+    add_crawl_arguments(parser)
+    parser.add_argument("--db", default="crawl_progress.sqlite3",
+                        help="File SQLite lưu tiến độ; chạy lại sẽ bỏ qua ZIP đã xong")
+    parser.add_argument("--fresh", action="store_true",
+                        help="Xoá tiến độ cũ trong --db (và cache của --plan-cache) rồi crawl lại từ đầu")
+    parser.add_argument("--record", metavar="DIR", default=None,
+                        help="Lưu snapshot card/JSON của từng ZIP và HAR vào DIR để replay offline")
+    parser.add_argument("--replay-har", metavar="DIR", default=None,
+                        help="Chạy lại flow browser từ HAR trong DIR/har, không ra mạng")
+    parser.add_argument("--zips", metavar="FILE", default=None,
+                        help="File danh sách ZIP (mỗi dòng một ZIP, cột đầu của CSV; '-' = stdin)")
+    parser.add_argument("--crosswalk", metavar="CSV", default=None,
+                        help="Crosswalk ZIP -> county (vd. HUD ZIP-COUNTY) để chỉ crawl vài ZIP mỗi county")
+    parser.add_argument("--plan-cache", metavar="FILE", default=None,
+                        help="Bật planner theo county: file SQLite cache bộ plan theo ZIP (vd. zip_plan_cache.sqlite3); "
+                             "mặc định tắt, mọi ZIP đều được crawl")
+    parser.add_argument("--samples-per-county", type=int, default=DEFAULT_SAMPLES_PER_COUNTY,
+                        help=f"Số ZIP mẫu phải ra cùng bộ plan trước khi suy ra cả county (mặc định {DEFAULT_SAMPLES_PER_COUNTY})")
+    parser.add_argument("--cache-ttl-days", type=float, default=DEFAULT_TTL_DAYS,
+                        help=f"Hạn dùng của bộ plan trong cache (mặc định {DEFAULT_TTL_DAYS} ngày)")
+    parser.add_argument("--warehouse", default=DEFAULT_WAREHOUSE_DIR,
+                        help="Thư mục kho Parquet lưu lịch sử các lần chạy ('' để tắt, cần pyarrow)")
+    parser.add_argument("--changes-db", default=DEFAULT_CHANGES_DB,
+                        help="File SQLite giữ plan lần chạy trước để bỏ qua card không đổi và ghi delta ('' để tắt)")
+    parser.add_argument("--extract-workers", type=int, default=DEFAULT_EXTRACT_WORKERS,
+                        help="Số process extract card song song với browser (mặc định 0 = extract ngay "
+                             "trong worker browser)")
+    parser.add_argument("--extract-queue", type=int, default=None,
+                        help="Số ZIP tối đa chờ extract; queue đầy thì worker browser chờ (mặc định 2 x --extract-workers)")
+    parser.add_argument("--extract-cache", default=DEFAULT_EXTRACT_CACHE,
+                        help="File SQLite lưu cache extract theo nội dung card giữa các lần chạy ('' = chỉ trong bộ nhớ)")
+    parser.add_argument("--extract-cache-size", type=int, default=DEFAULT_MAX_ENTRIES,
+                        help=f"Số card tối đa trong cache extract (mặc định {DEFAULT_MAX_ENTRIES}, 0 để tắt)")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help=f"Số lần thử tối đa của một ZIP trong một run (mặc định {DEFAULT_MAX_ATTEMPTS})")
+    parser.add_argument("--log-level", choices=list(LOG_LEVELS), default="info",
+                        help="Mức log trong lúc crawl (debug in cả từng card, off để tắt)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Mở endpoint http://127.0.0.1:PORT/metrics (Prometheus) trong lúc crawl")
+    parser.add_argument("--formats", default="csv,jsonl",
+                        help="Định dạng output, cách nhau bởi dấu phẩy: csv, jsonl, parquet")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Tên file kết quả (không đuôi); mặc định uhc_medicare_plans_text_extraction_<timestamp>")
+    args = parser.parse_args(argv)
+    zips = read_zip_codes(args.zips) if args.zips else []
+    zips += [z.zfill(5) for z in args.zip_codes if z.zfill(5) not in zips]
+    main(concurrency=args.concurrency, db_path=args.db, fresh=args.fresh,
+         formats=[f.strip() for f in args.formats.split(",") if f.strip()],
+         record_dir=args.record, replay_har_dir=args.replay_har,
+         log_level=args.log_level, metrics_port=args.metrics_port,
+         max_attempts=args.max_attempts, zips=zips, **crawl_options(args),
+         crosswalk_path=args.crosswalk, plan_cache_path=args.plan_cache or None,
+         samples_per_county=args.samples_per_county, cache_ttl_days=args.cache_ttl_days,
+         warehouse_dir=args.warehouse or None, changes_db=args.changes_db or None,
+         extract_workers=args.extract_workers, extract_queue=args.extract_queue, output=args.output,
+         extract_cache_path=args.extract_cache or None, extract_cache_size=args.extract_cache_size)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    cli()
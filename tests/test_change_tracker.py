@@ -0,0 +1,150 @@
+import json
+
+import pytest
+
+import change_tracker
+from card_snapshot import CardSnapshot
+from change_tracker import ChangeTracker, card_hash, diff_plans
+from extraction_rules import new_plan_info
+from plan_extractors import extract_plan_info_from_html
+from plan_sinks import JsonlSink
+
+EXTRACTOR = extract_plan_info_from_html
+
+
+def plan(plan_id, zip_code="91101", **fields):
+    info = new_plan_info(zip_code)
+    info.update(plan_id=plan_id, plan_name=f"AARP {plan_id} (HMO)", plan_type="HMO", monthly_premium="$0")
+    info.update(fields)
+    return info
+
+
+def card(text="AARP A card $0", html="<h2>AARP A</h2><span>HMO</span>"):
+    return CardSnapshot(text, html, {"id": "plan-card-1"})
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "changes.sqlite3")
+
+
+@pytest.fixture
+def tracker(db_path):
+    tracker = ChangeTracker(db_path)
+    yield tracker
+    tracker.close()
+
+
+def finish_run(tracker, zip_code, plans):
+    """finish_zip + commit như cuối một lần chạy"""
+    deltas = tracker.finish_zip(zip_code, plans)
+    tracker.commit()
+    return deltas
+
+
+def by_change(deltas):
+    return {(d["change"], d["plan_id"]) for d in deltas}
+
+
+def test_diff_plans_ignores_zip_code():
+    old, new = plan("A"), plan("A", zip_code="90001", monthly_premium="$35")
+    assert diff_plans(old, new) == {"monthly_premium": ["$0", "$35"]}
+
+
+def test_card_hash_covers_text_html_attrs_and_version():
+    base = card_hash("AARP Plan $0", "<b>HMO</b>", {"id": "plan-card-1"}, "v1")
+    assert card_hash("AARP  Plan\n $0", "<b>HMO</b>", {"id": "plan-card-1"}, "v1") == base
+    assert card_hash("AARP Plan $0", "<b>PPO</b>", {"id": "plan-card-1"}, "v1") != base
+    assert card_hash("AARP Plan $0", "<b>HMO</b>", {"id": "plan-card-2"}, "v1") != base
+    assert card_hash("AARP Plan $0", "<b>HMO</b>", {"id": "plan-card-1"}, "v2") != base
+
+
+def test_first_run_is_all_added(tracker):
+    deltas = finish_run(tracker, "91101", [plan("A"), plan("B")])
+    assert by_change(deltas) == {("added", "A"), ("added", "B")}
+
+
+def test_added_removed_changed_unchanged(tracker):
+    finish_run(tracker, "91101", [plan("A"), plan("B"), plan("C")])
+    deltas = finish_run(tracker, "91101", [plan("A"), plan("B", monthly_premium="$29"), plan("D")])
+    assert by_change(deltas) == {("changed", "B"), ("removed", "C"), ("added", "D")}
+    changed = next(d for d in deltas if d["change"] == "changed")
+    assert changed["fields"] == {"monthly_premium": ["$0", "$29"]}
+    assert tracker.counts == {"added": 4, "removed": 1, "changed": 1, "unchanged": 1}
+
+
+def test_zips_are_compared_independently(tracker):
+    finish_run(tracker, "91101", [plan("A")])
+    assert finish_run(tracker, "90001", [plan("B", zip_code="90001")])[0]["change"] == "added"
+    assert finish_run(tracker, "91101", [plan("A")]) == []
+
+
+def test_known_cards_reuse_plan_of_unchanged_card(tracker):
+    session = tracker.known_cards("91101", EXTRACTOR)
+    assert session.lookup(card()) is None
+    session.remember(card(), plan("A"))
+    finish_run(tracker, "91101", [plan("A")])
+
+    session = tracker.known_cards("91101", EXTRACTOR)
+    assert session.lookup(card(text="AARP  A card\n$0"))["plan_id"] == "A"
+    assert session.lookup(card(text="AARP A card $35")) is None
+    # Text giữ nguyên nhưng markup đổi (plan_type / premium đọc từ HTML): extract lại
+    assert session.lookup(card(html="<h2>AARP A</h2><span>PPO</span>")) is None
+
+
+def test_version_bump_invalidates_stored_plans(db_path, monkeypatch):
+    monkeypatch.setattr(change_tracker, "extractor_version", lambda extractor: "v1")
+    tracker = ChangeTracker(db_path)
+    tracker.known_cards("91101", EXTRACTOR).remember(card(), plan("A"))
+    finish_run(tracker, "91101", [plan("A")])
+    tracker.close()
+
+    tracker = ChangeTracker(db_path)
+    assert tracker.known_cards("91101", EXTRACTOR).lookup(card())["plan_id"] == "A"
+    tracker.close()
+
+    # Sửa extractor / rule table: khoá phiên bản đổi, card cũ không còn khớp
+    monkeypatch.setattr(change_tracker, "extractor_version", lambda extractor: "v2")
+    tracker = ChangeTracker(db_path)
+    assert tracker.known_cards("91101", EXTRACTOR).lookup(card()) is None
+    tracker.close()
+
+
+def test_state_is_not_advanced_before_commit(tracker):
+    finish_run(tracker, "91101", [plan("A")])
+    tracker.finish_zip("91101", [plan("A", monthly_premium="$29")])
+    assert json.loads(tracker.conn.execute("SELECT plan FROM zip_plan_state").fetchone()[0])["monthly_premium"] == "$0"
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_crash_then_resume_keeps_deltas(tmp_path, db_path):
+    base = str(tmp_path / "run")
+    tracker = ChangeTracker(db_path, delta_sink=JsonlSink(f"{base}0_delta.jsonl"))
+    finish_run(tracker, "91101", [plan("A"), plan("B")])
+    tracker.close()
+
+    # Run 1: 91101 xong (premium của A đổi) rồi crash trước khi delta được finalize
+    tracker = ChangeTracker(db_path, delta_sink=JsonlSink(f"{base}1_delta.jsonl"))
+    tracker.finish_zip("91101", [plan("A", monthly_premium="$29"), plan("B")])
+    tracker.delta_sink.abort()
+    tracker.close()
+
+    # Run 2 (chạy tiếp): 91101 lấy plan từ progress store, phải ra lại đúng delta
+    tracker = ChangeTracker(db_path, delta_sink=JsonlSink(f"{base}2_delta.jsonl"))
+    tracker.finish_zip("91101", [plan("A", monthly_premium="$29"), plan("B")])
+    tracker.finish_zip("90001", [plan("C", zip_code="90001")])
+    tracker.commit()
+    tracker.close()
+    deltas = read_jsonl(f"{base}2_delta.jsonl")
+    assert [(d["zip_code"], d["change"], d["plan_id"]) for d in deltas] == [
+        ("91101", "changed", "A"), ("90001", "added", "C")]
+    assert deltas[0]["fields"] == {"monthly_premium": ["$0", "$29"]}
+
+    # Lần chạy sau đó so với trạng thái đã commit: không còn thay đổi
+    tracker = ChangeTracker(db_path, delta_sink=JsonlSink(f"{base}3_delta.jsonl"))
+    assert tracker.finish_zip("91101", [plan("A", monthly_premium="$29"), plan("B")]) == []
+    tracker.close()
@@ -0,0 +1,45 @@
+from deep_link import DeepLinkNavigator, key_words, learn_url_template
+
+RESULTS = "https://www.uhc.com/medicare/plan-summary"
+
+
+def test_template_replaces_zip_and_drops_zip_specific_params():
+    url = f"{RESULTS}?zip=91101&countyCode=037&stateCode=CA&planYear=2025#zip-91101"
+    template = learn_url_template(url, "91101")
+    assert template == f"{RESULTS}?zip=__ZIP__&planYear=2025#zip-__ZIP__"
+
+
+def test_template_keeps_params_that_only_contain_a_marker():
+    url = f"{RESULTS}?zip=91101&template=a&platform=web&statement=1"
+    template = learn_url_template(url, "91101")
+    assert "template=a" in template and "platform=web" in template and "statement=1" in template
+
+
+def test_template_with_zip_in_path():
+    assert learn_url_template(f"{RESULTS}/91101/plans", "91101") == f"{RESULTS}/__ZIP__/plans"
+
+
+def test_no_template_without_zip_or_with_other_numeric_segments():
+    assert learn_url_template(f"{RESULTS}?zip=90001", "91101") is None
+    assert learn_url_template("https://www.uhc.com/medicare?zip=91101", "91101") is None
+    assert learn_url_template(f"{RESULTS}/06037/91101", "91101") is None
+
+
+def test_key_words():
+    assert key_words("countyCode") == ["county", "code"]
+    assert key_words("COUNTY_FIPS") == ["county", "fips"]
+    assert key_words("geo-lat") == ["geo", "lat"]
+    assert key_words("XMLState") == ["xml", "state"]
+
+
+def test_navigator_learns_once_and_disables_after_failures():
+    navigator = DeepLinkNavigator(max_consecutive_failures=2)
+    navigator.learn(f"{RESULTS}?zip=91101", "91101")
+    navigator.learn(f"{RESULTS}?zip=10001&x=1", "10001")
+    assert navigator.url_for("33101") == f"{RESULTS}?zip=33101"
+    navigator.record(False)
+    navigator.record(True)
+    navigator.record(False)
+    assert navigator.active
+    navigator.record(False)
+    assert not navigator.active
@@ -0,0 +1,108 @@
+import sqlite3
+
+import pytest
+
+from card_snapshot import CardSnapshot
+from extract_cache import ExtractCache
+from plan_extractors import extract_plan_info_from_html, extract_plan_info_from_text
+
+EXTRACTOR = extract_plan_info_from_html
+
+
+def card(zip_code, premium="$0"):
+    return CardSnapshot(f"AARP Choice (PPO)\nZIP {zip_code}\nMonthly premium {premium}",
+                        f"<h2>AARP Choice (PPO)</h2><a href='/plans?zip={zip_code}'>Details</a>",
+                        {"id": "plan-card-1", "data-zip": zip_code})
+
+
+def plan(zip_code, plan_id="H0543-001"):
+    return {"zip_code": zip_code, "plan_id": plan_id, "plan_name": "AARP Choice (PPO)", "monthly_premium": "$0"}
+
+
+def test_key_masks_zip_and_whitespace():
+    cache = ExtractCache()
+    key = cache.card_key(card("91101"), "91101", EXTRACTOR)
+    assert cache.card_key(card("90001"), "90001", EXTRACTOR) == key
+    spaced = CardSnapshot("AARP  Choice (PPO)\n\nZIP 91101\nMonthly premium  $0", card("91101").html,
+                          card("91101").attrs)
+    assert cache.card_key(spaced, "91101", EXTRACTOR) == key
+    assert cache.card_key(card("91101", premium="$35"), "91101", EXTRACTOR) != key
+
+
+def test_key_depends_on_extractor_and_needs_attrs():
+    cache = ExtractCache()
+    assert (cache.card_key(card("91101"), "91101", EXTRACTOR)
+            != cache.card_key(card("91101"), "91101", extract_plan_info_from_text))
+    assert cache.key(EXTRACTOR, "91101", "text", "html", None) is None
+
+
+def test_hit_returns_copy_with_requested_zip():
+    cache = ExtractCache()
+    key = cache.card_key(card("91101"), "91101", EXTRACTOR)
+    assert cache.get(key, "91101") is None
+    cache.put(key, plan("91101"), "91101", EXTRACTOR)
+    hit = cache.get(cache.card_key(card("90001"), "90001", EXTRACTOR), "90001")
+    assert hit == plan("90001")
+    hit["plan_name"] = "changed"
+    assert cache.get(key, "91101")["plan_name"] == "AARP Choice (PPO)"
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_plan_containing_zip_is_not_cached():
+    cache = ExtractCache()
+    cache.put("k", plan("91101", plan_id="uhc-91101-1"), "91101", EXTRACTOR)
+    assert cache.uncacheable == 1
+    assert "k" not in cache.entries
+
+
+def test_lru_eviction():
+    cache = ExtractCache(max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, plan("91101"), "91101", EXTRACTOR)
+    cache.get("a", "91101")
+    cache.put("c", plan("91101"), "91101", EXTRACTOR)
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.evictions == 1
+
+
+@pytest.fixture
+def saved_cache(tmp_path):
+    path = str(tmp_path / "extract_cache.sqlite3")
+    cache = ExtractCache(path=path)
+    key = cache.card_key(card("91101"), "91101", EXTRACTOR)
+    cache.put(key, plan("91101"), "91101", EXTRACTOR)
+    cache.close()
+    return path, key
+
+
+def test_entries_persist_across_runs(saved_cache):
+    path, key = saved_cache
+    cache = ExtractCache(path=path)
+    assert cache.loaded == 1
+    assert cache.get(key, "33101") == plan("33101")
+
+
+def test_entries_of_old_extractor_version_are_dropped(saved_cache):
+    path, key = saved_cache
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("UPDATE extract_cache SET version = 'old'")
+    conn.close()
+    cache = ExtractCache(path=path)
+    assert cache.loaded == 0
+    assert cache.get(key, "91101") is None
+
+
+def test_subset_and_merge():
+    cache = ExtractCache()
+    cards = [card("91101"), card("91101", premium="$35")]
+    cache.put(cache.card_key(cards[0], "91101", EXTRACTOR), plan("91101"), "91101", EXTRACTOR)
+    view = cache.subset(cards, "91101", EXTRACTOR)
+    assert len(view.entries) == 1
+    # Process extract: miss card thứ hai rồi ghi kết quả vào view
+    key = view.card_key(cards[1], "91101", EXTRACTOR)
+    assert view.get(key, "91101") is None
+    view.put(key, plan("91101", plan_id="H0543-002"), "91101", EXTRACTOR)
+    cache.merge(view)
+    assert cache.get(key, "90001")["plan_id"] == "H0543-002"
+    assert cache.misses == 1
@@ -0,0 +1,126 @@
+import asyncio
+import random
+
+import pytest
+
+from job_scheduler import (
+    AdaptiveConcurrency,
+    CrawlError,
+    HostRateLimiter,
+    JobScheduler,
+    backoff_delay,
+    classify_error,
+)
+
+
+class Fixed:
+    """rng trả về cận trên của khoảng: kiểm tra được trần của backoff"""
+
+    def uniform(self, low, high):
+        return high
+
+
+@pytest.mark.parametrize("error, throttled, reason", [
+    (CrawlError("form_not_found"), False, "form_not_found"),
+    (asyncio.TimeoutError(), False, "timeout"),
+    (type("TimeoutError", (Exception,), {})("30000ms exceeded"), False, "timeout"),
+    (Exception("net::ERR_CONNECTION_RESET at https://www.uhc.com"), False, "network"),
+    (Exception("Target page, context or browser has been closed"), False, "browser_closed"),
+    (ValueError("boom"), False, "unknown"),
+    (CrawlError("no_plans"), True, "throttled"),
+])
+def test_classify_error(error, throttled, reason):
+    assert classify_error(error, throttled) == reason
+
+
+def test_backoff_grows_exponentially_up_to_cap():
+    assert [backoff_delay(n, base=2, cap=120, rng=Fixed()) for n in (1, 2, 3, 4)] == [2, 4, 8, 16]
+    assert backoff_delay(10, base=2, cap=120, rng=Fixed()) == 120
+    assert backoff_delay(2, multiplier=4, base=2, cap=120, rng=Fixed()) == 16
+    rng = random.Random(1)
+    assert all(0 <= backoff_delay(3, rng=rng) <= 8 for _ in range(100))
+
+
+def run_failures(reasons, max_attempts=3):
+    async def run():
+        scheduler = JobScheduler(["91101"], max_concurrency=2, rate_per_host=0, max_attempts=max_attempts,
+                                 backoff_base=0.001)
+        outcomes = []
+        for reason in reasons:
+            await scheduler.acquire("h")
+            outcomes.append(await scheduler.failed("91101", "h", CrawlError(reason)))
+        scheduler.cancel()
+        return scheduler, outcomes
+
+    return asyncio.run(run())
+
+
+def test_retryable_failure_goes_to_dead_letter_after_max_attempts():
+    scheduler, outcomes = run_failures(["timeout"] * 3)
+    assert [o.retry for o in outcomes] == [True, True, False]
+    assert scheduler.dead_letters[0]["reason"] == "timeout"
+    assert scheduler.dead_letters[0]["attempts"] == 3
+    assert scheduler.outstanding == 0
+
+
+def test_no_plans_is_retried_once_and_invalid_zip_never():
+    _, outcomes = run_failures(["no_plans", "no_plans"])
+    assert [o.retry for o in outcomes] == [True, False]
+    scheduler, outcomes = run_failures(["invalid_zip"])
+    assert not outcomes[0].retry
+    assert scheduler.retries == 0
+
+
+def test_scheduler_stops_workers_when_all_jobs_finish():
+    async def run():
+        scheduler = JobScheduler(["91101", "90001"], max_concurrency=2, rate_per_host=0)
+        scheduler.start(2)
+        seen = []
+        while True:
+            zip_code = await scheduler.next_zip()
+            if zip_code is None:
+                break
+            seen.append(zip_code)
+            await scheduler.acquire("h")
+            await scheduler.succeeded(zip_code, "h", 1.0)
+        return seen
+
+    assert asyncio.run(run()) == ["91101", "90001"]
+
+
+def test_aimd_starts_at_maximum_and_halves_on_congestion():
+    async def run():
+        concurrency = AdaptiveConcurrency(8)
+        assert concurrency.limit == 8
+        for _ in range(8):
+            await concurrency.acquire()
+        for _ in range(8):
+            await concurrency.release(False, congestion=True)
+        return concurrency
+
+    concurrency = asyncio.run(run())
+    assert concurrency.limit == 4
+    assert concurrency.decreases == 1
+
+
+def test_aimd_additive_increase_up_to_maximum():
+    async def run():
+        concurrency = AdaptiveConcurrency(4, initial=2)
+        for _ in range(20):
+            await concurrency.acquire()
+            await concurrency.release(True, latency=1.0)
+        return concurrency
+
+    concurrency = asyncio.run(run())
+    assert concurrency.limit == 4
+    assert concurrency.decreases == 0
+
+
+def test_host_rate_limiter_halves_and_recovers():
+    limiter = HostRateLimiter(rate=1.0, min_rate=0.1)
+    limiter.throttled("h")
+    limiter.throttled("h")
+    assert limiter.bucket("h").rate == 0.25
+    for _ in range(100):
+        limiter.succeeded("h")
+    assert limiter.bucket("h").rate == 1.0
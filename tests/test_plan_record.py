@@ -0,0 +1,71 @@
+import pytest
+
+from extraction_rules import new_plan_info
+from plan_record import (
+    MISSING,
+    NOT_COVERED,
+    UNPARSED,
+    PlanRecord,
+    benefit_keywords,
+    benefits_mask,
+    format_cents,
+    parse_money,
+)
+
+
+def plan(**fields):
+    info = new_plan_info("91101")
+    info.update(plan_id="H0543-001", plan_name="AARP Medicare Advantage Choice (PPO)", plan_type="PPO")
+    info.update(fields)
+    return info
+
+
+@pytest.mark.parametrize("text, cents", [
+    ("$0", 0), ("$35", 3500), ("$1,250", 125000), ("$35.50", 3550), ("5900", 590000),
+    ("", MISSING), ("  ", MISSING), ("Not covered", NOT_COVERED), ("N/A", NOT_COVERED),
+    ("20%", UNPARSED), ("$0-$50", UNPARSED),
+])
+def test_parse_money(text, cents):
+    assert parse_money(text) == cents
+
+
+def test_format_cents():
+    assert [format_cents(c) for c in (0, 3500, 340000, 3550)] == ["$0", "$35", "$3,400", "$35.50"]
+
+
+@pytest.mark.parametrize("fields", [
+    {},
+    {"monthly_premium": "$0", "pcp_copay": "$5", "out_of_pocket_max": "$3,400", "deductible": "$0.00"},
+    {"specialist_copay": "20%", "emergency_copay": "Not covered", "inpatient_hospital": "5900",
+     "tier1_generic_copay": "$0-$50"},
+    {"services_benefits": "dental | vision | hearing"},
+    {"services_benefits": "Includes $2,000 dental allowance and vision"},
+])
+def test_round_trip_is_lossless(fields):
+    original = plan(**fields)
+    record = PlanRecord.from_dict(original)
+    assert record.to_dict() == original
+    assert dict(record) == original
+
+
+def test_typed_access():
+    record = PlanRecord.from_dict(plan(monthly_premium="$35.50", emergency_copay="Not covered",
+                                       services_benefits="Dental and Vision"))
+    assert record.cents("monthly_premium") == 3550
+    assert record.cents("emergency_copay") is None
+    assert record.emergency_copay == NOT_COVERED
+    assert record.cents("pcp_copay") is None
+    assert record.has_benefit("dental") and record.has_benefit("vision")
+    assert not record.has_benefit("hearing")
+
+
+def test_benefits_mask_round_trip():
+    mask = benefits_mask("Dental, VISION")
+    assert benefit_keywords(mask) == ["dental", "vision"]
+
+
+def test_unknown_field_rejected():
+    with pytest.raises(TypeError):
+        PlanRecord(zip_code="91101", copay="$5")
+    with pytest.raises(KeyError):
+        PlanRecord.from_dict(plan())["copay"]
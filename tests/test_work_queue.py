@@ -0,0 +1,123 @@
+import asyncio
+import json
+import time
+
+from work_queue import DONE, FAILED, LEASED, PENDING, WorkQueue, iter_shard_plans, renew_leases
+
+
+def make_queue(tmp_path, zips=("91101", "90001", "10001")):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite3"))
+    queue.load(list(zips))
+    return queue
+
+
+def status(queue, zip_code):
+    return queue.conn.execute("SELECT status, worker_id, attempts FROM work_items WHERE zip_code = ?",
+                              (zip_code,)).fetchone()
+
+
+def test_load_ignores_existing_zips(tmp_path):
+    queue = make_queue(tmp_path)
+    assert queue.load(["91101", "33101"]) == 1
+    assert queue.counts() == {PENDING: 4}
+
+
+def test_claim_is_exclusive_while_leased(tmp_path):
+    queue = make_queue(tmp_path)
+    assert queue.claim_batch("a", 2, lease_seconds=60) == ["91101", "90001"]
+    assert queue.claim_batch("b", 5, lease_seconds=60) == ["10001"]
+    assert queue.claim_batch("c", 5, lease_seconds=60) == []
+    assert status(queue, "91101") == (LEASED, "a", 1)
+    assert queue.has_open_work()
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    queue = make_queue(tmp_path, ["91101"])
+    queue.claim_batch("a", 1, lease_seconds=-1)
+    assert queue.claim_batch("b", 1, lease_seconds=60) == ["91101"]
+    assert status(queue, "91101") == (LEASED, "b", 2)
+    # Worker cũ không còn giữ lease: không gia hạn / hoàn tất / trả lại được
+    queue.renew("a", ["91101"], 60)
+    assert queue.complete("a", ["91101"], "shard-a.jsonl") == []
+    assert not queue.fail("a", "91101", "timeout", max_attempts=1)
+    assert status(queue, "91101") == (LEASED, "b", 2)
+
+
+def test_stale_worker_cannot_overwrite_new_result(tmp_path):
+    queue = make_queue(tmp_path, ["91101"])
+    queue.claim_batch("a", 1, lease_seconds=-1)
+    queue.claim_batch("b", 1, lease_seconds=60)
+    assert queue.complete("b", ["91101"], "shard-b.jsonl") == ["91101"]
+    assert queue.complete("a", ["91101"], "shard-a.jsonl") == []
+    assert not queue.fail("a", "91101", "timeout", max_attempts=1)
+    row = queue.conn.execute("SELECT status, shard FROM work_items").fetchone()
+    assert row == (DONE, "shard-b.jsonl")
+
+
+def test_expired_but_unclaimed_lease_can_still_complete(tmp_path):
+    queue = make_queue(tmp_path, ["91101"])
+    queue.claim_batch("a", 1, lease_seconds=-1)
+    assert queue.complete("a", ["91101"], "shard-a.jsonl") == ["91101"]
+
+
+def test_renew_keeps_lease_from_expiring(tmp_path):
+    queue = make_queue(tmp_path, ["91101"])
+    queue.claim_batch("a", 1, lease_seconds=-1)
+    queue.renew("a", ["91101"], 60)
+    assert queue.claim_batch("b", 1, lease_seconds=60) == []
+
+
+def test_renew_leases_runs_on_a_timer(tmp_path):
+    queue = make_queue(tmp_path, ["91101"])
+    queue.claim_batch("a", 1, lease_seconds=0.3)
+
+    async def run():
+        task = asyncio.create_task(renew_leases(queue, "a", lambda: ["91101"], 0.3))
+        await asyncio.sleep(0.5)
+        task.cancel()
+
+    asyncio.run(run())
+    expires = queue.conn.execute("SELECT lease_expires FROM work_items").fetchone()[0]
+    assert expires > time.time()
+
+
+def test_fail_requeues_until_max_attempts(tmp_path):
+    queue = make_queue(tmp_path, ["91101"])
+    for attempt in (1, 2):
+        assert queue.claim_batch("a", 1, lease_seconds=60) == ["91101"]
+        queue.fail("a", "91101", "timeout", max_attempts=2)
+        assert status(queue, "91101")[0] == (PENDING if attempt == 1 else FAILED)
+    assert queue.claim_batch("a", 1, lease_seconds=60) == []
+    assert not queue.has_open_work()
+
+
+def test_complete_marks_done_with_shard(tmp_path):
+    queue = make_queue(tmp_path, ["91101", "90001"])
+    queue.claim_batch("a", 2, lease_seconds=60)
+    queue.complete("a", ["91101"], "shard-a-00001.jsonl")
+    assert status(queue, "91101")[0] == DONE
+    assert queue.counts() == {DONE: 1, LEASED: 1}
+
+
+def write_shard(path, plans):
+    with open(path, "w", encoding="utf-8") as f:
+        for plan in plans:
+            f.write(json.dumps(plan) + "\n")
+
+
+def test_merge_reads_each_zip_from_its_final_done_shard(tmp_path):
+    queue_path = str(tmp_path / "queue.sqlite3")
+    queue = make_queue(tmp_path, ["91101", "90001"])
+    # a nhận cả hai ZIP, lease hết hạn; b nhận lại 91101 và xong trước
+    queue.claim_batch("a", 2, lease_seconds=-1)
+    queue.claim_batch("b", 1, lease_seconds=60)
+    write_shard(tmp_path / "shard-b-00001.jsonl", [{"zip_code": "91101", "plan_id": "new"}])
+    queue.complete("b", ["91101"], "shard-b-00001.jsonl")
+    # a vẫn ghi shard có cả hai ZIP, nhưng chỉ 90001 còn thuộc lease của a
+    write_shard(tmp_path / "shard-a-00001.jsonl", [{"zip_code": "91101", "plan_id": "stale"},
+                                                  {"zip_code": "90001", "plan_id": "x"}])
+    assert queue.complete("a", ["91101", "90001"], "shard-a-00001.jsonl") == ["90001"]
+    queue.close()
+
+    plans = list(iter_shard_plans(str(tmp_path), queue_path))
+    assert sorted((p["zip_code"], p["plan_id"]) for p in plans) == [("90001", "x"), ("91101", "new")]
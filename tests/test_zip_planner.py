@@ -0,0 +1,92 @@
+import pytest
+
+from zip_planner import PlanSetCache, ZipPlanner, load_zip_codes, plan_set_fingerprint
+
+DAY = 86400
+NOW = 1_700_000_000.0
+
+# 3 ZIP ở county A, 2 ZIP ở county B, 1 ZIP nằm ở hai county
+CROSSWALK = {
+    "00001": {"A"}, "00002": {"A"}, "00003": {"A"},
+    "00011": {"B"}, "00012": {"B"},
+    "00021": {"A", "B"},
+}
+
+
+def plans(zip_code, *names):
+    return [{"zip_code": zip_code, "plan_id": name, "plan_name": f"AARP {name} (HMO)", "plan_type": "HMO"}
+            for name in names]
+
+
+@pytest.fixture
+def planner(tmp_path):
+    cache = PlanSetCache(str(tmp_path / "plans.sqlite3"), ttl_days=30)
+    yield ZipPlanner(cache, CROSSWALK, samples_per_county=2)
+    cache.close()
+
+
+def crawl_round(planner, zips, results, now=NOW):
+    """Một vòng plan + crawl giả (plan lấy từ `results`); trả về ZipPlan của vòng đó"""
+    zip_plan = planner.plan(zips, now)
+    for zip_code in zip_plan.crawl:
+        planner.record(zip_code, results[zip_code], now)
+    return zip_plan
+
+
+def test_fingerprint_ignores_card_order_and_zip():
+    assert plan_set_fingerprint(plans("00001", "X", "Y")) == plan_set_fingerprint(plans("00002", "Y", "X"))
+    assert plan_set_fingerprint(plans("00001", "X")) != plan_set_fingerprint(plans("00001", "X", "Y"))
+
+
+def test_county_inferred_when_samples_agree(planner):
+    zips = ["00001", "00002", "00003", "00021"]
+    results = {z: plans(z, "X", "Y") for z in zips}
+    first = crawl_round(planner, zips, results)
+    assert sorted(first.crawl) == ["00001", "00003", "00021"]
+    assert first.deferred == ["00002"]
+
+    second = crawl_round(planner, first.deferred, results)
+    assert second.crawl == []
+    entry = second.cached["00002"]
+    assert entry.source == "inferred"
+    assert [p["zip_code"] for p in planner.plans_for(entry)] == ["00002", "00002"]
+    assert planner.stats["inferred"] == 1
+
+
+def test_split_county_crawls_every_zip(planner):
+    zips = ["00011", "00012"]
+    results = {"00011": plans("00011", "X"), "00012": plans("00012", "Z")}
+    assert sorted(crawl_round(planner, zips, results).crawl) == zips
+    # ZIP mới của county B (mẫu không khớp nhau) phải crawl thật
+    planner.crosswalk["00013"] = {"B"}
+    assert planner.plan(["00013"], NOW).crawl == ["00013"]
+    assert planner.stats["split_counties"] == {"B"}
+
+
+def test_new_crawl_invalidates_inferred_zips_with_other_plans(planner):
+    zips = ["00001", "00002", "00003"]
+    results = {z: plans(z, "X") for z in zips}
+    crawl_round(planner, zips, results)
+    crawl_round(planner, ["00002"], results)
+    assert planner.cache.get("00002", NOW).source == "inferred"
+    planner.record("00001", plans("00001", "Z"), NOW)
+    assert planner.cache.get("00002", NOW) is None
+
+
+def test_ttl_expires_cached_entries(planner):
+    planner.record("00001", plans("00001", "X"), NOW)
+    assert planner.cache.get("00001", NOW + 29 * DAY) is not None
+    assert planner.cache.get("00001", NOW + 31 * DAY) is None
+    assert planner.cache.county_samples("A", NOW + 31 * DAY) == []
+
+
+def test_reset_clears_cache(planner):
+    planner.record("00001", plans("00001", "X"), NOW)
+    planner.cache.reset()
+    assert planner.cache.get("00001", NOW) is None
+    assert planner.cache.counts() == {}
+
+
+def test_load_zip_codes_skips_headers_comments_and_duplicates():
+    lines = ["zip,county\n", "91101,A\n", "\n", "# comment\n", "601\n", "91101\n"]
+    assert load_zip_codes(lines) == ["91101", "00601"]
@@ -0,0 +1,332 @@
+"""Chia ZIP cho nhiều process / nhiều máy qua một hàng đợi có lease trên SQLite.
+
+- load:   đưa danh sách ZIP vào hàng đợi
+- worker: mỗi process claim một batch ZIP (có hạn lease), crawl, ghi output riêng
+          của batch (shard) rồi mới đánh dấu done; process chết thì lease hết hạn
+          và batch được worker khác nhận lại
+- merge:  gộp mọi shard thành một bộ kết quả đã bỏ trùng, cùng schema với save_to_csv
+
+Chạy trên nhiều máy: file hàng đợi và thư mục shard phải nằm trên storage dùng chung
+có khoá file POSIX hoạt động đúng (SQLite không an toàn trên mọi loại network FS).
+"""
+import argparse
+import asyncio
+import glob
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import time
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_items (
+    zip_code TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker_id TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    shard TEXT,
+    error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_work_items_status ON work_items(status, lease_expires);
+"""
+
+
+class WorkQueue:
+    """Hàng đợi ZIP có lease, dùng chung giữa các process qua một file SQLite"""
+
+    def __init__(self, path, busy_timeout=30.0):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def load(self, zip_codes):
+        """Thêm ZIP vào hàng đợi (ZIP đã có giữ nguyên trạng thái); trả về số ZIP mới"""
+        before = self.conn.total_changes
+        self.conn.execute("BEGIN IMMEDIATE")
+        self.conn.executemany("INSERT OR IGNORE INTO work_items (zip_code, updated_at) VALUES (?, ?)",
+                              [(z, time.time()) for z in zip_codes])
+        self.conn.execute("COMMIT")
+        return self.conn.total_changes - before
+
+    def claim_batch(self, worker_id, batch_size, lease_seconds):
+        """Nhận tối đa `batch_size` ZIP đang pending hoặc có lease đã hết hạn"""
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self.conn.execute(
+                "SELECT zip_code FROM work_items WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                "ORDER BY rowid LIMIT ?", (PENDING, LEASED, now, batch_size)).fetchall()
+            zips = [row[0] for row in rows]
+            self.conn.executemany(
+                "UPDATE work_items SET status = ?, worker_id = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE zip_code = ?",
+                [(LEASED, worker_id, now + lease_seconds, now, z) for z in zips])
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return zips
+
+    def renew(self, worker_id, zip_codes, lease_seconds):
+        """Gia hạn lease cho các ZIP worker vẫn đang giữ"""
+        now = time.time()
+        self.conn.executemany(
+            "UPDATE work_items SET lease_expires = ?, updated_at = ? WHERE zip_code = ? AND worker_id = ? AND status = ?",
+            [(now + lease_seconds, now, z, worker_id, LEASED) for z in zip_codes])
+
+    def complete(self, worker_id, zip_codes, shard):
+        """Đánh dấu done các ZIP worker vẫn giữ lease; trả về list ZIP đã ghi nhận.
+
+        ZIP đã bị worker khác nhận lại (lease hết hạn) hoặc đã xong / failed thì giữ nguyên:
+        kết quả trong shard này của ZIP đó bị bỏ khi merge.
+        """
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            held = [z for z in zip_codes if self._holds(worker_id, z)]
+            self.conn.executemany(
+                "UPDATE work_items SET status = ?, shard = ?, error = NULL, updated_at = ? "
+                "WHERE zip_code = ? AND worker_id = ? AND status = ?",
+                [(DONE, shard, now, z, worker_id, LEASED) for z in held])
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return held
+
+    def fail(self, worker_id, zip_code, error, max_attempts):
+        """Trả ZIP về pending để thử lại, hoặc failed nếu đã thử đủ số lần (chỉ khi vẫn giữ lease)"""
+        cursor = self.conn.execute(
+            "UPDATE work_items SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+            "error = ?, lease_expires = NULL, updated_at = ? WHERE zip_code = ? AND worker_id = ? AND status = ?",
+            (max_attempts, FAILED, PENDING, str(error)[:500], time.time(), zip_code, worker_id, LEASED))
+        return cursor.rowcount > 0
+
+    def _holds(self, worker_id, zip_code):
+        row = self.conn.execute("SELECT 1 FROM work_items WHERE zip_code = ? AND worker_id = ? AND status = ?",
+                                (zip_code, worker_id, LEASED)).fetchone()
+        return row is not None
+
+    def counts(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM work_items GROUP BY status"))
+
+    def has_open_work(self):
+        """Còn ZIP pending hoặc đang bị lease (có thể sẽ hết hạn và cần nhận lại)"""
+        row = self.conn.execute("SELECT COUNT(*) FROM work_items WHERE status IN (?, ?)", (PENDING, LEASED)).fetchone()
+        return row[0] > 0
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+async def renew_leases(queue, worker_id, held, lease_seconds):
+    """Gia hạn lease của các ZIP `held()` mỗi 1/3 thời hạn lease, tới khi bị cancel"""
+    while True:
+        await asyncio.sleep(lease_seconds / 3)
+        queue.renew(worker_id, held(), lease_seconds)
+
+
+def run_worker(queue_path, out_dir, worker_id=None, concurrency=1, batch_size=10, lease_seconds=600,
+               max_attempts=3, idle_poll_seconds=10, crawl_options=None, log_level="info"):
+    """Vòng lặp của một worker: claim batch -> crawl -> ghi shard -> done, tới khi hết việc.
+
+    `crawl_options` là kwargs thêm cho crawl_all (route policy, storage state... như lệnh crawl).
+    Metrics của mọi batch được ghi ra `<out_dir>/metrics-<worker_id>.json/.prom` khi worker dừng.
+    """
+    from crawl_metrics import CrawlMetrics, configure_logging
+    from plan_sinks import JsonlSink
+    from test2 import crawl_all
+
+    configure_logging(log_level)
+    metrics = CrawlMetrics()
+    worker_id = worker_id or default_worker_id()
+    os.makedirs(out_dir, exist_ok=True)
+    queue = WorkQueue(queue_path)
+    batch_no = 0
+    while True:
+        batch = queue.claim_batch(worker_id, batch_size, lease_seconds)
+        if not batch:
+            if not queue.has_open_work():
+                break
+            # ZIP còn lại đang do worker khác giữ: chờ xem lease có hết hạn không
+            time.sleep(idle_poll_seconds)
+            continue
+
+        batch_no += 1
+        shard = os.path.join(out_dir, f"shard-{worker_id}-{batch_no:05d}.jsonl")
+        print(f"🧺 [{worker_id}] Batch {batch_no}: {len(batch)} ZIP -> {shard}")
+        sink = JsonlSink(shard)
+        succeeded = []
+        dead_letters = {}
+
+        def on_zip_done(zip_code, zip_plans):
+            sink.write_plans(zip_plans)
+            succeeded.append(zip_code)
+
+        def on_dead_letter(entry):
+            dead_letters[entry["zip_code"]] = f"{entry['reason']}: {entry['error']}"
+
+        async def crawl_batch():
+            # Gia hạn lease theo timer (cả lúc ZIP đang chờ retry / backoff), không chỉ khi có ZIP xong
+            heartbeat = asyncio.create_task(renew_leases(
+                queue, worker_id, lambda: [z for z in batch if z not in succeeded and z not in dead_letters],
+                lease_seconds))
+            try:
+                await crawl_all(batch, concurrency=concurrency, on_zip_done=on_zip_done, metrics=metrics,
+                                on_dead_letter=on_dead_letter, **(crawl_options or {}))
+            finally:
+                heartbeat.cancel()
+
+        try:
+            asyncio.run(crawl_batch())
+        except BaseException:
+            sink.abort()
+            raise
+        # Shard phải nằm trên đĩa (rename xong) trước khi báo done cho hàng đợi
+        sink.close()
+        completed = queue.complete(worker_id, succeeded, shard)
+        lost = [z for z in succeeded if z not in completed]
+        for zip_code in batch:
+            if zip_code not in succeeded:
+                if not queue.fail(worker_id, zip_code, dead_letters.get(zip_code, "no plans extracted"), max_attempts):
+                    lost.append(zip_code)
+        if lost:
+            print(f"⚠ [{worker_id}] Mất lease của {len(lost)} ZIP (worker khác đã nhận lại): {', '.join(lost[:10])}")
+    print(f"🏁 [{worker_id}] Hết việc: {queue.counts()}")
+    if metrics.records:
+        metrics.write(os.path.join(out_dir, f"metrics-{worker_id}"))
+    queue.close()
+
+
+def _worker_process(args):
+    queue_path, out_dir, index, kwargs = args
+    run_worker(queue_path, out_dir, worker_id=f"{default_worker_id()}-w{index}", **kwargs)
+
+
+def run_local_workers(queue_path, out_dir, processes, **kwargs):
+    """Chạy `processes` worker trên máy này, mỗi worker một process (và một Chromium) riêng"""
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(processes) as pool:
+        pool.map(_worker_process, [(queue_path, out_dir, i, kwargs) for i in range(processes)])
+
+
+def iter_shard_plans(out_dir, queue_path=None):
+    """Đọc plan từ các shard đã hoàn tất (file .jsonl, bỏ qua .part), theo thứ tự tên file.
+
+    Nếu có `queue_path` thì plan của mỗi ZIP chỉ lấy từ shard của lần done cuối cùng
+    (ZIP bị nhận lại sau khi hết lease có thể nằm trong nhiều shard).
+    """
+    paths = sorted(glob.glob(os.path.join(out_dir, "shard-*.jsonl")))
+    done_shard = None
+    if queue_path is not None:
+        queue = WorkQueue(queue_path)
+        done_shard = {zip_code: os.path.basename(shard) for zip_code, shard in
+                      queue.conn.execute("SELECT zip_code, shard FROM work_items WHERE status = ?", (DONE,))}
+        queue.close()
+        shards = set(done_shard.values())
+        paths = [p for p in paths if os.path.basename(p) in shards]
+    for path in paths:
+        name = os.path.basename(path)
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    plan = json.loads(line)
+                    if done_shard is None or done_shard.get(plan["zip_code"]) == name:
+                        yield plan
+
+
+def merge_shards(out_dir, output_base, formats=("csv",), queue_path=None):
+    """Gộp mọi shard thành một bộ kết quả đã bỏ trùng + file quan hệ ZIP -> plan"""
+    from plan_identity import MEMBERSHIP_HEADERS, PlanCollector
+    from plan_sinks import CsvSink, open_sinks
+
+    sink = open_sinks(output_base, formats)
+    membership_sink = CsvSink(f"{output_base}_zip_plans.csv", fieldnames=MEMBERSHIP_HEADERS)
+    collector = PlanCollector(sink, membership_sink)
+    current_zip, zip_plans = None, []
+    for plan in iter_shard_plans(out_dir, queue_path):
+        # Plan trong shard được ghi liền theo ZIP; gom lại từng ZIP rồi đưa vào collector
+        if plan["zip_code"] != current_zip and zip_plans:
+            collector.add_zip(current_zip, zip_plans)
+            zip_plans = []
+        current_zip = plan["zip_code"]
+        zip_plans.append(plan)
+    if zip_plans:
+        collector.add_zip(current_zip, zip_plans)
+    sink.close()
+    membership_sink.close()
+    print(f"✅ Gộp {collector.total} plans (từ {len(collector.zip_stats)} ZIP) vào {', '.join(sink.paths)}")
+    return collector
+
+
+def main(argv=None):
+    from test2 import add_crawl_arguments, crawl_options
+
+    parser = argparse.ArgumentParser(description="Hàng đợi ZIP có lease cho crawl nhiều process / nhiều máy")
+    parser.add_argument("--queue", default="crawl_queue.sqlite3", help="File SQLite của hàng đợi")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_load = sub.add_parser("load", help="Đưa ZIP vào hàng đợi")
+    p_load.add_argument("--zips-file", help="File ZIP (mỗi dòng một ZIP, '-' = stdin); mặc định zip_codes trong test2")
+
+    p_worker = sub.add_parser("worker", help="Chạy worker trên máy này")
+    p_worker.add_argument("--out", default="shards", help="Thư mục ghi shard")
+    p_worker.add_argument("-p", "--processes", type=int, default=1, help="Số process worker")
+    p_worker.add_argument("-c", "--concurrency", type=int, default=1, help="Số browser context mỗi process")
+    p_worker.add_argument("--batch-size", type=int, default=10)
+    p_worker.add_argument("--lease-seconds", type=int, default=600)
+    p_worker.add_argument("--max-attempts", type=int, default=3)
+    p_worker.add_argument("--log-level", default="info", choices=["debug", "info", "warning", "error", "off"])
+    add_crawl_arguments(p_worker)
+
+    p_merge = sub.add_parser("merge", help="Gộp các shard thành một kết quả")
+    p_merge.add_argument("--out", default="shards", help="Thư mục shard")
+    p_merge.add_argument("--output", default="uhc_medicare_plans_merged", help="Tên file kết quả (không đuôi)")
+    p_merge.add_argument("--formats", default="csv,jsonl")
+
+    sub.add_parser("status", help="Xem số ZIP theo trạng thái")
+
+    args = parser.parse_args(argv)
+    if args.command == "load":
+        from zip_planner import read_zip_codes
+        if args.zips_file:
+            zips = read_zip_codes(args.zips_file)
+        else:
+            from test2 import zip_codes
+            zips = zip_codes
+        queue = WorkQueue(args.queue)
+        added = queue.load(zips)
+        print(f"📥 Thêm {added} ZIP mới vào {args.queue}: {queue.counts()}")
+        queue.close()
+    elif args.command == "worker":
+        kwargs = dict(concurrency=args.concurrency, batch_size=args.batch_size,
+                      lease_seconds=args.lease_seconds, max_attempts=args.max_attempts, log_level=args.log_level,
+                      crawl_options=crawl_options(args))
+        if args.processes > 1:
+            run_local_workers(args.queue, args.out, args.processes, **kwargs)
+        else:
+            run_worker(args.queue, args.out, **kwargs)
+    elif args.command == "merge":
+        merge_shards(args.out, args.output, [f.strip() for f in args.formats.split(",") if f.strip()],
+                     queue_path=args.queue if os.path.exists(args.queue) else None)
+    elif args.command == "status":
+        queue = WorkQueue(args.queue)
+        print(queue.counts())
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
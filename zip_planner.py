@@ -0,0 +1,272 @@
+"""Lập kế hoạch crawl theo service area: mỗi bộ plan khác nhau chỉ crawl vài lần.
+
+Plan được bán theo county / service area, nên các ZIP cùng county gần như luôn ra cùng
+một bộ plan. Với crosswalk ZIP -> county, planner crawl vài ZIP mẫu của mỗi county;
+khi fingerprint (hash các plan_key) của các ZIP mẫu trùng nhau thì county được coi là
+ổn định và các ZIP còn lại lấy bộ plan từ cache thay vì mở browser. County mà các ZIP
+mẫu ra bộ plan khác nhau (county bị chia service area) thì crawl đủ mọi ZIP.
+
+Cache (SQLite) lưu cho mỗi ZIP: fingerprint, nguồn (crawled / inferred), ZIP đã crawl
+mà kết quả được dùng lại, thời điểm quan sát và hạn dùng (TTL). Bộ plan lưu một lần
+theo fingerprint. Hết TTL thì county được lấy mẫu lại.
+"""
+import csv
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+
+from crawl_metrics import log
+from plan_identity import plan_fingerprint
+
+DEFAULT_SAMPLES_PER_COUNTY = 2
+DEFAULT_TTL_DAYS = 30
+
+CROSSWALK_ZIP_COLUMNS = ("zip", "zip_code", "zipcode", "zcta", "zcta5")
+CROSSWALK_COUNTY_COLUMNS = ("county", "county_fips", "fips", "countyfp", "geoid")
+CROSSWALK_RATIO_COLUMNS = ("tot_ratio", "res_ratio", "ratio", "afact")
+# ZIP có phần nhỏ hơn tỉ lệ này nằm ở county khác vẫn được coi là thuộc một county
+MIN_COUNTY_RATIO = 0.01
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS zip_plan_sets (
+    zip_code TEXT PRIMARY KEY,
+    county TEXT,
+    fingerprint TEXT NOT NULL,
+    plan_count INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    source_zip TEXT NOT NULL,
+    observed_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS plan_sets (
+    fingerprint TEXT PRIMARY KEY,
+    plans TEXT NOT NULL,
+    observed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_zip_plan_sets_county ON zip_plan_sets(county);
+"""
+
+CachedPlanSet = namedtuple("CachedPlanSet", "zip_code county fingerprint plan_count source source_zip observed_at expires_at")
+ZipPlan = namedtuple("ZipPlan", "crawl cached deferred")
+
+
+def load_zip_codes(lines):
+    """Đọc ZIP từ các dòng (file hoặc stdin): lấy cột đầu, bỏ dòng trống/comment/header, bỏ trùng"""
+    result = []
+    seen = set()
+    for line in lines:
+        value = line.split(",")[0].split("#")[0].strip()
+        if not value.isdigit():
+            continue
+        value = value.zfill(5)
+        if value not in seen:
+            seen.add(value)
+            result.append(value)
+    return result
+
+
+def read_zip_codes(path):
+    """load_zip_codes từ file `path`, '-' là stdin"""
+    if path == "-":
+        return load_zip_codes(sys.stdin)
+    with open(path, encoding="utf-8") as f:
+        return load_zip_codes(f)
+
+
+def _pick_column(fieldnames, candidates):
+    lowered = {name.strip().lower(): name for name in fieldnames}
+    for candidate in candidates:
+        if candidate in lowered:
+            return lowered[candidate]
+    return None
+
+
+def load_crosswalk(path, min_ratio=MIN_COUNTY_RATIO):
+    """Đọc crosswalk CSV (kiểu HUD ZIP-COUNTY): dict zip -> set county.
+
+    Cột ZIP / county / tỉ lệ được nhận theo tên (zip, county, tot_ratio...). Dòng có
+    tỉ lệ dưới `min_ratio` bị bỏ qua.
+    """
+    crosswalk = {}
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        zip_col = _pick_column(reader.fieldnames or [], CROSSWALK_ZIP_COLUMNS)
+        county_col = _pick_column(reader.fieldnames or [], CROSSWALK_COUNTY_COLUMNS)
+        ratio_col = _pick_column(reader.fieldnames or [], CROSSWALK_RATIO_COLUMNS)
+        if zip_col is None or county_col is None:
+            raise ValueError(f"Crosswalk {path} thiếu cột ZIP hoặc county (có: {reader.fieldnames})")
+        for row in reader:
+            zip_code = (row[zip_col] or "").strip()
+            county = (row[county_col] or "").strip()
+            if not zip_code.isdigit() or not county:
+                continue
+            if ratio_col is not None:
+                try:
+                    if float(row[ratio_col] or 0) < min_ratio:
+                        continue
+                except ValueError:
+                    pass
+            crosswalk.setdefault(zip_code.zfill(5), set()).add(county)
+    return crosswalk
+
+
+def plan_set_fingerprint(plans):
+    """Hash của tập plan_key (không phụ thuộc thứ tự card hay ZIP)"""
+    keys = sorted({plan_fingerprint(plan) for plan in plans})
+    return hashlib.sha1("\n".join(keys).encode("utf-8")).hexdigest()[:20]
+
+
+def _spread(items, n):
+    """n phần tử rải đều trong list (ZIP mẫu không dồn về một góc county)"""
+    if n >= len(items):
+        return list(items)
+    if n == 1:
+        return [items[0]]
+    step = (len(items) - 1) / (n - 1)
+    return [items[round(i * step)] for i in range(n)]
+
+
+class PlanSetCache:
+    """Cache bộ plan theo ZIP trên một file SQLite, có provenance và TTL"""
+
+    def __init__(self, path="zip_plan_cache.sqlite3", ttl_days=DEFAULT_TTL_DAYS):
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def reset(self):
+        """Xoá mọi bộ plan đã lưu (crawl lại thật từ đầu)"""
+        self.conn.executescript("BEGIN; DELETE FROM zip_plan_sets; DELETE FROM plan_sets; COMMIT;")
+
+    def get(self, zip_code, now=None):
+        """Bản ghi còn hạn của ZIP, None nếu không có hoặc đã hết TTL"""
+        row = self.conn.execute(
+            "SELECT * FROM zip_plan_sets WHERE zip_code = ? AND expires_at > ?",
+            (zip_code, now or time.time())).fetchone()
+        return CachedPlanSet(*row) if row else None
+
+    def county_samples(self, county, now=None):
+        """Các ZIP đã crawl thật (còn hạn) của county"""
+        rows = self.conn.execute(
+            "SELECT * FROM zip_plan_sets WHERE county = ? AND source = 'crawled' AND expires_at > ? "
+            "ORDER BY observed_at DESC", (county, now or time.time()))
+        return [CachedPlanSet(*row) for row in rows]
+
+    def put_crawled(self, zip_code, county, plans, now=None):
+        now = now or time.time()
+        fingerprint = plan_set_fingerprint(plans)
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("INSERT OR IGNORE INTO plan_sets (fingerprint, plans, observed_at) VALUES (?, ?, ?)",
+                              (fingerprint, json.dumps(plans, ensure_ascii=False), now))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO zip_plan_sets VALUES (?, ?, ?, ?, 'crawled', ?, ?, ?)",
+                (zip_code, county, fingerprint, len(plans), zip_code, now, now + self.ttl_seconds))
+            if county is not None:
+                # County vừa lộ ra bộ plan khác: ZIP đã suy ra cho county này không còn tin được
+                self.conn.execute(
+                    "DELETE FROM zip_plan_sets WHERE county = ? AND source = 'inferred' AND fingerprint != ?",
+                    (county, fingerprint))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return fingerprint
+
+    def put_inferred(self, zip_code, county, sample, now=None):
+        """Ghi ZIP lấy bộ plan của ZIP mẫu `sample`; hết hạn cùng lúc với bản ghi mẫu"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO zip_plan_sets VALUES (?, ?, ?, ?, 'inferred', ?, ?, ?)",
+            (zip_code, county, sample.fingerprint, sample.plan_count, sample.source_zip,
+             now or time.time(), sample.expires_at))
+
+    def plans(self, fingerprint):
+        row = self.conn.execute("SELECT plans FROM plan_sets WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def counts(self):
+        return dict(self.conn.execute("SELECT source, COUNT(*) FROM zip_plan_sets GROUP BY source"))
+
+
+class ZipPlanner:
+    """Chia ZIP thành: cần crawl, lấy từ cache, và để sau (chờ ZIP mẫu của county).
+
+    Gọi `plan(zip_codes)`, crawl `plan.crawl` và `record()` kết quả, rồi gọi lại
+    `plan(plan.deferred)` tới khi không còn ZIP nào bị để sau.
+    """
+
+    def __init__(self, cache, crosswalk=None, samples_per_county=DEFAULT_SAMPLES_PER_COUNTY):
+        self.cache = cache
+        self.crosswalk = crosswalk or {}
+        self.samples_per_county = max(1, samples_per_county)
+        self.stats = {"crawled": 0, "cached": 0, "inferred": 0, "split_counties": set()}
+
+    def county(self, zip_code):
+        """County duy nhất của ZIP; None nếu không có trong crosswalk hoặc ZIP nằm ở nhiều county"""
+        counties = self.crosswalk.get(zip_code)
+        if counties and len(counties) == 1:
+            return next(iter(counties))
+        return None
+
+    def plan(self, zip_codes, now=None):
+        now = now or time.time()
+        crawl, cached, deferred = [], {}, []
+        by_county = {}
+        for zip_code in zip_codes:
+            entry = self.cache.get(zip_code, now)
+            if entry is not None and self.cache.plans(entry.fingerprint) is not None:
+                cached[zip_code] = entry
+                continue
+            county = self.county(zip_code)
+            if county is None:
+                crawl.append(zip_code)
+            else:
+                by_county.setdefault(county, []).append(zip_code)
+
+        for county, zips in by_county.items():
+            samples = self.cache.county_samples(county, now)
+            fingerprints = {sample.fingerprint for sample in samples}
+            if len(fingerprints) > 1:
+                # County chia nhiều service area: không suy ra được, crawl từng ZIP
+                self.stats["split_counties"].add(county)
+                crawl.extend(zips)
+            elif len(samples) >= self.samples_per_county:
+                for zip_code in zips:
+                    self.cache.put_inferred(zip_code, county, samples[0], now)
+                    cached[zip_code] = self.cache.get(zip_code, now)
+                    self.stats["inferred"] += 1
+            else:
+                picked = _spread(zips, self.samples_per_county - len(samples))
+                crawl.extend(picked)
+                picked = set(picked)
+                deferred.extend(z for z in zips if z not in picked)
+
+        self.stats["cached"] += len(cached)
+        return ZipPlan(crawl, cached, deferred)
+
+    def record(self, zip_code, plans, now=None):
+        """Ghi kết quả crawl thật của một ZIP vào cache"""
+        self.stats["crawled"] += 1
+        return self.cache.put_crawled(zip_code, self.county(zip_code), plans, now)
+
+    def plans_for(self, entry):
+        """Plan của bản ghi cache, zip_code đổi thành ZIP của bản ghi"""
+        return [dict(plan, zip_code=entry.zip_code) for plan in self.cache.plans(entry.fingerprint) or []]
+
+    def format_summary(self):
+        stats = self.stats
+        inferred = stats["inferred"]
+        line = (f"crawl {stats['crawled']} ZIP, {stats['cached']} ZIP lấy từ cache "
+                f"({inferred} suy ra từ ZIP mẫu cùng county)")
+        if stats["split_counties"]:
+            line += f", {len(stats['split_counties'])} county bị chia service area"
+        log.debug("   Cache: %s", self.cache.counts())
+        return line